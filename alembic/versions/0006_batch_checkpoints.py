@@ -0,0 +1,22 @@
+"""Add checkpoints for resumable batch jobs."""
+
+from alembic import op
+
+from app.db.database import Base
+from app.models import models  # noqa: F401
+
+
+revision = "0006_batch_checkpoints"
+down_revision = "0005_refresh_reporting_views"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    Base.metadata.create_all(bind=bind, tables=[models.BatchCheckpoint.__table__])
+
+
+def downgrade():
+    bind = op.get_bind()
+    models.BatchCheckpoint.__table__.drop(bind, checkfirst=True)
@@ -0,0 +1,23 @@
+"""Add materialized reporting snapshots and their refresh log."""
+
+from alembic import op
+
+from app.db.reporting import REPORTING_OBJECTS, REPORTING_SNAPSHOT_OBJECTS, reporting_snapshots_down_sql
+
+
+revision = "0007_reporting_snapshots"
+down_revision = "0006_batch_checkpoints"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for statement in REPORTING_OBJECTS:
+        op.execute(statement)
+    for statement in REPORTING_SNAPSHOT_OBJECTS:
+        op.execute(statement)
+
+
+def downgrade():
+    for statement in reporting_snapshots_down_sql():
+        op.execute(statement)
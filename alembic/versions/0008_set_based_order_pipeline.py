@@ -0,0 +1,21 @@
+"""Resolve the order pipeline next step set-based instead of per row."""
+
+from alembic import op
+
+from app.db.reporting import order_pipeline_set_based_down_sql, order_pipeline_set_based_sql
+
+
+revision = "0008_set_based_order_pipeline"
+down_revision = "0007_reporting_snapshots"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for statement in order_pipeline_set_based_sql():
+        op.execute(statement)
+
+
+def downgrade():
+    for statement in order_pipeline_set_based_down_sql():
+        op.execute(statement)
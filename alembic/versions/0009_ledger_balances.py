@@ -0,0 +1,24 @@
+"""Add the ledger_balances projection and backfill it from accounting entries."""
+
+from alembic import op
+
+from app.db.database import Base
+from app.models import models  # noqa: F401
+from app.services.ledger import REBUILD_LEDGER_BALANCES_SQL
+
+
+revision = "0009_ledger_balances"
+down_revision = "0008_set_based_order_pipeline"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    Base.metadata.create_all(bind=bind, tables=[models.LedgerBalance.__table__])
+    op.execute(REBUILD_LEDGER_BALANCES_SQL)
+
+
+def downgrade():
+    bind = op.get_bind()
+    models.LedgerBalance.__table__.drop(bind, checkfirst=True)
@@ -0,0 +1,25 @@
+"""Add monthly balance, position and transaction flow snapshots."""
+
+from alembic import op
+
+from app.db.database import Base
+from app.models import models  # noqa: F401
+
+
+revision = "0010_history_snapshots"
+down_revision = "0009_ledger_balances"
+branch_labels = None
+depends_on = None
+
+TABLES = (models.AccountBalanceSnapshot, models.SubscriptionValueSnapshot, models.MonthlyTransactionFlow)
+
+
+def upgrade():
+    bind = op.get_bind()
+    Base.metadata.create_all(bind=bind, tables=[item.__table__ for item in TABLES])
+
+
+def downgrade():
+    bind = op.get_bind()
+    for item in reversed(TABLES):
+        item.__table__.drop(bind, checkfirst=True)
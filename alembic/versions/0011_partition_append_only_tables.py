@@ -0,0 +1,40 @@
+"""Partition transactions, accounting_entries and audit_logs by month on created_at."""
+
+from alembic import op
+
+from app.core.config import settings
+from app.db.partitions import PARTITIONED_TABLES, partition_table, restore_references, unpartition_table
+from app.db.reporting import TRANSACTION_QUEUE_SQL
+
+
+revision = "0011_partition_append_only_tables"
+down_revision = "0010_history_snapshots"
+branch_labels = None
+depends_on = None
+
+
+def _drop_transaction_queue():
+    # L'instantane de la file n'est plus cree; il peut subsister d'une base anterieure.
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS mv_reporting_transaction_queue")
+    op.execute("DROP VIEW IF EXISTS vw_reporting_transaction_queue")
+
+
+def _create_transaction_queue():
+    op.execute(f"CREATE OR REPLACE VIEW vw_reporting_transaction_queue AS {TRANSACTION_QUEUE_SQL}")
+
+
+def upgrade():
+    bind = op.get_bind()
+    _drop_transaction_queue()
+    for table in PARTITIONED_TABLES:
+        partition_table(bind, table, settings.PARTITION_PRECREATE_MONTHS)
+    _create_transaction_queue()
+
+
+def downgrade():
+    bind = op.get_bind()
+    _drop_transaction_queue()
+    for table in PARTITIONED_TABLES:
+        unpartition_table(bind, table)
+    restore_references(bind)
+    _create_transaction_queue()
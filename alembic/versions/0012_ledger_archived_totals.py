@@ -0,0 +1,22 @@
+"""Record the ledger totals of detached accounting_entries partitions."""
+
+from alembic import op
+
+from app.db.database import Base
+from app.models import models  # noqa: F401
+
+
+revision = "0012_ledger_archived_totals"
+down_revision = "0011_partition_append_only_tables"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    Base.metadata.create_all(bind=bind, tables=[models.LedgerArchivedTotal.__table__])
+
+
+def downgrade():
+    bind = op.get_bind()
+    models.LedgerArchivedTotal.__table__.drop(bind, checkfirst=True)
@@ -0,0 +1,17 @@
+"""Index transactions on executed_at: monthly flows are bucketed by execution month."""
+
+from alembic import op
+
+
+revision = "0013_transactions_executed_index"
+down_revision = "0012_ledger_archived_totals"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_transactions_executed", "transactions", ["executed_at"])
+
+
+def downgrade():
+    op.drop_index("ix_transactions_executed", table_name="transactions")
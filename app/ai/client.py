@@ -1,4 +1,7 @@
+import json
+from collections.abc import AsyncIterator
 from dataclasses import dataclass
+from importlib.util import find_spec
 from typing import Any
 
 import httpx
@@ -21,11 +24,42 @@ class AICompletion:
     usage: dict[str, Any]
 
 
+_http_client: httpx.AsyncClient | None = None
+
+
+def http_client(settings: Settings) -> httpx.AsyncClient:
+    """Pool HTTP partage par le processus : connexions keep-alive (et HTTP/2 si ``h2`` est installe).
+
+    Le pool est recree si l'URL du fournisseur change ou apres ``close_http_client``.
+    """
+    global _http_client
+    base_url = settings.OPENROUTER_BASE_URL.rstrip("/")
+    if _http_client is None or _http_client.is_closed or str(_http_client.base_url).rstrip("/") != base_url:
+        _http_client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=settings.OPENROUTER_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=settings.OPENROUTER_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENROUTER_MAX_CONNECTIONS,
+                keepalive_expiry=settings.OPENROUTER_KEEPALIVE_SECONDS,
+            ),
+            http2=settings.OPENROUTER_HTTP2 and find_spec("h2") is not None,
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        client, _http_client = _http_client, None
+        await client.aclose()
+
+
 class OpenRouterClient:
     def __init__(self, settings: Settings):
         self.settings = settings
 
-    def complete(self, messages: list[dict[str, str]]) -> AICompletion:
+    def _request(self, messages: list[dict[str, str]], stream: bool = False) -> tuple[dict[str, str], dict[str, Any]]:
         if not self.settings.AI_ENABLED or not self.settings.OPENROUTER_API_KEY:
             raise AIUnavailableError("Le service IA n'est pas configuré.")
 
@@ -41,13 +75,14 @@ class OpenRouterClient:
             "temperature": 0.2,
             "max_tokens": self.settings.OPENROUTER_MAX_TOKENS,
         }
+        if stream:
+            payload["stream"] = True
+        return headers, payload
 
+    async def complete(self, messages: list[dict[str, str]]) -> AICompletion:
+        headers, payload = self._request(messages)
         try:
-            with httpx.Client(
-                base_url=self.settings.OPENROUTER_BASE_URL.rstrip("/"),
-                timeout=self.settings.OPENROUTER_TIMEOUT_SECONDS,
-            ) as client:
-                response = client.post("/chat/completions", headers=headers, json=payload)
+            response = await http_client(self.settings).post("/chat/completions", headers=headers, json=payload)
         except httpx.RequestError as exc:
             raise AIProviderError("Le fournisseur IA est temporairement indisponible.") from exc
 
@@ -68,3 +103,34 @@ class OpenRouterClient:
             model=str(body.get("model", self.settings.OPENROUTER_MODEL)),
             usage=body.get("usage") if isinstance(body.get("usage"), dict) else {},
         )
+
+    async def stream(self, messages: list[dict[str, str]]) -> AsyncIterator[str]:
+        """Fragments de texte relayes au fil des evenements SSE du fournisseur (``stream: true``)."""
+        headers, payload = self._request(messages, stream=True)
+        received = False
+        try:
+            async with http_client(self.settings).stream("POST", "/chat/completions", headers=headers, json=payload) as response:
+                if response.status_code >= 400:
+                    raise AIProviderError(f"Le fournisseur IA a retourné HTTP {response.status_code}.")
+                async for line in response.aiter_lines():
+                    # Les lignes ``: ...`` sont des commentaires de maintien de connexion.
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                        if "error" in chunk:
+                            raise AIProviderError("Le fournisseur IA a interrompu la réponse.")
+                        content = (chunk["choices"][0].get("delta") or {}).get("content")
+                    except (ValueError, KeyError, IndexError, TypeError, AttributeError) as exc:
+                        raise AIProviderError("La réponse du fournisseur IA est inexploitable.") from exc
+                    if isinstance(content, str) and content:
+                        received = True
+                        yield content
+        except httpx.RequestError as exc:
+            raise AIProviderError("Le fournisseur IA est temporairement indisponible.") from exc
+
+        if not received:
+            raise AIProviderError("Le fournisseur IA a retourné une réponse vide.")
@@ -0,0 +1,77 @@
+"""Reduction du contexte et de l'historique a un budget de jetons.
+
+Les jetons sont estimes localement (environ trois caracteres par jeton pour du
+JSON en francais) : l'estimation borne la taille du prompt sans appeler de
+tokenizer. Les sections les plus pertinentes pour la question passent en
+premier; les elements retires sont comptes dans ``elements_omis``.
+"""
+
+import json
+
+from app.ai.intents import mentioned_numbers, section_scores
+
+CHARS_PER_TOKEN = 3
+SUMMARY_SECTIONS = ("portfolio_totals_by_currency", "available_liquidity_by_currency")
+# Ordre par defaut a pertinence egale.
+LIST_SECTIONS = ("positions", "accounts", "orders", "transactions", "obligations")
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def compact_context(data: dict, message: str, budget_tokens: int, preview_items: int) -> dict:
+    """Contexte borne a ``budget_tokens``, sections classees par pertinence pour ``message``.
+
+    Les totaux par devise sont toujours gardes. Une section sans rapport avec
+    la question est limitee a ``preview_items`` elements; si aucune section
+    n'est reconnue (question ouverte), toutes sont traitees comme pertinentes.
+    Un identifiant cite dans la question fait passer l'element en tete.
+    """
+    scores = section_scores(message)
+    numbers = mentioned_numbers(message)
+    any_relevant = any(scores.values())
+    compact = {key: data[key] for key in SUMMARY_SECTIONS if key in data}
+    # Place reservee au resume des elements omis, ecrit en dernier.
+    used = estimate_tokens(dumps(compact)) + estimate_tokens(dumps({"elements_omis": {name: 99 for name in LIST_SECTIONS}}))
+    omitted = {}
+    for section in sorted(LIST_SECTIONS, key=lambda name: -scores[name]):
+        items = data.get(section) or []
+        if numbers:
+            items = sorted(items, key=lambda item: item.get("id") not in numbers)
+        limit = len(items) if scores[section] or not any_relevant else min(preview_items, len(items))
+        kept, cost = [], estimate_tokens(dumps(section)) + 2
+        for item in items[:limit]:
+            item_cost = estimate_tokens(dumps(item)) + 1
+            if used + cost + item_cost > budget_tokens:
+                break
+            kept.append(item)
+            cost += item_cost
+        if kept:
+            compact[section] = kept
+            used += cost
+        if len(kept) < len(items):
+            omitted[section] = len(items) - len(kept)
+    if omitted:
+        compact["elements_omis"] = omitted
+    return compact
+
+
+def compact_history(history: list[dict[str, str]], budget_tokens: int, max_chars: int = 2000) -> list[dict[str, str]]:
+    """Derniers tours d'historique tenant dans ``budget_tokens``, le plus ancien tronque si besoin."""
+    kept = []
+    remaining = budget_tokens
+    for item in reversed(history):
+        content = item["content"][:max_chars]
+        cost = estimate_tokens(content)
+        if cost > remaining:
+            if remaining * CHARS_PER_TOKEN >= 200:
+                kept.append({"role": item["role"], "content": content[: remaining * CHARS_PER_TOKEN]})
+            break
+        kept.append({"role": item["role"], "content": content})
+        remaining -= cost
+    return kept[::-1]
@@ -1,13 +1,38 @@
+"""Contexte financier autorise transmis a l'assistant, et son cache par client.
+
+Le contexte d'un client est garde avec son JSON deja serialise. Chaque entree
+retient les cles dont il depend (client, comptes, ordres, souscriptions) et
+le numero de modification au moment de sa construction : un commit qui touche
+l'une de ces cles la rend perimee. Les ecritures en masse sur ces tables
+perimant tout le cache. L'invalidation est locale au processus : une ecriture
+faite par un autre processus n'est vue qu'a l'expiration du TTL.
+"""
+
+import hashlib
 import json
 from collections import defaultdict
+from collections.abc import Hashable, Iterable
+from dataclasses import dataclass
 from datetime import date, datetime
 from decimal import Decimal
+from threading import Lock
 
-from sqlalchemy import or_, select
-from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import event, select
+from sqlalchemy.orm import ORMExecuteState, Session, joinedload, selectinload
 
-from app.models.models import Account, AccountRole, Instrument, InterestPayment, InvestmentOrder, Subscription, Transaction
+from app.core.config import settings
+from app.models.models import Account, AccountRole, Instrument, InterestPayment, InvestmentOrder, OrderWorkflowStep, Subscription, Transaction
+from app.services.interest_service import CouponTotals, coupon_totals
 from app.services.investment_metrics import annualized_return
+from app.services.transaction_queries import visible_transactions
+from app.utils.cache import TTLCache
+
+CONTEXT_CHANGES_KEY = "assistant_context_changes"
+ALL_CONTEXTS = "*"
+CONTEXT_TABLES = frozenset(
+    model.__tablename__
+    for model in (Account, AccountRole, Instrument, InterestPayment, InvestmentOrder, OrderWorkflowStep, Subscription, Transaction)
+)
 
 
 ORDER_STATUS_EXPLANATIONS = {
@@ -29,8 +54,63 @@ def _value(value):
     return value
 
 
+@dataclass(frozen=True, slots=True)
+class ClientContext:
+    data: dict
+    text: str
+    digest: str
+
+
+class ContextVersions:
+    """Numero de la derniere modification commitee de chaque cle de contexte."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._sequence = 0
+        self._changed: dict[Hashable, int] = {}
+
+    def current(self) -> int:
+        with self._lock:
+            return self._sequence
+
+    def changed_since(self, sequence: int, keys: Iterable[Hashable]) -> bool:
+        with self._lock:
+            return any(self._changed.get(key, 0) > sequence for key in (ALL_CONTEXTS, *keys))
+
+    def bump(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            self._sequence += 1
+            for key in keys:
+                self._changed[key] = self._sequence
+
+
+context_versions = ContextVersions()
+context_cache = TTLCache(settings.ASSISTANT_CONTEXT_CACHE_SIZE, settings.ASSISTANT_CONTEXT_CACHE_TTL_SECONDS)
+
+
+def client_context(db: Session, client_id: int) -> ClientContext:
+    """Contexte du client depuis le cache s'il est a jour, sinon reconstruit et mis en cache."""
+    today = date.today()
+    cached = context_cache.get(client_id)
+    if cached is not None:
+        sequence, built_on, keys, context = cached
+        if built_on == today and not context_versions.changed_since(sequence, keys):
+            return context
+    # Numero lu avant les requetes : un commit concurrent perime l'entree.
+    sequence = context_versions.current()
+    data, keys = _collect_client_context(db, client_id, today)
+    text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    context = ClientContext(data=data, text=text, digest=hashlib.sha256(text.encode()).hexdigest())
+    context_cache.set(client_id, (sequence, today, keys, context))
+    return context
+
+
 def build_client_context(db: Session, client_id: int) -> dict:
     """Build a minimal, authorized snapshot for the authenticated client."""
+    return _collect_client_context(db, client_id, date.today())[0]
+
+
+def _collect_client_context(db: Session, client_id: int, today: date) -> tuple[dict, frozenset]:
     accounts = list(
         db.scalars(
             select(Account)
@@ -64,24 +144,10 @@ def build_client_context(db: Session, client_id: int) -> dict:
             )
         )
         transactions = list(
-            db.scalars(
-                select(Transaction)
-                .where(or_(Transaction.source_account_id.in_(account_ids), Transaction.destination_account_id.in_(account_ids)))
-                .order_by(Transaction.created_at.desc())
-                .limit(20)
-            )
+            db.scalars(visible_transactions(account_ids, limit=20))
         )
 
-    paid_coupons_by_subscription: dict[int, Decimal] = defaultdict(lambda: Decimal("0"))
-    if subscriptions:
-        payments = db.scalars(
-            select(InterestPayment).where(
-                InterestPayment.subscription_id.in_([item.id for item in subscriptions]),
-                InterestPayment.status == "PAYE",
-            )
-        ).all()
-        for payment in payments:
-            paid_coupons_by_subscription[payment.subscription_id] += Decimal(payment.amount)
+    coupons = coupon_totals(db, [item.id for item in subscriptions])
 
     context = {
         "accounts": [
@@ -124,12 +190,11 @@ def build_client_context(db: Session, client_id: int) -> dict:
             for transaction in transactions
         ],
     }
-    today = date.today()
     for subscription in subscriptions:
         instrument = subscription.instrument
         currency = instrument.currency if instrument else "USD"
         instrument_type = instrument.instrument_type.name if instrument and instrument.instrument_type else "Instrument"
-        paid_coupons = paid_coupons_by_subscription[subscription.id]
+        paid_coupons = coupons.get(subscription.id, CouponTotals(paid_amount=Decimal("0"))).paid_amount
         tma = annualized_return(
             Decimal(subscription.invested_amount),
             Decimal(subscription.current_value),
@@ -176,4 +241,59 @@ def build_client_context(db: Session, client_id: int) -> dict:
     for account in accounts:
         liquidity[account.currency] += Decimal(account.available_balance)
     context["available_liquidity_by_currency"] = {currency: _value(value) for currency, value in liquidity.items()}
-    return json.loads(json.dumps(context, ensure_ascii=False))
+    keys = frozenset(
+        [("client", client_id)]
+        + [("account", item.id) for item in accounts]
+        + [("order", item.id) for item in orders]
+        + [("subscription", item.id) for item in subscriptions]
+    )
+    return context, keys
+
+
+def _changed_keys(instance) -> list[Hashable]:
+    if isinstance(instance, Account):
+        return [("account", instance.id)]
+    if isinstance(instance, (AccountRole, InvestmentOrder)):
+        return [("client", instance.client_id), ("account", instance.account_id)]
+    if isinstance(instance, Transaction):
+        return [("account", item) for item in (instance.source_account_id, instance.destination_account_id) if item is not None]
+    if isinstance(instance, Subscription):
+        return [("account", instance.account_id), ("subscription", instance.id)]
+    if isinstance(instance, InterestPayment):
+        return [("subscription", instance.subscription_id)]
+    if isinstance(instance, OrderWorkflowStep):
+        return [("order", instance.order_id)]
+    if isinstance(instance, Instrument):
+        return [ALL_CONTEXTS]
+    return []
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_context_changes(session: Session, _flush_context) -> None:
+    keys = [key for instance in (*session.new, *session.dirty, *session.deleted) for key in _changed_keys(instance)]
+    if keys:
+        session.info.setdefault(CONTEXT_CHANGES_KEY, set()).update(keys)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_context_changes(state: ORMExecuteState) -> None:
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement, "table", None)
+        if getattr(table, "name", None) in CONTEXT_TABLES:
+            state.session.info.setdefault(CONTEXT_CHANGES_KEY, set()).add(ALL_CONTEXTS)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_context_changes(session: Session) -> None:
+    if session.in_nested_transaction():
+        return
+    keys = session.info.pop(CONTEXT_CHANGES_KEY, None)
+    if keys:
+        context_versions.bump(keys)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_context_changes(session: Session, previous_transaction) -> None:
+    # Un savepoint annule garde ses cles : invalider en trop reste sans risque.
+    if previous_transaction.parent is None and not previous_transaction.nested:
+        session.info.pop(CONTEXT_CHANGES_KEY, None)
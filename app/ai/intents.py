@@ -0,0 +1,34 @@
+"""Classification legere des questions posees a l'assistant, par mots-cles."""
+
+import re
+import unicodedata
+
+# Mots-cles normalises (minuscules, sans accents) associes a chaque section du contexte.
+SECTION_KEYWORDS = {
+    "accounts": ("solde", "compte", "liquidite", "disponible", "argent", "cash", "htg", "usd", "gourde", "dollar"),
+    "positions": ("position", "portefeuille", "placement", "investi", "rendement", "tma", "valeur", "coupon", "interet", "frais", "echeance", "gain", "perte"),
+    "obligations": ("obligation", "bon", "brh", "coupon", "echeance", "maturite"),
+    "orders": ("ordre", "demande", "attente", "valid", "approbation", "rejet", "etape", "bloque", "pending"),
+    "transactions": ("transaction", "operation", "virement", "transfert", "retrait", "depot", "mouvement", "historique", "paiement", "debit", "credit", "dernier"),
+}
+NUMBER = re.compile(r"\b\d+\b")
+
+
+def normalize_message(message: str) -> str:
+    """Minuscules, sans accents, ponctuation et espaces superflus : deux formulations proches partagent une cle."""
+    text = unicodedata.normalize("NFKD", message.lower())
+    text = "".join(char if char.isalnum() else " " for char in text if not unicodedata.combining(char))
+    return " ".join(text.split())
+
+
+def section_scores(message: str) -> dict[str, int]:
+    """Nombre de mots de la question qui commencent par un mot-cle de chaque section."""
+    words = normalize_message(message).split()
+    return {
+        section: sum(1 for word in words if any(word.startswith(keyword) for keyword in keywords))
+        for section, keywords in SECTION_KEYWORDS.items()
+    }
+
+
+def mentioned_numbers(message: str) -> set[int]:
+    return {int(item) for item in NUMBER.findall(message)}
@@ -0,0 +1,138 @@
+"""Reponses deterministes aux questions courantes, sans appel au fournisseur.
+
+Une question n'est traitee ici que si elle correspond a une seule intention
+connue (solde, echeance, ordre, TMA) et ne porte aucun marqueur de question
+ouverte. Sinon ``answer_locally`` retourne None et le fournisseur repond.
+Les reponses ne lisent que le contexte autorise du client.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from app.ai.intents import mentioned_numbers, normalize_message
+from app.services.order_service import OPEN_ORDER_STATUSES
+
+STEP_LABELS = {"CONFORMITE": "contrôle de conformité", "BACK_OFFICE": "traitement back-office", "CHECKER": "validation finale"}
+CURRENCY_WORDS = {"htg": "HTG", "gourde": "HTG", "gourdes": "HTG", "usd": "USD", "dollar": "USD", "dollars": "USD"}
+# Prefixes (normalises) qui signalent une demande d'avis, de comparaison ou d'explication libre.
+OPEN_ENDED = ("conseil", "recommand", "devrai", "compar", "strateg", "prevoi", "risque", "mieux", "explique", "simul", "si je", "et si", "hier", "dernier", "precedent", "evolu", "histori")
+INTENT_PREFIXES = {
+    "order_status": ("ordre",),
+    "available_balance": ("solde", "disponible", "liquidite"),
+    "maturity": ("echeance", "maturite", "arrive a terme"),
+    "tma": ("tma",),
+}
+
+
+@dataclass(frozen=True, slots=True)
+class LocalAnswer:
+    intent: str
+    content: str
+
+
+def _amount(value, currency: str | None = None) -> str:
+    try:
+        text = f"{Decimal(value):,.2f}".replace(",", " ")
+    except (InvalidOperation, TypeError, ValueError):
+        text = str(value)
+    return f"{text} {currency}" if currency else text
+
+
+def _day(value: str | None) -> str:
+    try:
+        return date.fromisoformat(value[:10]).strftime("%d/%m/%Y")
+    except (TypeError, ValueError):
+        return "non renseignée"
+
+
+def _matches(text: str, prefixes: tuple[str, ...]) -> bool:
+    words = text.split()
+    return any((" " in prefix and prefix in text) or any(word.startswith(prefix) for word in words) for prefix in prefixes)
+
+
+def detect_intent(message: str) -> str | None:
+    """Intention reconnue, ou None si la question est ouverte, ambigue ou inconnue."""
+    text = normalize_message(message)
+    if not text or _matches(text, OPEN_ENDED):
+        return None
+    intents = [intent for intent, prefixes in INTENT_PREFIXES.items() if _matches(text, prefixes)]
+    if len(intents) != 1:
+        return None
+    # Hors numero d'ordre, un nombre (date, montant) appelle une reponse que les modeles ne couvrent pas.
+    if intents[0] != "order_status" and mentioned_numbers(message):
+        return None
+    return intents[0]
+
+
+def _available_balance(message: str, context: dict) -> str:
+    words = normalize_message(message).split()
+    currency = next((CURRENCY_WORDS[word] for word in words if word in CURRENCY_WORDS), None)
+    accounts = [item for item in context.get("accounts", []) if currency is None or item.get("currency") == currency]
+    if not accounts:
+        return f"Aucun de vos comptes autorisés n'est tenu en {currency}." if currency else "Aucun compte autorisé n'apparaît dans vos données."
+    liquidity = context.get("available_liquidity_by_currency", {})
+    totals = "; ".join(_amount(value, code) for code, value in sorted(liquidity.items()) if currency is None or code == currency)
+    lines = [f"Votre solde disponible est de {totals}."]
+    lines += [
+        f"- {item['account_number']} : {_amount(item['available_balance'], item['currency'])} disponible, solde comptable {_amount(item['balance'], item['currency'])} ({item['status']})"
+        for item in accounts
+    ]
+    return "\n".join(lines)
+
+
+def _maturity(message: str, context: dict) -> str:
+    text = normalize_message(message)
+    positions = context.get("obligations", []) if "obligation" in text else context.get("positions", [])
+    named = [item for item in positions if any(normalize_message(item.get(key) or "") in text for key in ("instrument_code", "instrument") if item.get(key))]
+    positions = sorted(named or positions, key=lambda item: item.get("maturity_date") or "9999")
+    if not positions:
+        return "Aucune position avec une échéance n'apparaît dans vos données."
+    lines = ["Échéances de vos positions :"] if len(positions) > 1 else []
+    lines += [
+        f"- {item.get('instrument') or 'Instrument'} ({item.get('instrument_code') or '-'}) : échéance le {_day(item.get('maturity_date'))}, valeur actuelle {_amount(item['current_value'], item['currency'])}"
+        for item in positions
+    ]
+    if len(positions) == 1:
+        return lines[0].removeprefix("- ").replace(" : échéance le", " arrive à échéance le", 1) + "."
+    return "\n".join(lines)
+
+
+def _order_status(message: str, context: dict) -> str:
+    orders = context.get("orders", [])
+    numbers = mentioned_numbers(message)
+    if numbers:
+        order = next((item for item in orders if item.get("id") in numbers), None)
+        if order is None:
+            return f"Je ne trouve pas l'ordre n°{min(numbers)} parmi vos ordres récents; consultez la liste complète dans le portail."
+    else:
+        order = next((item for item in orders if item.get("status") in OPEN_ORDER_STATUSES), None)
+        if order is None:
+            return "Vous n'avez aucun ordre en attente parmi vos ordres récents."
+    lines = [
+        f"L'ordre n°{order['id']} ({order.get('instrument') or 'instrument'}, {_amount(order['amount'], order.get('currency'))}) est au statut {order['status']}.",
+        order.get("status_explanation") or "Le statut doit être consulté dans le portail.",
+    ]
+    pending = [STEP_LABELS.get(step["code"], step["code"]) for step in order.get("steps", []) if step.get("status") == "PENDING"]
+    if pending and order.get("status") in OPEN_ORDER_STATUSES:
+        lines.append(f"Étapes restantes : {', '.join(pending)}.")
+    return " ".join(lines)
+
+
+def _tma(message: str, context: dict) -> str:
+    definition = "Le TMA (taux de rendement annualisé) est une estimation annualisée du rendement observé de vos positions, frais et coupons compris; ce n'est pas une promesse de rendement futur."
+    totals = context.get("portfolio_totals_by_currency", {})
+    if not totals:
+        return definition
+    figures = "; ".join(f"{Decimal(values['tma_percentage']):.2f} % en {currency}" for currency, values in sorted(totals.items()))
+    return f"TMA estimé de votre portefeuille : {figures}. {definition}"
+
+
+ANSWERS = {"available_balance": _available_balance, "maturity": _maturity, "order_status": _order_status, "tma": _tma}
+
+
+def answer_locally(message: str, context: dict) -> LocalAnswer | None:
+    intent = detect_intent(message)
+    if intent is None:
+        return None
+    return LocalAnswer(intent=intent, content=ANSWERS[intent](message, context))
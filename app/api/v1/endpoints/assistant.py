@@ -1,28 +1,77 @@
+import json
+from collections.abc import AsyncIterator
+
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.ai.client import AIProviderError, AIUnavailableError
-from app.core.dependencies import get_current_active_client
-from app.db.database import get_db
-from app.models.models import Client
+from app.core.dependencies import get_async_current_active_principal
+from app.db.database import get_async_db
 from app.schemas.api import AssistantChatRequest, AssistantChatResponse
 from app.services.assistant_service import AssistantService, DISCLAIMER
+from app.services.auth_service import ClientPrincipal
 
 router = APIRouter()
 
 
+def _provider_exception(exc: AIUnavailableError | AIProviderError) -> HTTPException:
+    if isinstance(exc, AIUnavailableError):
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail={"code": "AI_UNAVAILABLE", "message": str(exc)})
+    return HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail={"code": "AI_PROVIDER_ERROR", "message": str(exc)})
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _sse_events(first: str, tokens: AsyncIterator[str], context_used: list[str]) -> AsyncIterator[str]:
+    yield _sse("token", {"delta": first})
+    try:
+        async for token in tokens:
+            yield _sse("token", {"delta": token})
+    except (AIUnavailableError, AIProviderError) as exc:
+        # Les en-tetes sont deja envoyes : l'erreur devient un evenement.
+        yield _sse("error", _provider_exception(exc).detail)
+        return
+    yield _sse("done", {"disclaimer": DISCLAIMER, "context_used": context_used})
+
+
 @router.post("/chat", response_model=AssistantChatResponse)
-def chat(payload: AssistantChatRequest, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+async def chat(payload: AssistantChatRequest, client: ClientPrincipal = Depends(get_async_current_active_principal), db: AsyncSession = Depends(get_async_db)):
     try:
-        completion, context_used = AssistantService.chat(
+        completion, context_used = await AssistantService.chat(
             db,
             client.id,
             payload.message,
             [item.model_dump() for item in payload.history],
         )
-    except AIUnavailableError as exc:
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail={"code": "AI_UNAVAILABLE", "message": str(exc)}) from exc
-    except AIProviderError as exc:
-        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail={"code": "AI_PROVIDER_ERROR", "message": str(exc)}) from exc
+    except (AIUnavailableError, AIProviderError) as exc:
+        raise _provider_exception(exc) from exc
 
     return AssistantChatResponse(answer=completion.content, disclaimer=DISCLAIMER, context_used=context_used)
+
+
+@router.post("/chat/stream")
+async def chat_stream(payload: AssistantChatRequest, client: ClientPrincipal = Depends(get_async_current_active_principal), db: AsyncSession = Depends(get_async_db)):
+    """Reponse en ``text/event-stream`` : evenements ``token``, puis ``done`` ou ``error``.
+
+    Le premier fragment est attendu avant de repondre : configuration absente
+    ou echec du fournisseur donnent encore un 503/502.
+    """
+    try:
+        tokens, context_used = await AssistantService.stream(
+            db,
+            client.id,
+            payload.message,
+            [item.model_dump() for item in payload.history],
+        )
+        first = await anext(tokens)
+    except (AIUnavailableError, AIProviderError) as exc:
+        raise _provider_exception(exc) from exc
+
+    return StreamingResponse(
+        _sse_events(first, tokens, context_used),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
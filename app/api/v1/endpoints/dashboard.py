@@ -1,14 +1,19 @@
+from datetime import date
 from decimal import Decimal
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.api.v1.endpoints.serializers import account_dict, subscription_dict, transaction_dict
-from app.core.dependencies import get_current_active_client
-from app.db.database import get_db
-from app.models.models import Account, AccountRole, Client, Subscription, Transaction
+from app.api.v1.endpoints.serializers import account_dict, subscription_dict, transaction_dicts
+from app.core.dependencies import get_async_current_active_principal, get_current_active_principal
+from app.db.database import get_async_db, get_db
+from app.models.models import Account, AccountRole, Subscription
+from app.services.auth_service import ClientPrincipal
+from app.services.history_snapshots import month_range, portfolio_history
 from app.services.reporting_service import ReportingService
+from app.services.transaction_queries import visible_transactions
 
 router = APIRouter()
 
@@ -17,9 +22,8 @@ def client_accounts(db: Session, client_id: int) -> list[Account]:
     return list(db.scalars(select(Account).join(AccountRole, AccountRole.account_id == Account.id).where(AccountRole.client_id == client_id, AccountRole.is_active.is_(True))).unique())
 
 
-@router.get("/overview")
-def overview(client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
-    accounts = client_accounts(db, client.id)
+def overview_payload(db: Session, client_id: int) -> dict:
+    accounts = client_accounts(db, client_id)
     subscriptions = list(db.scalars(select(Subscription).where(Subscription.account_id.in_([item.id for item in accounts]), Subscription.status == "ACTIVE")))
     total_invested = sum((Decimal(item.invested_amount) for item in subscriptions), Decimal("0"))
     total_value = sum((Decimal(item.current_value) for item in subscriptions), Decimal("0"))
@@ -33,63 +37,99 @@ def overview(client: Client = Depends(get_current_active_client), db: Session =
     return {
         "total_value": total_value, "total_invested": total_invested, "total_return": total_return,
         "return_percentage": percentage.quantize(Decimal("0.01")), "active_subscriptions": len(subscriptions),
-        "accounts": [account_dict(item, db.scalar(select(AccountRole.role).where(AccountRole.account_id == item.id, AccountRole.client_id == client.id, AccountRole.is_active.is_(True)))) for item in accounts],
+        "accounts": [account_dict(item, db.scalar(select(AccountRole.role).where(AccountRole.account_id == item.id, AccountRole.client_id == client_id, AccountRole.is_active.is_(True)))) for item in accounts],
         "currency": currency,
         "valeur_totale": total_value, "rendement_total": total_return, "pourcentage_rendement": percentage.quantize(Decimal("0.01")),
     }
 
 
-@router.get("/transactions/recentes")
-def recent_transactions(limit: int = Query(default=5, ge=1, le=20), client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
-    account_ids = select(AccountRole.account_id).where(AccountRole.client_id == client.id, AccountRole.is_active.is_(True))
-    rows = db.scalars(select(Transaction).where((Transaction.source_account_id.in_(account_ids)) | (Transaction.destination_account_id.in_(account_ids))).order_by(Transaction.created_at.desc()).limit(limit)).all()
-    result = [transaction_dict(item, db) for item in rows]
+def recent_transactions_payload(db: Session, client_id: int, limit: int) -> dict:
+    account_ids = list(db.scalars(select(AccountRole.account_id).where(AccountRole.client_id == client_id, AccountRole.is_active.is_(True))))
+    rows = db.scalars(visible_transactions(account_ids, limit=limit)).all() if account_ids else []
+    result = transaction_dicts(rows, db)
     return {"total": len(result), "transactions": result}
 
 
-@router.get("/investissements")
-def active_investments(client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
-    account_ids = select(AccountRole.account_id).where(AccountRole.client_id == client.id, AccountRole.is_active.is_(True))
+def active_investments_payload(db: Session, client_id: int) -> dict:
+    account_ids = select(AccountRole.account_id).where(AccountRole.client_id == client_id, AccountRole.is_active.is_(True))
     rows = db.scalars(select(Subscription).where(Subscription.account_id.in_(account_ids), Subscription.status == "ACTIVE").order_by(Subscription.effective_maturity_date)).all()
     result = [subscription_dict(item) for item in rows]
     return {"total": len(result), "investissements": result, "investments": result}
 
 
-@router.get("/statistiques/mensuelles")
-def monthly_statistics(mois: int = Query(default=6, ge=1, le=24), client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
-    accounts = client_accounts(db, client.id)
-    subscriptions = list(db.scalars(select(Subscription).where(Subscription.account_id.in_([item.id for item in accounts])))) if accounts else []
-    value = sum((Decimal(item.current_value) for item in subscriptions), Decimal("0"))
-    result = [{"mois": index + 1, "valeur_portefeuille": value, "nombre_souscriptions": len(subscriptions)} for index in range(mois)]
+def monthly_statistics_payload(db: Session, client_id: int, mois: int) -> dict:
+    """Mois passes lus dans les instantanes mensuels, mois courant calcule en direct."""
+    accounts = client_accounts(db, client_id)
+    account_ids = [item.id for item in accounts]
+    months = month_range(date.today(), mois)
+    current = months[-1]
+    history = portfolio_history(db, account_ids, months[0], current)
+    subscriptions = list(db.scalars(select(Subscription).where(Subscription.account_id.in_(account_ids), Subscription.status == "ACTIVE"))) if account_ids else []
+    history[current] = {
+        "valeur_portefeuille": sum((Decimal(item.current_value) for item in subscriptions), Decimal("0")),
+        "nombre_souscriptions": len(subscriptions),
+        "solde_comptes": sum((Decimal(item.balance) for item in accounts), Decimal("0")),
+    }
+    empty = {"valeur_portefeuille": Decimal("0.00"), "nombre_souscriptions": 0, "solde_comptes": Decimal("0.00")}
+    result = [{"mois": index + 1, "periode": month, **history.get(month, empty)} for index, month in enumerate(months)]
     return {"periodes": result}
 
 
-@router.get("/complet")
-def complete_dashboard(client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def complete_dashboard_payload(db: Session, client_id: int) -> dict:
     return {
-        "overview": overview(client, db),
-        "transactions_recentes": recent_transactions(5, client, db),
-        "investissements_actifs": active_investments(client, db),
-        "statistiques_mensuelles": monthly_statistics(6, client, db),
+        "overview": overview_payload(db, client_id),
+        "transactions_recentes": recent_transactions_payload(db, client_id, 5),
+        "investissements_actifs": active_investments_payload(db, client_id),
+        "statistiques_mensuelles": monthly_statistics_payload(db, client_id, 6),
     }
 
 
+# Les routes de lecture sont async : les helpers synchrones ci-dessus
+# s'executent via ``run_sync`` sur la connexion asyncpg, sans threadpool.
+@router.get("/overview")
+async def overview(client: ClientPrincipal = Depends(get_async_current_active_principal), db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(overview_payload, client.id)
+
+
+@router.get("/transactions/recentes")
+async def recent_transactions(limit: int = Query(default=5, ge=1, le=20), client: ClientPrincipal = Depends(get_async_current_active_principal), db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(recent_transactions_payload, client.id, limit)
+
+
+@router.get("/investissements")
+async def active_investments(client: ClientPrincipal = Depends(get_async_current_active_principal), db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(active_investments_payload, client.id)
+
+
+@router.get("/statistiques/mensuelles")
+async def monthly_statistics(mois: int = Query(default=6, ge=1, le=24), client: ClientPrincipal = Depends(get_async_current_active_principal), db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(monthly_statistics_payload, client.id, mois)
+
+
+# Les rapports et le tableau complet restent synchrones : leur calcul occupe
+# un thread du threadpool au lieu de bloquer la boucle d'evenements.
+@router.get("/complet")
+def complete_dashboard(client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
+    return complete_dashboard_payload(db, client.id)
+
+
 @router.get("/rapports/client")
 def client_business_report(
     horizon_days: int = Query(default=90, ge=30, le=365),
     months: int = Query(default=6, ge=3, le=24),
-    client: Client = Depends(get_current_active_client),
+    backend: str | None = Query(default=None, pattern="^(orm|sql)$"),
+    client: ClientPrincipal = Depends(get_current_active_principal),
     db: Session = Depends(get_db),
 ):
     """Rapport portefeuille : devise, allocation, échéances, ordres et flux."""
-    return ReportingService.client_report(db, client.id, horizon_days=horizon_days, months=months)
+    return ReportingService.client_report(db, client.id, horizon_days=horizon_days, months=months, backend=backend)
 
 
 @router.get("/rapports/back-office")
 def backoffice_business_report(
     horizon_days: int = Query(default=90, ge=30, le=365),
     limit: int = Query(default=30, ge=1, le=100),
-    client: Client = Depends(get_current_active_client),
+    client: ClientPrincipal = Depends(get_current_active_principal),
     db: Session = Depends(get_db),
 ):
     """File de pilotage réservée aux profils habilités sur un périmètre."""
@@ -102,7 +142,7 @@ def backoffice_business_report(
 @router.get("/rapports/reglementaire")
 def regulatory_business_report(
     horizon_days: int = Query(default=90, ge=30, le=365),
-    client: Client = Depends(get_current_active_client),
+    client: ClientPrincipal = Depends(get_current_active_principal),
     db: Session = Depends(get_db),
 ):
     """Projection interne des actifs, frais, coupons et activite par devise."""
@@ -2,16 +2,17 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import select
 from sqlalchemy.orm import Session, joinedload
 
-from app.core.dependencies import get_current_active_client
+from app.core.dependencies import get_current_active_principal
 from app.db.database import get_db
-from app.models.models import Client, Instrument
+from app.models.models import Instrument
 from app.api.v1.endpoints.serializers import instrument_dict
+from app.services.auth_service import ClientPrincipal
 
 router = APIRouter()
 
 
 @router.get("/")
-def list_instruments(status_filter: str | None = Query(default=None, alias="status"), currency: str | None = None, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def list_instruments(status_filter: str | None = Query(default=None, alias="status"), currency: str | None = None, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     query = select(Instrument).options(joinedload(Instrument.instrument_type)).order_by(Instrument.maturity_date)
     if status_filter:
         query = query.where(Instrument.status == status_filter.upper())
@@ -22,7 +23,7 @@ def list_instruments(status_filter: str | None = Query(default=None, alias="stat
 
 
 @router.get("/{instrument_id}")
-def get_instrument(instrument_id: int, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def get_instrument(instrument_id: int, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     instrument = db.scalar(select(Instrument).where(Instrument.id == instrument_id).options(joinedload(Instrument.instrument_type)))
     if not instrument:
         raise HTTPException(status_code=404, detail="Instrument introuvable")
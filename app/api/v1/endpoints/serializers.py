@@ -1,3 +1,7 @@
+from collections.abc import Sequence
+
+from sqlalchemy import select
+
 from app.models.models import Account, Instrument, InterestPayment, InvestmentOrder, Subscription, Transaction
 
 
@@ -49,20 +53,28 @@ def interest_payment_dict(payment: InterestPayment) -> dict:
 
 
 def transaction_dict(transaction: Transaction, db) -> dict:
-    source = db.get(Account, transaction.source_account_id) if transaction.source_account_id else None
-    destination = db.get(Account, transaction.destination_account_id) if transaction.destination_account_id else None
-    return {
-        "id": transaction.id, "transaction_type": transaction.transaction_type, "source_account_id": transaction.source_account_id,
-        "destination_account_id": transaction.destination_account_id, "amount": transaction.amount, "currency": transaction.currency,
-        "description": transaction.description, "status": transaction.status, "created_at": transaction.created_at,
-        "executed_at": transaction.executed_at, "is_automatic": transaction.is_automatic, "subscription_id": transaction.subscription_id,
-        "created_by_client_id": transaction.created_by_client_id, "approved_by_client_id": transaction.approved_by_client_id,
-        "rejection_reason": transaction.rejection_reason,
-        "version": transaction.version, "reversal_of_transaction_id": transaction.reversal_of_transaction_id,
-        "reversed_at": transaction.reversed_at, "reversal_reason": transaction.reversal_reason,
-        "source_account_number": source.account_number if source else None,
-        "destination_account_number": destination.account_number if destination else None,
-    }
+    return transaction_dicts([transaction], db)[0]
+
+
+def transaction_dicts(transactions: Sequence[Transaction], db) -> list[dict]:
+    """Serialise une liste de transactions en resolvant tous les numeros de compte en une requete."""
+    account_ids = {account_id for item in transactions for account_id in (item.source_account_id, item.destination_account_id) if account_id}
+    numbers = dict(db.execute(select(Account.id, Account.account_number).where(Account.id.in_(account_ids)))) if account_ids else {}
+    return [
+        {
+            "id": transaction.id, "transaction_type": transaction.transaction_type, "source_account_id": transaction.source_account_id,
+            "destination_account_id": transaction.destination_account_id, "amount": transaction.amount, "currency": transaction.currency,
+            "description": transaction.description, "status": transaction.status, "created_at": transaction.created_at,
+            "executed_at": transaction.executed_at, "is_automatic": transaction.is_automatic, "subscription_id": transaction.subscription_id,
+            "created_by_client_id": transaction.created_by_client_id, "approved_by_client_id": transaction.approved_by_client_id,
+            "rejection_reason": transaction.rejection_reason,
+            "version": transaction.version, "reversal_of_transaction_id": transaction.reversal_of_transaction_id,
+            "reversed_at": transaction.reversed_at, "reversal_reason": transaction.reversal_reason,
+            "source_account_number": numbers.get(transaction.source_account_id),
+            "destination_account_number": numbers.get(transaction.destination_account_id),
+        }
+        for transaction in transactions
+    ]
 
 
 def order_dict(order: InvestmentOrder) -> dict:
@@ -1,13 +1,14 @@
 from datetime import date
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.api.v1.endpoints.serializers import interest_payment_dict, subscription_dict
-from app.core.dependencies import get_current_active_client
-from app.db.database import get_db
-from app.models.models import Client
+from app.api.v1.endpoints.serializers import interest_payment_dict, subscription_dict, transaction_dicts
+from app.core.dependencies import get_async_current_active_principal, get_current_active_principal
+from app.db.database import get_async_db, get_db
 from app.schemas.api import SubscriptionCreate
+from app.services.auth_service import ClientPrincipal
 from app.services.subscription_service import SubscriptionService
 from app.services.interest_service import InterestService
 
@@ -15,7 +16,7 @@ router = APIRouter()
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def create_subscription(payload: SubscriptionCreate, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def create_subscription(payload: SubscriptionCreate, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     try:
         subscription = SubscriptionService.create(db, client.id, payload.account_id, payload.instrument_id, payload.invested_amount, payload.units)
         return {"success": True, "message": "Souscription enregistrée", "souscription": subscription_dict(subscription), "subscription": subscription_dict(subscription)}
@@ -25,32 +26,40 @@ def create_subscription(payload: SubscriptionCreate, client: Client = Depends(ge
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
-@router.get("/mes-souscriptions")
-def list_subscriptions(client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
-    subscriptions = [subscription_dict(item) for item in SubscriptionService.list_for_client(db, client.id)]
+def client_subscriptions_payload(db: Session, client_id: int) -> dict:
+    subscriptions = [subscription_dict(item) for item in SubscriptionService.list_for_client(db, client_id)]
     return {"total": len(subscriptions), "souscriptions": subscriptions, "subscriptions": subscriptions}
 
 
+@router.get("/mes-souscriptions")
+async def list_subscriptions(client: ClientPrincipal = Depends(get_async_current_active_principal), db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(client_subscriptions_payload, client.id)
+
+
 @router.post("/maintenance/maturites")
-def generate_maturities(as_of: date | None = Query(default=None), client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def generate_maturities(as_of: date | None = Query(default=None), bulk: bool = Query(default=False), client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
+    if bulk:
+        return {"success": True, **SubscriptionService.run_maturity_batch(db, as_of or date.today(), client.id)}
     transactions = SubscriptionService.generate_maturity_transactions(db, as_of or date.today(), client.id)
-    return {"success": True, "total": len(transactions), "transactions": [transaction_dict(item, db) for item in transactions]}
+    return {"success": True, "total": len(transactions), "transactions": transaction_dicts(transactions, db)}
 
 
 @router.post("/maintenance/coupons")
-def generate_coupons(as_of: date | None = Query(default=None), client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def generate_coupons(as_of: date | None = Query(default=None), bulk: bool = Query(default=False), client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
+    if bulk:
+        return {"success": True, **InterestService.generate_due_payments_bulk(db, as_of or date.today(), client.id)}
     payments = InterestService.generate_due_payments(db, as_of or date.today(), client.id)
     return {"success": True, "total": len(payments), "payments": [interest_payment_dict(item) for item in payments]}
 
 
 @router.get("/mes-coupons")
-def list_coupons(subscription_id: int | None = Query(default=None), client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def list_coupons(subscription_id: int | None = Query(default=None), client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     payments = InterestService.list_for_client(db, client.id, subscription_id)
     return {"total": len(payments), "coupons": [interest_payment_dict(item) for item in payments]}
 
 
 @router.get("/{subscription_id}")
-def get_subscription(subscription_id: int, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def get_subscription(subscription_id: int, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     try:
         subscription = SubscriptionService.get_for_client(db, subscription_id, client.id)
         if not subscription:
@@ -61,7 +70,7 @@ def get_subscription(subscription_id: int, client: Client = Depends(get_current_
 
 
 @router.post("/{subscription_id}/racheter")
-def redeem_subscription(subscription_id: int, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def redeem_subscription(subscription_id: int, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     try:
         subscription = SubscriptionService.redeem(db, subscription_id, client.id)
         return {"success": True, "message": "Souscription rachetée", "souscription": subscription_dict(subscription)}
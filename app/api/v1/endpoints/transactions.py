@@ -1,19 +1,28 @@
+import csv
+import io
+import json
+from collections.abc import Iterator
+from itertools import chain
+
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import or_, select
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.api.v1.endpoints.serializers import transaction_dict
-from app.core.dependencies import get_current_active_client
-from app.db.database import get_db
-from app.models.models import AccountRole, Client, Transaction
-from app.schemas.api import TransactionCreate, TransactionReject, TransactionReverse
-from app.services.transaction_service import TransactionService
+from app.api.v1.endpoints.serializers import transaction_dict, transaction_dicts
+from app.core.dependencies import get_async_current_active_principal, get_current_active_principal
+from app.db.database import get_async_db, get_db
+from app.models.models import AccountRole, Transaction
+from app.schemas.api import TransactionApproveBatch, TransactionCreate, TransactionReject, TransactionReverse
+from app.services.auth_service import ClientPrincipal
+from app.services.transaction_service import EXPORT_COLUMNS, TransactionService
 
 router = APIRouter()
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def create_transaction(payload: TransactionCreate, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def create_transaction(payload: TransactionCreate, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     try:
         transaction = TransactionService.create(db, client.id, payload.transaction_type, payload.amount, payload.currency, payload.source_account_id, payload.destination_account_id, payload.description)
         return {"success": True, "message": "Transaction créée et placée en attente de validation", "transaction": transaction_dict(transaction, db)}
@@ -24,28 +33,36 @@ def create_transaction(payload: TransactionCreate, client: Client = Depends(get_
 
 
 @router.post("/depot", status_code=status.HTTP_201_CREATED)
-def create_deposit(payload: TransactionCreate, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def create_deposit(payload: TransactionCreate, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     if payload.transaction_type != "DEPOT":
         raise HTTPException(status_code=422, detail="transaction_type doit être DEPOT")
     return create_transaction(payload, client, db)
 
 
 @router.post("/retrait", status_code=status.HTTP_201_CREATED)
-def create_withdrawal(payload: TransactionCreate, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def create_withdrawal(payload: TransactionCreate, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     if payload.transaction_type != "RETRAIT":
         raise HTTPException(status_code=422, detail="transaction_type doit être RETRAIT")
     return create_transaction(payload, client, db)
 
 
 @router.post("/transfert", status_code=status.HTTP_201_CREATED)
-def create_transfer(payload: TransactionCreate, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def create_transfer(payload: TransactionCreate, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     if payload.transaction_type != "TRANSFERT":
         raise HTTPException(status_code=422, detail="transaction_type doit être TRANSFERT")
     return create_transaction(payload, client, db)
 
 
+@router.post("/approve-batch")
+def approve_transactions_batch(payload: TransactionApproveBatch, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
+    """Validation groupée par un checker; chaque transaction reçoit son propre résultat."""
+    results = TransactionService.approve_batch(db, payload.transaction_ids, client.id)
+    approved = sum(1 for item in results if item["success"])
+    return {"success": True, "approved": approved, "failed": len(results) - approved, "results": results}
+
+
 @router.post("/{transaction_id}/approve")
-def approve_transaction(transaction_id: int, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def approve_transaction(transaction_id: int, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     try:
         transaction = TransactionService.approve(db, transaction_id, client.id)
         return {"success": True, "message": "Transaction validée et exécutée", "transaction": transaction_dict(transaction, db)}
@@ -56,7 +73,7 @@ def approve_transaction(transaction_id: int, client: Client = Depends(get_curren
 
 
 @router.post("/{transaction_id}/reject")
-def reject_transaction(transaction_id: int, payload: TransactionReject, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def reject_transaction(transaction_id: int, payload: TransactionReject, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     try:
         transaction = TransactionService.reject(db, transaction_id, client.id, payload.reason)
         return {"success": True, "message": "Transaction rejetée", "transaction": transaction_dict(transaction, db)}
@@ -67,7 +84,7 @@ def reject_transaction(transaction_id: int, payload: TransactionReject, client:
 
 
 @router.post("/{transaction_id}/reverse", status_code=status.HTTP_201_CREATED)
-def reverse_transaction(transaction_id: int, payload: TransactionReverse, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def reverse_transaction(transaction_id: int, payload: TransactionReverse, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     try:
         transaction = TransactionService.reverse(db, transaction_id, client.id, payload.reason)
         return {"success": True, "message": "Contrepassation placee en attente de validation", "transaction": transaction_dict(transaction, db)}
@@ -77,24 +94,94 @@ def reverse_transaction(transaction_id: int, payload: TransactionReverse, client
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
 
+def _client_account_ids(db: Session, client_id: int, account_id: int | None = None) -> list[int]:
+    query = select(AccountRole.account_id).where(AccountRole.client_id == client_id, AccountRole.is_active.is_(True))
+    if account_id is None:
+        return list(db.scalars(query))
+    if not db.scalar(query.where(AccountRole.account_id == account_id)):
+        raise HTTPException(status_code=403, detail="Accès refusé à ce compte")
+    return [account_id]
+
+
+def _history_page(db: Session, account_ids: list[int], limit: int, cursor: str | None) -> tuple[list[dict], str | None]:
+    try:
+        transactions, next_cursor = TransactionService.history_page(db, account_ids, limit, cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return transaction_dicts(transactions, db), next_cursor
+
+
+def client_transactions_payload(db: Session, client_id: int, limit: int, cursor: str | None = None) -> dict:
+    result, next_cursor = _history_page(db, _client_account_ids(db, client_id), limit, cursor)
+    return {"total": len(result), "transactions": result, "next_cursor": next_cursor}
+
+
+def account_transactions_payload(db: Session, client_id: int, account_id: int, limit: int, cursor: str | None = None) -> dict:
+    result, next_cursor = _history_page(db, _client_account_ids(db, client_id, account_id), limit, cursor)
+    return {"compte_id": account_id, "total": len(result), "transactions": result, "next_cursor": next_cursor}
+
+
 @router.get("/mes-transactions")
-def list_transactions(limit: int = Query(default=100, ge=1, le=500), client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
-    account_ids = select(AccountRole.account_id).where(AccountRole.client_id == client.id, AccountRole.is_active.is_(True))
-    transactions = db.scalars(select(Transaction).where(or_(Transaction.source_account_id.in_(account_ids), Transaction.destination_account_id.in_(account_ids))).order_by(Transaction.created_at.desc()).limit(limit)).all()
-    result = [transaction_dict(item, db) for item in transactions]
-    return {"total": len(result), "transactions": result}
+async def list_transactions(
+    limit: int = Query(default=100, ge=1, le=500),
+    cursor: str | None = Query(default=None, description="Valeur next_cursor de la page précédente"),
+    client: ClientPrincipal = Depends(get_async_current_active_principal),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(client_transactions_payload, client.id, limit, cursor)
 
 
 @router.get("/compte/{account_id}")
-def list_account_transactions(account_id: int, limit: int = Query(default=100, ge=1, le=500), client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
-    if not db.scalar(select(AccountRole.id).where(AccountRole.account_id == account_id, AccountRole.client_id == client.id, AccountRole.is_active.is_(True))):
-        raise HTTPException(status_code=403, detail="Accès refusé à ce compte")
-    transactions = db.scalars(select(Transaction).where(or_(Transaction.source_account_id == account_id, Transaction.destination_account_id == account_id)).order_by(Transaction.created_at.desc()).limit(limit)).all()
-    return {"compte_id": account_id, "total": len(transactions), "transactions": [transaction_dict(item, db) for item in transactions]}
+async def list_account_transactions(
+    account_id: int,
+    limit: int = Query(default=100, ge=1, le=500),
+    cursor: str | None = Query(default=None, description="Valeur next_cursor de la page précédente"),
+    client: ClientPrincipal = Depends(get_async_current_active_principal),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(account_transactions_payload, client.id, account_id, limit, cursor)
+
+
+def _ndjson_lines(rows: Iterator[tuple]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str, ensure_ascii=False) + "\n"
+
+
+def _csv_lines(rows: Iterator[tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in chain([EXPORT_COLUMNS], rows):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+@router.get("/export")
+def export_transactions(
+    export_format: str = Query(default="ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    account_id: int | None = Query(default=None),
+    client: ClientPrincipal = Depends(get_current_active_principal),
+    db: Session = Depends(get_db),
+):
+    """Export complet de l'historique, diffusé ligne à ligne depuis un curseur serveur."""
+    account_ids = _client_account_ids(db, client.id, account_id)
+
+    def rows() -> Iterator[tuple]:
+        # La dependance get_db libere la session avant la fin du flux : le
+        # generateur reprend une connexion et la rend lui-meme en fin d'export.
+        try:
+            yield from TransactionService.export_rows(db, account_ids)
+        finally:
+            db.close()
+
+    if export_format == "csv":
+        return StreamingResponse(_csv_lines(rows()), media_type="text/csv", headers={"Content-Disposition": 'attachment; filename="transactions.csv"'})
+    return StreamingResponse(_ndjson_lines(rows()), media_type="application/x-ndjson")
 
 
 @router.get("/{transaction_id}")
-def get_transaction(transaction_id: int, client: Client = Depends(get_current_active_client), db: Session = Depends(get_db)):
+def get_transaction(transaction_id: int, client: ClientPrincipal = Depends(get_current_active_principal), db: Session = Depends(get_db)):
     transaction = db.get(Transaction, transaction_id)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction introuvable")
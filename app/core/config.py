@@ -16,6 +16,8 @@ class Settings(BaseSettings):
     PORT: int = 8000
 
     DATABASE_URL: str = "postgresql+psycopg2://profin:profin_dev@db:5432/profin_core"
+    # Vide : derivee de DATABASE_URL avec le pilote asyncpg.
+    ASYNC_DATABASE_URL: str | None = None
     DB_ECHO: bool = False
     DB_POOL_SIZE: int = 10
     DB_MAX_OVERFLOW: int = 10
@@ -27,6 +29,11 @@ class Settings(BaseSettings):
     # Durées adaptées au prototype local; elles restent configurables par environnement.
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 120
     REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    # Statut client mis en cache par requete authentifiee. Le commit qui change
+    # Client.status ou ClientAuthentication.is_active purge l'entree dans ce
+    # processus; les autres processus voient le changement au plus apres le TTL.
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 30.0
 
     ALLOWED_ORIGINS: str = "http://localhost:3000,http://localhost:5173"
     ALLOW_CREDENTIALS: bool = True
@@ -35,12 +42,54 @@ class Settings(BaseSettings):
     MAX_PAGE_SIZE: int = 100
     PROTOTYPE_AUTO_APPROVE_SUBSCRIPTIONS: bool = True
 
+    COUPON_BATCH_SIZE: int = 1000
+    TRANSACTION_EXPORT_BATCH_SIZE: int = 1000
+    MATURITY_BATCH_SIZE: int = 500
+
+    # Moteur de comptabilisation par compte pour l'execution des transactions
+    # (desactive : verrous de ligne directs). Ordres et souscriptions gardent
+    # toujours leurs verrous de ligne directs.
+    POSTING_ENGINE_ENABLED: bool = False
+    POSTING_ENGINE_SHARDS: int = 4
+    POSTING_ENGINE_MAX_BATCH: int = 200
+    POSTING_ENGINE_MAX_WAIT_MS: float = 2.0
+    POSTING_ENGINE_TIMEOUT_SECONDS: float = 30.0
+
+    # Journal d'audit : "outbox" (dans la transaction metier) ou "buffered" (COPY par lots).
+    AUDIT_MODE: str = "outbox"
+    AUDIT_QUEUE_SIZE: int = 10000
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL_MS: float = 200.0
+    AUDIT_ENQUEUE_TIMEOUT_MS: float = 50.0
+
+    REPORTING_CLIENT_BACKEND: str = "orm"
+    REPORTING_SNAPSHOT_MAX_STALENESS_SECONDS: int = 0
+    REPORTING_SNAPSHOT_REFRESH_SECONDS: int = 0
+
+    # Partitions mensuelles creees a l'avance et conservation (0 = pas de detachement).
+    PARTITION_PRECREATE_MONTHS: int = 3
+    PARTITION_RETENTION_MONTHS: int = 0
+
+    TMA_CACHE_SIZE: int = 10000
+    TMA_CACHE_TTL_SECONDS: float = 900.0
+
     AI_ENABLED: bool = True
     OPENROUTER_API_KEY: str | None = None
     OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
     OPENROUTER_MODEL: str = "google/gemini-2.5-flash-lite"
     OPENROUTER_TIMEOUT_SECONDS: float = 20.0
     OPENROUTER_MAX_TOKENS: int = 500
+    OPENROUTER_HTTP2: bool = True
+    OPENROUTER_MAX_CONNECTIONS: int = 50
+    OPENROUTER_KEEPALIVE_SECONDS: float = 60.0
+    ASSISTANT_CONTEXT_CACHE_SIZE: int = 5000
+    ASSISTANT_CONTEXT_CACHE_TTL_SECONDS: float = 300.0
+    ASSISTANT_RESPONSE_CACHE_SIZE: int = 2000
+    ASSISTANT_RESPONSE_CACHE_TTL_SECONDS: float = 600.0
+    # Budgets estimes localement (~3 caracteres par jeton).
+    ASSISTANT_CONTEXT_TOKEN_BUDGET: int = 1500
+    ASSISTANT_HISTORY_TOKEN_BUDGET: int = 800
+    ASSISTANT_CONTEXT_PREVIEW_ITEMS: int = 3
 
     @property
     def allowed_origins(self) -> list[str]:
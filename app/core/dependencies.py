@@ -1,10 +1,11 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.db.database import get_db
+from app.db.database import get_async_db, get_db
 from app.models.models import Client
-from app.services.auth_service import AuthService
+from app.services.auth_service import AuthService, ClientPrincipal
 
 
 bearer_scheme = HTTPBearer(auto_error=True)
@@ -24,3 +25,39 @@ def get_current_active_client(client: Client = Depends(get_current_client)) -> C
     if client.status != "ACTIF" or not client.auth or not client.auth.is_active:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Client suspendu ou fermé")
     return client
+
+
+def get_current_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: Session = Depends(get_db),
+) -> ClientPrincipal:
+    principal = AuthService.get_principal_from_access_token(db, credentials.credentials)
+    if principal is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Jeton d'accès invalide", headers={"WWW-Authenticate": "Bearer"})
+    return principal
+
+
+def _require_active(principal: ClientPrincipal) -> ClientPrincipal:
+    if principal.status != "ACTIF" or not principal.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Client suspendu ou fermé")
+    return principal
+
+
+def get_current_active_principal(principal: ClientPrincipal = Depends(get_current_principal)) -> ClientPrincipal:
+    """Variante sans chargement ORM pour les endpoints qui n'utilisent que ``client.id``."""
+    return _require_active(principal)
+
+
+async def get_async_current_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_async_db),
+) -> ClientPrincipal:
+    principal = await db.run_sync(AuthService.get_principal_from_access_token, credentials.credentials)
+    if principal is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Jeton d'accès invalide", headers={"WWW-Authenticate": "Bearer"})
+    return principal
+
+
+async def get_async_current_active_principal(principal: ClientPrincipal = Depends(get_async_current_principal)) -> ClientPrincipal:
+    """Meme controle que ``get_current_active_principal`` pour les endpoints async."""
+    return _require_active(principal)
@@ -1,10 +1,15 @@
-from collections.abc import Generator
+import asyncio
+from collections.abc import AsyncGenerator, Callable, Generator
+from typing import Any, TypeVar
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
 
 from app.core.config import settings
 
+T = TypeVar("T")
 
 connect_args = {"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {}
 engine_kwargs = {
@@ -24,6 +29,41 @@ engine = create_engine(settings.DATABASE_URL, **engine_kwargs)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
 
 
+def async_database_url(url: str) -> str:
+    """Derive l'URL asyncpg de l'URL psycopg2 pour partager la meme base."""
+    if url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url.removeprefix("postgresql+psycopg2://")
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url.removeprefix("postgresql://")
+    return url
+
+
+def has_async_driver(url: str) -> bool:
+    return make_url(url).get_dialect().is_async
+
+
+# Les endpoints de lecture async s'executent sur la boucle d'evenements : leur
+# concurrence est bornee par le pool, pas par le threadpool Starlette. Sans
+# pilote async (SQLite, par exemple), ils passent par la session synchrone.
+ASYNC_URL = settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL)
+async_engine = (
+    create_async_engine(ASYNC_URL, **{key: value for key, value in engine_kwargs.items() if key != "connect_args"})
+    if has_async_driver(ASYNC_URL)
+    else None
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False) if async_engine else None
+
+
+class ThreadedSession:
+    """Remplace ``AsyncSession`` sans pilote async : ``run_sync`` s'execute dans un thread."""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    async def run_sync(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return await asyncio.to_thread(fn, self.session, *args, **kwargs)
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -34,3 +74,15 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    if AsyncSessionLocal is None:
+        db = SessionLocal()
+        try:
+            yield ThreadedSession(db)
+        finally:
+            db.close()
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,153 @@
+"""Partitionnement mensuel natif (RANGE sur ``created_at``) des tables en ajout seul.
+
+Une cle primaire d'une table partitionnee doit contenir la cle de partition :
+elle devient ``(id, created_at)``. Une cle etrangere ne peut donc plus viser
+``transactions(id)`` seul; ces references sont supprimees et l'integrite reste
+portee par les services, qui ne suppriment jamais de transaction. Les modeles
+ORM gardent ``id`` comme identite et decrivent toujours ces relations.
+
+Les bornes de partition sont exprimees en UTC. Une partition ``DEFAULT``
+recoit les lignes hors plage si la maintenance n'a pas cree le mois a temps.
+"""
+
+import re
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import Connection, Table, text
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import AddConstraint, CreateIndex
+
+from app.db.database import Base
+from app.models import models
+
+PARTITIONED_TABLES: dict[str, Table] = {
+    "transactions": models.Transaction.__table__,
+    "accounting_entries": models.AccountingEntry.__table__,
+    "audit_logs": models.AuditLog.__table__,
+}
+
+
+def _next_month(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def _bounds(month: date) -> tuple[str, str]:
+    return f"{month.isoformat()} 00:00:00+00", f"{_next_month(month).isoformat()} 00:00:00+00"
+
+
+def create_partition_sql(table: str, month: date) -> str:
+    start, end = _bounds(month)
+    return f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} FOR VALUES FROM ('{start}') TO ('{end}')"
+
+
+def create_partition(bind: Connection | Session, table: str, month: date) -> int:
+    """Cree la partition de ``month`` et y deplace les lignes deja tombees dans ``DEFAULT``.
+
+    PostgreSQL refuse la creation si ``DEFAULT`` contient des lignes du mois :
+    dans la transaction de l'appelant, ``DEFAULT`` est detachee, la partition
+    creee, les lignes deplacees, puis ``DEFAULT`` rattachee. Retourne le nombre
+    de lignes deplacees.
+    """
+    default = f"{table}_default"
+    start, end = _bounds(month)
+    attached = bind.scalar(
+        text("SELECT EXISTS (SELECT 1 FROM pg_inherits WHERE inhparent = to_regclass(:table) AND inhrelid = to_regclass(:default))"),
+        {"table": table, "default": default},
+    )
+    in_range = f"created_at >= '{start}' AND created_at < '{end}'"
+    if not attached or not bind.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_range})")):
+        bind.execute(text(create_partition_sql(table, month)))
+        return 0
+    bind.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    bind.execute(text(create_partition_sql(table, month)))
+    moved = bind.execute(text(f"INSERT INTO {partition_name(table, month)} SELECT * FROM {default} WHERE {in_range}")).rowcount
+    bind.execute(text(f"DELETE FROM {default} WHERE {in_range}"))
+    bind.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+    return moved
+
+
+def is_partitioned(bind: Connection | Session, table: str) -> bool:
+    return bool(bind.scalar(text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"), {"table": table}))
+
+
+def monthly_partitions(bind: Connection | Session, table: str) -> dict[date, str]:
+    """Partitions mensuelles attachees a ``table``, par premier jour du mois."""
+    pattern = re.compile(rf"^{re.escape(table)}_(\d{{4}})_(\d{{2}})$")
+    names = bind.scalars(text("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(:table)"), {"table": table})
+    partitions = {}
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def partition_table(bind: Connection | Session, table: str, months_ahead: int) -> None:
+    """Convertit ``table`` en table partitionnee par mois, donnees comprises.
+
+    Les partitions couvrent le mois de la plus ancienne ligne jusqu'a
+    ``months_ahead`` mois apres le mois courant.
+    """
+    model = PARTITIONED_TABLES[table]
+    legacy = f"{table}_unpartitioned"
+    references = bind.execute(
+        text("SELECT conrelid::regclass::text, conname FROM pg_constraint WHERE contype = 'f' AND confrelid = to_regclass(:table)"),
+        {"table": table},
+    ).all()
+    for referencing, constraint in references:
+        bind.execute(text(f'ALTER TABLE {referencing} DROP CONSTRAINT "{constraint}"'))
+    sequence = bind.scalar(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table})
+
+    bind.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    bind.execute(text(f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (created_at)"))
+    bind.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, created_at)"))
+    oldest = bind.scalar(text(f"SELECT min(created_at) FROM {legacy}"))
+    current = datetime.now(timezone.utc).date().replace(day=1)
+    month = min(oldest.astimezone(timezone.utc).date().replace(day=1), current) if oldest else current
+    for _ in range(months_ahead):
+        current = _next_month(current)
+    while month <= current:
+        bind.execute(text(create_partition_sql(table, month)))
+        month = _next_month(month)
+    bind.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+
+    bind.execute(text(f"INSERT INTO {table} SELECT * FROM {legacy}"))
+    if sequence:
+        bind.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+    bind.execute(text(f"DROP TABLE {legacy}"))
+    for index in model.indexes:
+        bind.execute(CreateIndex(index))
+    for constraint in model.foreign_key_constraints:
+        if constraint.referred_table.name not in PARTITIONED_TABLES:
+            bind.execute(AddConstraint(constraint))
+
+
+def unpartition_table(bind: Connection | Session, table: str) -> None:
+    """Inverse de ``partition_table`` pour les partitions encore attachees."""
+    model = PARTITIONED_TABLES[table]
+    partitioned = f"{table}_partitioned"
+    sequence = bind.scalar(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table})
+    bind.execute(text(f"ALTER TABLE {table} RENAME TO {partitioned}"))
+    bind.execute(text(f"CREATE TABLE {table} (LIKE {partitioned} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    bind.execute(text(f"INSERT INTO {table} SELECT * FROM {partitioned}"))
+    if sequence:
+        bind.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+    bind.execute(text(f"DROP TABLE {partitioned}"))
+    bind.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id)"))
+    for index in model.indexes:
+        bind.execute(CreateIndex(index))
+    for constraint in model.foreign_key_constraints:
+        if constraint.referred_table.name not in PARTITIONED_TABLES:
+            bind.execute(AddConstraint(constraint))
+
+
+def restore_references(bind: Connection | Session) -> None:
+    """Recree les cles etrangeres vers les tables partitionnees, une fois toutes reconverties."""
+    for model_table in Base.metadata.sorted_tables:
+        for constraint in model_table.foreign_key_constraints:
+            if constraint.referred_table.name in PARTITIONED_TABLES:
+                bind.execute(AddConstraint(constraint))
@@ -5,27 +5,7 @@ coeur transactionnel et servent uniquement les dashboards et les extractions
 opérationnelles.
 """
 
-REPORTING_OBJECTS = (
-    """
-    CREATE OR REPLACE FUNCTION profin_order_next_step(p_order_id INTEGER)
-    RETURNS TEXT
-    LANGUAGE SQL
-    STABLE
-    AS $$
-        SELECT step_code
-        FROM order_workflow_steps
-        WHERE order_id = p_order_id AND status = 'PENDING'
-        ORDER BY CASE step_code
-            WHEN 'CONFORMITE' THEN 1
-            WHEN 'BACK_OFFICE' THEN 2
-            WHEN 'CHECKER' THEN 3
-            ELSE 99
-        END
-        LIMIT 1
-    $$;
-    """,
-    """
-    CREATE OR REPLACE VIEW vw_reporting_client_positions AS
+CLIENT_POSITIONS_SQL = """
     SELECT
         ar.client_id,
         a.id AS account_id,
@@ -48,16 +28,17 @@ REPORTING_OBJECTS = (
         s.effective_maturity_date,
         s.status,
         s.fee_amount,
-        i.entry_fee_rate
+        i.entry_fee_rate,
+        i.currency AS instrument_currency
     FROM account_roles ar
     JOIN accounts a ON a.id = ar.account_id
     JOIN subscriptions s ON s.account_id = a.id
     JOIN instruments i ON i.id = s.instrument_id
     LEFT JOIN instrument_types it ON it.id = i.instrument_type_id
-    WHERE ar.is_active = TRUE AND s.status = 'ACTIVE';
-    """,
-    """
-    CREATE OR REPLACE VIEW vw_reporting_order_pipeline AS
+    WHERE ar.is_active = TRUE AND s.status = 'ACTIVE'
+"""
+
+ORDER_PIPELINE_SQL = """
     SELECT
         io.id AS order_id,
         io.client_id,
@@ -74,13 +55,32 @@ REPORTING_OBJECTS = (
         io.created_at,
         io.updated_at,
         GREATEST(CURRENT_DATE - io.created_at::date, 0) AS age_days,
-        profin_order_next_step(io.id) AS next_step
+        ns.step_code::TEXT AS next_step
     FROM investment_orders io
     JOIN accounts a ON a.id = io.account_id
-    JOIN instruments i ON i.id = io.instrument_id;
-    """,
-    """
-    CREATE OR REPLACE VIEW vw_reporting_transaction_queue AS
+    JOIN instruments i ON i.id = io.instrument_id
+    LEFT JOIN (
+        SELECT DISTINCT ON (order_id) order_id, step_code
+        FROM order_workflow_steps
+        WHERE status = 'PENDING'
+        ORDER BY order_id, CASE step_code
+            WHEN 'CONFORMITE' THEN 1
+            WHEN 'BACK_OFFICE' THEN 2
+            WHEN 'CHECKER' THEN 3
+            ELSE 99
+        END
+    ) ns ON ns.order_id = io.id
+"""
+
+# Definition historique (un appel de fonction par ordre), conservee pour le
+# downgrade de la revision qui introduit la resolution ensembliste.
+ORDER_PIPELINE_PER_ROW_SQL = ORDER_PIPELINE_SQL[: ORDER_PIPELINE_SQL.index("        ns.step_code")] + """        profin_order_next_step(io.id) AS next_step
+    FROM investment_orders io
+    JOIN accounts a ON a.id = io.account_id
+    JOIN instruments i ON i.id = io.instrument_id
+"""
+
+TRANSACTION_QUEUE_SQL = """
     SELECT DISTINCT
         t.id AS transaction_id,
         t.transaction_type,
@@ -98,7 +98,66 @@ REPORTING_OBJECTS = (
     FROM transactions t
     LEFT JOIN accounts src ON src.id = t.source_account_id
     LEFT JOIN accounts dst ON dst.id = t.destination_account_id
-    WHERE t.status = 'PENDING_APPROVAL';
+    WHERE t.status = 'PENDING_APPROVAL'
+"""
+
+REPORTING_OBJECTS = (
+    """
+    CREATE OR REPLACE FUNCTION profin_order_next_step(p_order_id INTEGER)
+    RETURNS TEXT
+    LANGUAGE SQL
+    STABLE
+    AS $$
+        SELECT step_code
+        FROM order_workflow_steps
+        WHERE order_id = p_order_id AND status = 'PENDING'
+        ORDER BY CASE step_code
+            WHEN 'CONFORMITE' THEN 1
+            WHEN 'BACK_OFFICE' THEN 2
+            WHEN 'CHECKER' THEN 3
+            ELSE 99
+        END
+        LIMIT 1
+    $$;
+    """,
+    f"CREATE OR REPLACE VIEW vw_reporting_client_positions AS {CLIENT_POSITIONS_SQL};",
+    f"CREATE OR REPLACE VIEW vw_reporting_order_pipeline AS {ORDER_PIPELINE_SQL};",
+    f"CREATE OR REPLACE VIEW vw_reporting_transaction_queue AS {TRANSACTION_QUEUE_SQL};",
+)
+
+# Instantanes materialises des memes projections. Chaque vue porte un index
+# unique, condition de REFRESH MATERIALIZED VIEW CONCURRENTLY, et la table de
+# suivi date le dernier rafraichissement pour mesurer la fraicheur.
+SNAPSHOT_VIEWS = (
+    "mv_reporting_client_positions",
+    "mv_reporting_order_pipeline",
+)
+
+
+def _order_pipeline_snapshot_sql(select_sql: str) -> tuple[str, ...]:
+    return (
+        f"CREATE MATERIALIZED VIEW IF NOT EXISTS mv_reporting_order_pipeline AS {select_sql} WITH DATA",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_reporting_order_pipeline ON mv_reporting_order_pipeline (order_id)",
+        "CREATE INDEX IF NOT EXISTS ix_mv_reporting_order_pipeline_account_status ON mv_reporting_order_pipeline (account_id, status)",
+    )
+
+
+REPORTING_SNAPSHOT_OBJECTS = (
+    f"CREATE MATERIALIZED VIEW IF NOT EXISTS mv_reporting_client_positions AS {CLIENT_POSITIONS_SQL} WITH DATA",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_reporting_client_positions ON mv_reporting_client_positions (client_id, subscription_id)",
+    "CREATE INDEX IF NOT EXISTS ix_mv_reporting_client_positions_account ON mv_reporting_client_positions (account_id)",
+    *_order_pipeline_snapshot_sql(ORDER_PIPELINE_SQL),
+    """
+    CREATE TABLE IF NOT EXISTS reporting_snapshot_refreshes (
+        view_name TEXT PRIMARY KEY,
+        refreshed_at TIMESTAMPTZ NOT NULL,
+        duration_ms INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    INSERT INTO reporting_snapshot_refreshes (view_name, refreshed_at)
+    VALUES ('mv_reporting_client_positions', now()), ('mv_reporting_order_pipeline', now())
+    ON CONFLICT (view_name) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at
     """,
 )
 
@@ -110,3 +169,36 @@ def reporting_objects_down_sql() -> tuple[str, ...]:
         "DROP VIEW IF EXISTS vw_reporting_client_positions",
         "DROP FUNCTION IF EXISTS profin_order_next_step(INTEGER)",
     )
+
+
+def reporting_snapshots_down_sql() -> tuple[str, ...]:
+    return (
+        "DROP TABLE IF EXISTS reporting_snapshot_refreshes",
+        "DROP MATERIALIZED VIEW IF EXISTS mv_reporting_order_pipeline",
+        "DROP MATERIALIZED VIEW IF EXISTS mv_reporting_client_positions",
+    )
+
+
+# Resolution ensembliste de l'etape suivante : l'index partiel ne couvre que
+# les etapes en attente lues par le DISTINCT ON de la vue pipeline.
+ORDER_PIPELINE_STEP_INDEX = (
+    "CREATE INDEX IF NOT EXISTS ix_order_workflow_steps_pending ON order_workflow_steps (order_id) WHERE status = 'PENDING'"
+)
+
+
+def order_pipeline_set_based_sql() -> tuple[str, ...]:
+    return (
+        ORDER_PIPELINE_STEP_INDEX,
+        f"CREATE OR REPLACE VIEW vw_reporting_order_pipeline AS {ORDER_PIPELINE_SQL}",
+        "DROP MATERIALIZED VIEW IF EXISTS mv_reporting_order_pipeline",
+        *_order_pipeline_snapshot_sql(ORDER_PIPELINE_SQL),
+    )
+
+
+def order_pipeline_set_based_down_sql() -> tuple[str, ...]:
+    return (
+        f"CREATE OR REPLACE VIEW vw_reporting_order_pipeline AS {ORDER_PIPELINE_PER_ROW_SQL}",
+        "DROP MATERIALIZED VIEW IF EXISTS mv_reporting_order_pipeline",
+        *_order_pipeline_snapshot_sql(ORDER_PIPELINE_PER_ROW_SQL),
+        "DROP INDEX IF EXISTS ix_order_workflow_steps_pending",
+    )
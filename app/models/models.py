@@ -7,7 +7,7 @@ Les noms SQL sont en snake_case pour rester portables entre PostgreSQL, SQLite
 from datetime import date, datetime
 from decimal import Decimal
 
-from sqlalchemy import Boolean, Date, DateTime, ForeignKey, Index, Integer, Numeric, String, Text, UniqueConstraint
+from sqlalchemy import Boolean, Date, DateTime, ForeignKey, Index, Integer, Numeric, String, Text, UniqueConstraint, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
@@ -228,6 +228,7 @@ class Transaction(Base):
     __table_args__ = (
         Index("ix_transactions_source_created", "source_account_id", "created_at"),
         Index("ix_transactions_destination_created", "destination_account_id", "created_at"),
+        Index("ix_transactions_executed", "executed_at"),
     )
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -295,7 +296,10 @@ class OrderWorkflowStep(Base):
     """Étapes internes simulées dans le prototype, sans connecteur externe."""
 
     __tablename__ = "order_workflow_steps"
-    __table_args__ = (UniqueConstraint("order_id", "step_code", name="uq_order_workflow_step"),)
+    __table_args__ = (
+        UniqueConstraint("order_id", "step_code", name="uq_order_workflow_step"),
+        Index("ix_order_workflow_steps_pending", "order_id", postgresql_where=text("status = 'PENDING'")),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     order_id: Mapped[int] = mapped_column(ForeignKey("investment_orders.id", ondelete="CASCADE"), nullable=False)
@@ -330,3 +334,92 @@ class AuditLog(Base):
     entity_id: Mapped[str | None] = mapped_column(String(80))
     metadata_json: Mapped[str | None] = mapped_column(Text)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class BatchCheckpoint(Base):
+    """Point de reprise des traitements de masse committés par page."""
+
+    __tablename__ = "batch_checkpoints"
+    __table_args__ = (UniqueConstraint("job_name", "run_key", name="uq_batch_checkpoint_run"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    job_name: Mapped[str] = mapped_column(String(80), nullable=False)
+    run_key: Mapped[str] = mapped_column(String(120), nullable=False)
+    last_id: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    processed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    status: Mapped[str] = mapped_column(String(20), default="RUNNING", nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+class LedgerBalance(Base):
+    """Projection des ecritures comptables cumulees par compte du grand livre et devise."""
+
+    __tablename__ = "ledger_balances"
+
+    account_code: Mapped[str] = mapped_column(String(30), primary_key=True)
+    currency: Mapped[str] = mapped_column(String(3), primary_key=True)
+    debit_total: Mapped[Decimal] = mapped_column(Numeric(18, 2), default=0, server_default="0", nullable=False)
+    credit_total: Mapped[Decimal] = mapped_column(Numeric(18, 2), default=0, server_default="0", nullable=False)
+    entry_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+class LedgerArchivedTotal(Base):
+    """Cumuls des ecritures d'une partition detachee, par compte du grand livre et devise."""
+
+    __tablename__ = "ledger_archived_totals"
+
+    partition_name: Mapped[str] = mapped_column(String(63), primary_key=True)
+    account_code: Mapped[str] = mapped_column(String(30), primary_key=True)
+    currency: Mapped[str] = mapped_column(String(3), primary_key=True)
+    debit_total: Mapped[Decimal] = mapped_column(Numeric(18, 2), default=0, server_default="0", nullable=False)
+    credit_total: Mapped[Decimal] = mapped_column(Numeric(18, 2), default=0, server_default="0", nullable=False)
+    entry_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    balance_effect: Mapped[Decimal] = mapped_column(Numeric(18, 2), default=0, server_default="0", nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class AccountBalanceSnapshot(Base):
+    """Solde d'un compte a la cloture d'un mois (``month`` = premier jour du mois)."""
+
+    __tablename__ = "account_balance_snapshots"
+
+    account_id: Mapped[int] = mapped_column(ForeignKey("accounts.id", ondelete="CASCADE"), primary_key=True)
+    month: Mapped[date] = mapped_column(Date, primary_key=True)
+    currency: Mapped[str] = mapped_column(String(3), nullable=False)
+    balance: Mapped[Decimal] = mapped_column(Numeric(18, 2), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class SubscriptionValueSnapshot(Base):
+    """Valeur d'une souscription vivante a la cloture d'un mois."""
+
+    __tablename__ = "subscription_value_snapshots"
+    __table_args__ = (Index("ix_subscription_value_snapshots_account_month", "account_id", "month"),)
+
+    subscription_id: Mapped[int] = mapped_column(ForeignKey("subscriptions.id", ondelete="CASCADE"), primary_key=True)
+    month: Mapped[date] = mapped_column(Date, primary_key=True)
+    account_id: Mapped[int] = mapped_column(ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False)
+    currency: Mapped[str] = mapped_column(String(3), nullable=False)
+    invested_amount: Mapped[Decimal] = mapped_column(Numeric(18, 2), nullable=False)
+    current_value: Mapped[Decimal] = mapped_column(Numeric(18, 2), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class MonthlyTransactionFlow(Base):
+    """Cumul mensuel des transactions executees par couple de comptes, devise et type."""
+
+    __tablename__ = "monthly_transaction_flows"
+    __table_args__ = (
+        Index("ix_monthly_transaction_flows_source_month", "source_account_id", "month"),
+        Index("ix_monthly_transaction_flows_destination_month", "destination_account_id", "month"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    month: Mapped[date] = mapped_column(Date, nullable=False)
+    source_account_id: Mapped[int | None] = mapped_column(ForeignKey("accounts.id", ondelete="CASCADE"))
+    destination_account_id: Mapped[int | None] = mapped_column(ForeignKey("accounts.id", ondelete="CASCADE"))
+    currency: Mapped[str] = mapped_column(String(3), nullable=False)
+    transaction_type: Mapped[str] = mapped_column(String(40), nullable=False)
+    amount: Mapped[Decimal] = mapped_column(Numeric(18, 2), nullable=False)
+    transaction_count: Mapped[int] = mapped_column(Integer, nullable=False)
@@ -211,6 +211,10 @@ class TransactionCreate(APIModel):
     description: str | None = None
 
 
+class TransactionApproveBatch(APIModel):
+    transaction_ids: list[int] = Field(min_length=1, max_length=500)
+
+
 class TransactionReject(APIModel):
     reason: str = Field(min_length=3, max_length=500)
 
@@ -1,12 +1,21 @@
+import asyncio
+import hashlib
+import json
 import logging
-from time import monotonic
+from collections import Counter
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass
+from time import monotonic, perf_counter
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.ai.client import AICompletion, AIProviderError, AIUnavailableError, OpenRouterClient
-from app.ai.context import build_client_context
+from app.ai.context import client_context
+from app.ai.intents import normalize_message
+from app.ai.local_answers import LocalAnswer, answer_locally
 from app.ai.prompt import CONTEXT_USED, DISCLAIMER, build_messages
 from app.core.config import settings
+from app.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 POLICY_REFUSAL = "Je peux expliquer vos données et le parcours métier, mais je ne peux pas accéder à des secrets, produire du SQL ou approuver, rejeter ou exécuter une opération financière."
@@ -37,17 +46,185 @@ def _requires_policy_refusal(message: str) -> bool:
     )
 
 
+@dataclass(frozen=True, slots=True)
+class CachedAnswer:
+    completion: AICompletion
+    provider_ms: int
+
+
+class ResponseCache:
+    """Reponses du fournisseur par (question normalisee, historique, empreinte du contexte).
+
+    Le contexte etant dans la cle, toute modification des donnees du client
+    donne une nouvelle cle. Les demandes identiques en vol attendent le meme
+    appel au fournisseur au lieu d'en lancer un chacune. L'appel tourne dans
+    une tache partagee : l'annulation de la demande qui l'a lance
+    n'interrompt pas les autres.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.entries = TTLCache(maxsize, ttl_seconds)
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.saved_ms = 0
+
+    @staticmethod
+    def key(message: str, history: list[dict[str, str]], context_digest: str) -> str:
+        turns = [(item.get("role"), normalize_message(item.get("content") or "")) for item in history[-8:]]
+        material = json.dumps([settings.OPENROUTER_MODEL, context_digest, turns, normalize_message(message)], ensure_ascii=False)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def cached(self, key: str) -> CachedAnswer | None:
+        answer = self.entries.get(key)
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.saved_ms += answer.provider_ms
+        return answer
+
+    def store(self, key: str, completion: AICompletion, provider_ms: int) -> None:
+        self.entries.set(key, CachedAnswer(completion, provider_ms))
+
+    async def _complete(self, key: str, produce: Callable[[], Awaitable[AICompletion]]) -> CachedAnswer:
+        started = monotonic()
+        try:
+            completion = await produce()
+        finally:
+            self._inflight.pop(key, None)
+        answer = CachedAnswer(completion, round((monotonic() - started) * 1000))
+        self.entries.set(key, answer)
+        return answer
+
+    async def get_or_complete(self, key: str, produce: Callable[[], Awaitable[AICompletion]]) -> tuple[AICompletion, str]:
+        """Retourne la reponse et son origine : ``hit``, ``coalesced`` ou ``miss`` (appel au fournisseur)."""
+        answer = self.entries.get(key)
+        if answer is not None:
+            self.hits += 1
+            self.saved_ms += answer.provider_ms
+            return answer.completion, "hit"
+        task = self._inflight.get(key)
+        if task is not None:
+            answer = await asyncio.shield(task)
+            self.coalesced += 1
+            self.saved_ms += answer.provider_ms
+            return answer.completion, "coalesced"
+
+        self.misses += 1
+        task = asyncio.ensure_future(self._complete(key, produce))
+        # Marque l'exception comme lue si plus aucune demande n'attend la tache.
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._inflight[key] = task
+        answer = await asyncio.shield(task)
+        return answer.completion, "miss"
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        served = self.hits + self.coalesced
+        total = served + self.misses
+        return {
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_ratio": round(served / total, 3) if total else 0.0,
+            "saved_ms": self.saved_ms,
+        }
+
+
+response_cache = ResponseCache(settings.ASSISTANT_RESPONSE_CACHE_SIZE, settings.ASSISTANT_RESPONSE_CACHE_TTL_SECONDS)
+# Origine des reponses : ``policy``, ``local`` et ``cache`` evitent le fournisseur, ``provider`` l'appelle.
+request_counts: Counter[str] = Counter()
+
+
+def assistant_stats() -> dict:
+    avoided = request_counts["policy"] + request_counts["local"] + request_counts["cache"]
+    total = avoided + request_counts["provider"]
+    return {
+        "requests": total,
+        "avoided_provider": avoided,
+        "avoided_ratio": round(avoided / total, 3) if total else 0.0,
+        "by_origin": {origin: request_counts[origin] for origin in ("policy", "local", "cache", "provider")},
+        "response_cache": response_cache.stats(),
+    }
+
+
+def _local_answer(client_id: int, message: str, context: dict) -> LocalAnswer | None:
+    started = perf_counter()
+    answer = answer_locally(message, context)
+    if answer is not None:
+        request_counts["local"] += 1
+        logger.info(
+            "assistant_local_answer client_id=%s intent=%s duration_us=%s avoided_provider=%s",
+            client_id,
+            answer.intent,
+            round((perf_counter() - started) * 1_000_000),
+            assistant_stats()["avoided_provider"],
+        )
+    return answer
+
+
+async def _single(content: str) -> AsyncIterator[str]:
+    yield content
+
+
+async def _timed_stream(client_id: int, tokens: AsyncIterator[str], cache_key: str) -> AsyncIterator[str]:
+    """Relaie les fragments en journalisant le delai du premier fragment et la duree totale.
+
+    Une reponse relayee jusqu'au bout est mise en cache pour les demandes suivantes.
+    """
+    started = monotonic()
+    first_token_ms = None
+    parts = []
+    try:
+        async for token in tokens:
+            if first_token_ms is None:
+                first_token_ms = round((monotonic() - started) * 1000)
+            parts.append(token)
+            yield token
+    except (AIUnavailableError, AIProviderError):
+        logger.info(
+            "assistant_unavailable client_id=%s model=%s duration_ms=%s streamed_chunks=%s",
+            client_id,
+            settings.OPENROUTER_MODEL,
+            round((monotonic() - started) * 1000),
+            len(parts),
+        )
+        raise
+    duration_ms = round((monotonic() - started) * 1000)
+    response_cache.store(cache_key, AICompletion(content="".join(parts).strip(), model=settings.OPENROUTER_MODEL, usage={}), duration_ms)
+    logger.info(
+        "assistant_streamed client_id=%s model=%s first_token_ms=%s duration_ms=%s chunks=%s",
+        client_id,
+        settings.OPENROUTER_MODEL,
+        first_token_ms,
+        duration_ms,
+        len(parts),
+    )
+
+
 class AssistantService:
     @staticmethod
-    def chat(db: Session, client_id: int, message: str, history: list[dict[str, str]]) -> tuple[AICompletion, list[str]]:
-        context = build_client_context(db, client_id)
+    async def chat(db: AsyncSession, client_id: int, message: str, history: list[dict[str, str]]) -> tuple[AICompletion, list[str]]:
         if _requires_policy_refusal(message):
+            request_counts["policy"] += 1
             logger.info("assistant_policy_refusal client_id=%s", client_id)
             return AICompletion(content=POLICY_REFUSAL, model="policy", usage={}), CONTEXT_USED
+        context = await db.run_sync(client_context, client_id)
+        local = _local_answer(client_id, message, context.data)
+        if local is not None:
+            return AICompletion(content=local.content, model="local", usage={}), CONTEXT_USED
         started = monotonic()
         try:
-            completion = OpenRouterClient(settings).complete(build_messages(message, history, context))
+            completion, cache_outcome = await response_cache.get_or_complete(
+                ResponseCache.key(message, history, context.digest),
+                lambda: OpenRouterClient(settings).complete(build_messages(message, history, context)),
+            )
         except (AIUnavailableError, AIProviderError):
+            request_counts["provider"] += 1
             logger.info(
                 "assistant_unavailable client_id=%s model=%s duration_ms=%s",
                 client_id,
@@ -56,15 +233,43 @@ class AssistantService:
             )
             raise
 
+        request_counts["provider" if cache_outcome == "miss" else "cache"] += 1
+        cache = response_cache.stats()
         logger.info(
-            "assistant_completed client_id=%s model=%s duration_ms=%s prompt_tokens=%s completion_tokens=%s",
+            "assistant_completed client_id=%s model=%s duration_ms=%s prompt_tokens=%s completion_tokens=%s cache=%s cache_hit_ratio=%s cache_saved_ms=%s",
             client_id,
             completion.model,
             round((monotonic() - started) * 1000),
             completion.usage.get("prompt_tokens"),
             completion.usage.get("completion_tokens"),
+            cache_outcome,
+            cache["hit_ratio"],
+            cache["saved_ms"],
         )
         return completion, CONTEXT_USED
 
+    @staticmethod
+    async def stream(db: AsyncSession, client_id: int, message: str, history: list[dict[str, str]]) -> tuple[AsyncIterator[str], list[str]]:
+        """Meme parcours que ``chat``, mais la reponse est relayee fragment par fragment.
+
+        Toutes les lectures en base sont faites avant le retour : le flux ne
+        depend plus de la session.
+        """
+        if _requires_policy_refusal(message):
+            request_counts["policy"] += 1
+            logger.info("assistant_policy_refusal client_id=%s", client_id)
+            return _single(POLICY_REFUSAL), CONTEXT_USED
+        context = await db.run_sync(client_context, client_id)
+        local = _local_answer(client_id, message, context.data)
+        if local is not None:
+            return _single(local.content), CONTEXT_USED
+        key = ResponseCache.key(message, history, context.digest)
+        cached = response_cache.cached(key)
+        request_counts["provider" if cached is None else "cache"] += 1
+        if cached is not None:
+            logger.info("assistant_streamed client_id=%s model=%s cache=hit cache_saved_ms=%s", client_id, cached.completion.model, cached.provider_ms)
+            return _single(cached.completion.content), CONTEXT_USED
+        return _timed_stream(client_id, OpenRouterClient(settings).stream(build_messages(message, history, context)), key), CONTEXT_USED
+
 
-__all__ = ["AssistantService", "DISCLAIMER"]
+__all__ = ["AssistantService", "DISCLAIMER", "assistant_stats"]
@@ -0,0 +1,234 @@
+"""Journal d'audit : ecriture transactionnelle (outbox) ou differee par lots.
+
+En mode ``outbox`` (defaut), ``audit()`` ajoute la ligne ``audit_logs`` a la
+transaction metier : l'evenement est commite avec l'action ou pas du tout.
+
+En mode ``buffered``, les evenements sont gardes sur la session jusqu'au
+commit, puis confies a ``AuditWriter`` : une file bornee videe par un thread
+qui ecrit par lots avec ``COPY``. Un rollback abandonne les evenements non
+commites; le rollback d'un savepoint, ceux ajoutes depuis le savepoint. File
+pleine, l'appelant ecrit lui-meme son lot (contre-pression); ``stop()``
+vide la file. Un arret brutal du processus peut perdre les evenements en
+file : c'est le compromis de ce mode.
+"""
+
+import csv
+import io
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from time import monotonic
+
+from sqlalchemy import Engine, event, insert
+from sqlalchemy.orm import Session
+
+from app.models.models import AuditLog
+
+logger = logging.getLogger(__name__)
+PENDING_AUDIT_KEY = "pending_audit_events"
+SAVEPOINT_MARKS_KEY = "audit_savepoint_marks"
+COPY_SQL = "COPY audit_logs (client_id, action, entity_type, entity_id, metadata_json, created_at) FROM STDIN WITH (FORMAT csv)"
+_STOP = object()
+
+
+@dataclass(slots=True)
+class AuditEvent:
+    client_id: int | None
+    action: str
+    entity_type: str
+    entity_id: str | None
+    metadata: dict | None = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    def row(self) -> dict:
+        return {
+            "client_id": self.client_id,
+            "action": self.action,
+            "entity_type": self.entity_type,
+            "entity_id": self.entity_id,
+            "metadata_json": json.dumps(self.metadata or {}, default=str),
+            "created_at": self.created_at,
+        }
+
+
+def copy_audit_events(engine: Engine, events: list[AuditEvent]) -> None:
+    """Insere les evenements en un seul ``COPY ... FROM STDIN``."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for item in events:
+        row = item.row()
+        writer.writerow([row["client_id"], row["action"], row["entity_type"], row["entity_id"], row["metadata_json"], row["created_at"].isoformat()])
+    buffer.seek(0)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.copy_expert(COPY_SQL, buffer)
+        finally:
+            cursor.close()
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+class AuditWriter:
+    def __init__(self, engine: Engine, max_queue: int = 10000, batch_size: int = 500, flush_interval_seconds: float = 0.2, enqueue_timeout_seconds: float = 0.05):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.enqueue_timeout_seconds = enqueue_timeout_seconds
+        self._queue: Queue = Queue(maxsize=max_queue)
+        self._thread: Thread | None = None
+        self._stats_lock = Lock()
+        self.written = 0
+        self.batches = 0
+        self.synchronous = 0
+        self.lost = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._thread = Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = 10.0) -> None:
+        """Vide la file puis arrete le thread."""
+        if not self._thread:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def flush(self) -> None:
+        """Attend que tous les evenements en file soient ecrits."""
+        self._queue.join()
+
+    def submit(self, events: list[AuditEvent]) -> None:
+        """Met en file; au-dela du delai d'attente, le reste est ecrit par l'appelant."""
+        overflow = events if not self.running else []
+        if self.running:
+            for index, item in enumerate(events):
+                try:
+                    self._queue.put(item, timeout=self.enqueue_timeout_seconds)
+                except Full:
+                    overflow = events[index:]
+                    break
+        if overflow:
+            with self._stats_lock:
+                self.synchronous += len(overflow)
+            self._write(overflow)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"queued": self._queue.qsize(), "written": self.written, "batches": self.batches, "synchronous": self.synchronous, "lost": self.lost}
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                self._queue.task_done()
+                return
+            batch, stopping = [first], False
+            deadline = monotonic() + self.flush_interval_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - monotonic()))
+                except Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            for _ in range(len(batch) + stopping):
+                self._queue.task_done()
+            if stopping:
+                return
+
+    def _write(self, events: list[AuditEvent]) -> None:
+        try:
+            copy_audit_events(self.engine, events)
+        except Exception:
+            logger.exception("audit_copy_failed size=%s", len(events))
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(insert(AuditLog), [item.row() for item in events])
+            except Exception:
+                logger.exception("audit_events_lost size=%s", len(events))
+                with self._stats_lock:
+                    self.lost += len(events)
+                return
+        with self._stats_lock:
+            self.written += len(events)
+            self.batches += 1
+
+
+_writer: AuditWriter | None = None
+
+
+def current_audit_writer() -> AuditWriter | None:
+    return _writer
+
+
+def install_audit_writer(writer: AuditWriter | None) -> AuditWriter | None:
+    """Installe (ou retire avec None) l'ecrivain differe; retourne le precedent."""
+    global _writer
+    previous, _writer = _writer, writer
+    return previous
+
+
+def record_audit(db: Session, events: list[AuditEvent]) -> None:
+    """Ecrit les evenements dans la transaction (outbox) ou les garde jusqu'au commit."""
+    if not events:
+        return
+    if _writer is None:
+        db.execute(insert(AuditLog), [item.row() for item in events])
+        return
+    # Ouvre la transaction si besoin : son rollback doit abandonner ces evenements.
+    db.connection()
+    db.info.setdefault(PENDING_AUDIT_KEY, []).extend(events)
+
+
+@event.listens_for(Session, "after_transaction_create")
+def _mark_savepoint(session: Session, transaction) -> None:
+    if transaction.nested:
+        session.info.setdefault(SAVEPOINT_MARKS_KEY, {})[id(transaction)] = len(session.info.get(PENDING_AUDIT_KEY, ()))
+
+
+@event.listens_for(Session, "after_commit")
+def _submit_committed_events(session: Session) -> None:
+    # after_commit suit aussi la liberation d'un savepoint : seul le commit racine publie.
+    if session.in_nested_transaction():
+        return
+    session.info.pop(SAVEPOINT_MARKS_KEY, None)
+    events = session.info.pop(PENDING_AUDIT_KEY, None)
+    if events:
+        writer = _writer
+        if writer is None:
+            copy_audit_events(session.get_bind().engine, events)
+        else:
+            writer.submit(events)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back_events(session: Session, previous_transaction) -> None:
+    # ``after_rollback`` se declenche aussi pour un savepoint : seul le
+    # rollback de la transaction racine abandonne tous les evenements.
+    if previous_transaction.nested:
+        mark = session.info.get(SAVEPOINT_MARKS_KEY, {}).pop(id(previous_transaction), None)
+        pending = session.info.get(PENDING_AUDIT_KEY)
+        if mark is not None and pending:
+            del pending[mark:]
+    elif previous_transaction.parent is None:
+        session.info.pop(SAVEPOINT_MARKS_KEY, None)
+        session.info.pop(PENDING_AUDIT_KEY, None)
@@ -1,8 +1,9 @@
+from dataclasses import dataclass
 from datetime import date, datetime, timedelta, timezone
 from typing import Any
 
-from sqlalchemy import select
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import ORMExecuteState, Session, joinedload
 
 from app.core.config import settings
 from app.core.security import (
@@ -24,6 +25,22 @@ from app.models.models import (
     InstitutionalProfile,
     RefreshToken,
 )
+from app.utils.cache import TTLCache
+
+
+@dataclass(frozen=True, slots=True)
+class ClientPrincipal:
+    """Identite minimale d'un client authentifie, lue sans charger le graphe ORM."""
+
+    id: int
+    status: str
+    is_active: bool
+
+
+principal_cache = TTLCache(settings.PRINCIPAL_CACHE_SIZE, settings.PRINCIPAL_CACHE_TTL_SECONDS)
+PRINCIPAL_CHANGES_KEY = "principal_changes"
+ALL_PRINCIPALS = "*"
+PRINCIPAL_TABLES = frozenset({Client.__tablename__, ClientAuthentication.__tablename__})
 
 
 class AuthService:
@@ -128,3 +145,94 @@ class AuthService:
         except (KeyError, TypeError, ValueError):
             return None
         return db.scalar(select(Client).where(Client.id == client_id).options(joinedload(Client.auth), joinedload(Client.individual_profile), joinedload(Client.institutional_profile)))
+
+    @staticmethod
+    def get_principal_from_access_token(db: Session, token: str) -> ClientPrincipal | None:
+        payload = decode_access_token(token)
+        if not payload:
+            return None
+        try:
+            client_id = int(payload["sub"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        principal = principal_cache.get(client_id)
+        if principal is not None:
+            return principal
+        row = db.execute(
+            select(Client.status, ClientAuthentication.is_active)
+            .outerjoin(ClientAuthentication, ClientAuthentication.client_id == Client.id)
+            .where(Client.id == client_id)
+        ).first()
+        if row is None:
+            return None
+        principal = ClientPrincipal(id=client_id, status=row.status, is_active=bool(row.is_active))
+        principal_cache.set(client_id, principal)
+        return principal
+
+    @staticmethod
+    def invalidate_principal(client_id: int) -> None:
+        principal_cache.pop(client_id)
+
+    @staticmethod
+    def set_client_status(db: Session, client_id: int, status: str, is_active: bool | None = None) -> Client:
+        """Change le statut d'un client (suspension, reactivation, cloture); le commit purge son principal en cache."""
+        client = db.scalar(select(Client).where(Client.id == client_id).options(joinedload(Client.auth)).with_for_update(of=Client))
+        if client is None:
+            raise ValueError("Client introuvable")
+        client.status = status
+        if is_active is not None and client.auth:
+            client.auth.is_active = is_active
+        if status != "ACTIF":
+            now = datetime.now(timezone.utc)
+            for token in db.scalars(select(RefreshToken).where(RefreshToken.client_id == client_id, RefreshToken.revoked_at.is_(None))):
+                token.revoked_at = now
+        db.commit()
+        return client
+
+
+# Tout commit qui change le statut d'un client ou l'activation de son acces
+# purge son principal, quel que soit le chemin d'ecriture. La purge est locale
+# au processus : un autre processus garde l'ancien statut au plus
+# PRINCIPAL_CACHE_TTL_SECONDS.
+def _principal_id(instance, deleted: bool) -> int | None:
+    if isinstance(instance, Client) and (deleted or inspect(instance).attrs.status.history.has_changes()):
+        return instance.id
+    if isinstance(instance, ClientAuthentication) and (deleted or inspect(instance).attrs.is_active.history.has_changes()):
+        return instance.client_id
+    return None
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_principal_changes(session: Session, _flush_context) -> None:
+    changed = [_principal_id(instance, False) for instance in session.dirty] + [_principal_id(instance, True) for instance in session.deleted]
+    client_ids = {client_id for client_id in changed if client_id is not None}
+    if client_ids:
+        session.info.setdefault(PRINCIPAL_CHANGES_KEY, set()).update(client_ids)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_principal_changes(state: ORMExecuteState) -> None:
+    if state.is_update or state.is_delete:
+        table = getattr(state.statement, "table", None)
+        if getattr(table, "name", None) in PRINCIPAL_TABLES:
+            state.session.info.setdefault(PRINCIPAL_CHANGES_KEY, set()).add(ALL_PRINCIPALS)
+
+
+@event.listens_for(Session, "after_commit")
+def _purge_changed_principals(session: Session) -> None:
+    if session.in_nested_transaction():
+        return
+    client_ids = session.info.pop(PRINCIPAL_CHANGES_KEY, None)
+    if not client_ids:
+        return
+    if ALL_PRINCIPALS in client_ids:
+        principal_cache.clear()
+        return
+    for client_id in client_ids:
+        AuthService.invalidate_principal(client_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_principal_changes(session: Session, previous_transaction) -> None:
+    if previous_transaction.parent is None and not previous_transaction.nested:
+        session.info.pop(PRINCIPAL_CHANGES_KEY, None)
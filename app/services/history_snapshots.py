@@ -0,0 +1,226 @@
+"""Instantanes mensuels de soldes, de positions et de flux.
+
+Le traitement ecrit, pour un mois donne, le solde de cloture de chaque compte,
+la valeur des souscriptions vivantes et le cumul des transactions executees
+dans le mois par couple de comptes. Statistiques mensuelles et flux du rapport client
+lisent ensuite des plages de mois indexees au lieu de rebalayer l'historique.
+
+Un mois n'est marque ``DONE`` (``batch_checkpoints``) qu'une fois clos : seuls
+les mois ``DONE`` sont lus depuis les instantanes, le mois courant reste
+calcule en direct. Les flux sont rattaches au mois d'execution : une
+transaction validee apres la cloture de son mois de creation compte dans le
+mois de sa validation, jamais dans un mois deja clos.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import and_, delete, func, or_, select, text, union_all
+from sqlalchemy.orm import Session
+
+from app.models.models import AccountBalanceSnapshot, BatchCheckpoint, MonthlyTransactionFlow, SubscriptionValueSnapshot
+
+HISTORY_JOB = "history_snapshots"
+
+# Solde de cloture = solde actuel moins les mouvements executes depuis la fin
+# du mois; une contrepassation inverse le sens de ses deux comptes.
+ACCOUNT_BALANCES_SQL = """
+INSERT INTO account_balance_snapshots (account_id, month, currency, balance)
+SELECT a.id, :month, a.currency, a.balance - COALESCE(later.delta, 0)
+FROM accounts a
+LEFT JOIN (
+    SELECT account_id, SUM(delta) AS delta
+    FROM (
+        SELECT source_account_id AS account_id, CASE WHEN transaction_type = 'CONTREPASSATION' THEN amount ELSE -amount END AS delta
+        FROM transactions
+        WHERE status = 'EXECUTED' AND source_account_id IS NOT NULL AND executed_at >= :next_month
+        UNION ALL
+        SELECT destination_account_id, CASE WHEN transaction_type = 'CONTREPASSATION' THEN -amount ELSE amount END
+        FROM transactions
+        WHERE status = 'EXECUTED' AND destination_account_id IS NOT NULL AND executed_at >= :next_month
+    ) moves
+    GROUP BY account_id
+) later ON later.account_id = a.id
+WHERE a.opened_at < :next_month
+ON CONFLICT (account_id, month) DO UPDATE SET currency = EXCLUDED.currency, balance = EXCLUDED.balance
+"""
+
+# Une souscription est vivante a la cloture si elle a ete souscrite avant et
+# n'a pas ete rachetee, remboursee ou contrepassee avant la fin du mois.
+SUBSCRIPTION_VALUES_SQL = """
+INSERT INTO subscription_value_snapshots (subscription_id, month, account_id, currency, invested_amount, current_value)
+SELECT s.id, :month, s.account_id, i.currency, s.invested_amount, CASE WHEN :marked THEN s.current_value ELSE s.invested_amount END
+FROM subscriptions s
+JOIN instruments i ON i.id = s.instrument_id
+LEFT JOIN (
+    SELECT subscription_id, MIN(
+        CASE
+            WHEN transaction_type IN ('RACHAT', 'REMBOURSEMENT_MATURITE') AND status = 'EXECUTED' THEN executed_at
+            WHEN transaction_type = 'SOUSCRIPTION' THEN reversed_at
+        END
+    ) AS closed_at
+    FROM transactions
+    WHERE subscription_id IS NOT NULL
+    GROUP BY subscription_id
+) closures ON closures.subscription_id = s.id
+WHERE s.subscribed_at < :next_month
+  AND (closures.closed_at IS NULL OR closures.closed_at >= :next_month)
+  AND (s.status = 'ACTIVE' OR closures.closed_at IS NOT NULL)
+ON CONFLICT (subscription_id, month) DO {on_conflict}
+"""
+
+TRANSACTION_FLOWS_SQL = """
+INSERT INTO monthly_transaction_flows (month, source_account_id, destination_account_id, currency, transaction_type, amount, transaction_count)
+SELECT :month, source_account_id, destination_account_id, currency, transaction_type, SUM(amount), COUNT(*)
+FROM transactions
+WHERE status = 'EXECUTED' AND executed_at >= :month AND executed_at < :next_month
+GROUP BY source_account_id, destination_account_id, currency, transaction_type
+"""
+
+
+def month_start(value: date | datetime) -> date:
+    return (value.date() if isinstance(value, datetime) else value).replace(day=1)
+
+
+def next_month(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def previous_month(month: date) -> date:
+    return (month.replace(day=1) - timedelta(days=1)).replace(day=1)
+
+
+def month_range(last: date, count: int) -> list[date]:
+    """Les ``count`` mois se terminant par ``last``, du plus ancien au plus recent."""
+    months = [month_start(last)]
+    while len(months) < count:
+        months.append(previous_month(months[-1]))
+    return months[::-1]
+
+
+def write_month_snapshots(db: Session, month: date, marked: bool = True, today: date | None = None) -> int:
+    """Ecrit les instantanes d'un mois et son point de reprise; retourne le nombre de lignes.
+
+    ``marked`` retient la valeur de marche actuelle des souscriptions et
+    remplace un instantane existant. En reconstitution (``marked=False``),
+    l'historique des valorisations n'existe pas : la valeur retenue est le
+    montant investi et un instantane deja ecrit n'est pas remplace.
+    """
+    month = month_start(month)
+    following = next_month(month)
+    params = {"month": month, "next_month": following, "marked": marked}
+    rows = db.execute(text(ACCOUNT_BALANCES_SQL), params).rowcount
+    on_conflict = "UPDATE SET invested_amount = EXCLUDED.invested_amount, current_value = EXCLUDED.current_value" if marked else "NOTHING"
+    rows += db.execute(text(SUBSCRIPTION_VALUES_SQL.format(on_conflict=on_conflict)), params).rowcount
+    db.execute(delete(MonthlyTransactionFlow).where(MonthlyTransactionFlow.month == month))
+    rows += db.execute(text(TRANSACTION_FLOWS_SQL), params).rowcount
+
+    run_key = month.isoformat()
+    checkpoint = db.scalar(select(BatchCheckpoint).where(BatchCheckpoint.job_name == HISTORY_JOB, BatchCheckpoint.run_key == run_key))
+    if not checkpoint:
+        checkpoint = BatchCheckpoint(job_name=HISTORY_JOB, run_key=run_key)
+        db.add(checkpoint)
+    checkpoint.processed = rows
+    checkpoint.status = "DONE" if following <= (today or date.today()) else "PARTIAL"
+    db.commit()
+    return rows
+
+
+def run_history_snapshots(db: Session, today: date | None = None) -> dict[str, int]:
+    """Traitement periodique : cloture le mois precedent s'il ne l'est pas, puis ecrit le mois courant."""
+    today = today or date.today()
+    current = month_start(today)
+    written = {}
+    previous = previous_month(current)
+    if not months_are_closed(db, previous, current):
+        written[previous.isoformat()] = write_month_snapshots(db, previous, today=today)
+    written[current.isoformat()] = write_month_snapshots(db, current, today=today)
+    return written
+
+
+def backfill_history_snapshots(db: Session, months: int, today: date | None = None) -> dict[str, int]:
+    """Reconstitue les ``months`` derniers mois depuis l'historique des transactions, un commit par mois."""
+    today = today or date.today()
+    current = month_start(today)
+    written = {}
+    for month in month_range(current, months):
+        written[month.isoformat()] = write_month_snapshots(db, month, marked=month == current, today=today)
+    return written
+
+
+def months_are_closed(db: Session, first: date, last: date) -> bool:
+    """Vrai si chaque mois de ``[first, last)`` a un instantane ecrit apres sa cloture."""
+    keys = []
+    month = month_start(first)
+    while month < last:
+        keys.append(month.isoformat())
+        month = next_month(month)
+    if not keys:
+        return False
+    done = db.scalar(
+        select(func.count(BatchCheckpoint.id)).where(BatchCheckpoint.job_name == HISTORY_JOB, BatchCheckpoint.run_key.in_(keys), BatchCheckpoint.status == "DONE")
+    )
+    return done == len(keys)
+
+
+def snapshot_cashflow_window(db: Session, since: datetime) -> tuple[date, date] | None:
+    """Mois complets posterieurs a ``since`` et anterieurs au mois courant, s'ils sont tous clos.
+
+    Le mois partiel de ``since`` et le mois courant restent lus en direct.
+    """
+    first = next_month(month_start(since))
+    last = month_start(datetime.now(timezone.utc))
+    if first >= last or not months_are_closed(db, first, last):
+        return None
+    return first, last
+
+
+def monthly_flows(db: Session, account_ids: list[int], first: date, last: date) -> list[tuple[date, str, str, Decimal]]:
+    """Flux ``(mois, devise, type, montant)`` visibles pour ``account_ids`` sur ``[first, last)``.
+
+    Meme regle de visibilite que les transactions : la branche destination
+    exclut les couples deja retenus cote source (virement interne).
+    """
+    if not account_ids:
+        return []
+    flows = MonthlyTransactionFlow
+    branches = [
+        select(flows.month, flows.currency, flows.transaction_type, flows.amount).where(condition, flows.month >= first, flows.month < last)
+        for condition in (
+            flows.source_account_id.in_(account_ids),
+            and_(flows.destination_account_id.in_(account_ids), or_(flows.source_account_id.is_(None), flows.source_account_id.not_in(account_ids))),
+        )
+    ]
+    visible = union_all(*branches).subquery("visible_flows")
+    return [
+        tuple(row)
+        for row in db.execute(
+            select(visible.c.month, visible.c.currency, visible.c.transaction_type, func.sum(visible.c.amount))
+            .group_by(visible.c.month, visible.c.currency, visible.c.transaction_type)
+        )
+    ]
+
+
+def portfolio_history(db: Session, account_ids: list[int], first: date, last: date) -> dict[date, dict]:
+    """Valeur des positions, nombre de souscriptions et soldes par mois instantane sur ``[first, last)``."""
+    history: dict[date, dict] = {}
+    if not account_ids:
+        return history
+
+    def bucket(month: date) -> dict:
+        return history.setdefault(month, {"valeur_portefeuille": Decimal("0.00"), "nombre_souscriptions": 0, "solde_comptes": Decimal("0.00")})
+
+    for month, value, count in db.execute(
+        select(SubscriptionValueSnapshot.month, func.sum(SubscriptionValueSnapshot.current_value), func.count(SubscriptionValueSnapshot.subscription_id))
+        .where(SubscriptionValueSnapshot.account_id.in_(account_ids), SubscriptionValueSnapshot.month >= first, SubscriptionValueSnapshot.month < last)
+        .group_by(SubscriptionValueSnapshot.month)
+    ):
+        row = bucket(month)
+        row["valeur_portefeuille"], row["nombre_souscriptions"] = Decimal(value), count
+    for month, balance in db.execute(
+        select(AccountBalanceSnapshot.month, func.sum(AccountBalanceSnapshot.balance))
+        .where(AccountBalanceSnapshot.account_id.in_(account_ids), AccountBalanceSnapshot.month >= first, AccountBalanceSnapshot.month < last)
+        .group_by(AccountBalanceSnapshot.month)
+    ):
+        bucket(month)["solde_comptes"] = Decimal(balance)
+    return history
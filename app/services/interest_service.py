@@ -1,16 +1,20 @@
 """Generation et consultation des paiements de coupons."""
 
+import logging
 from calendar import monthrange
-from datetime import date
+from dataclasses import dataclass
+from datetime import date, datetime
 from decimal import Decimal, ROUND_HALF_UP
+from time import monotonic
 
-from sqlalchemy import select
+from sqlalchemy import Select, func, insert, select
 from sqlalchemy.orm import Session, joinedload
 
-from app.models.models import AccountRole, InterestPayment, Subscription, Transaction
-from app.services.portfolio_service import audit, require_account_access
-
+from app.core.config import settings
+from app.models.models import AccountRole, Instrument, InterestPayment, Subscription, Transaction
+from app.services.portfolio_service import audit, audit_many, require_account_access
 
+logger = logging.getLogger(__name__)
 FREQUENCY_MONTHS = {"MENSUEL": 1, "TRIMESTRIEL": 3, "SEMESTRIEL": 6, "ANNUEL": 12}
 
 
@@ -22,6 +26,53 @@ def _add_months(value: date, months: int) -> date:
     return date(year, month, day)
 
 
+def _coupon_schedule(subscribed_on: date, maturity: date, invested: Decimal, subscription_yield: Decimal, frequency: str, as_of: date) -> tuple[Decimal, list[date]]:
+    """Montant du coupon et dates echues au plus tard a ``as_of``."""
+    months = FREQUENCY_MONTHS.get(frequency.upper(), 12)
+    amount = (Decimal(invested) * Decimal(subscription_yield) / Decimal("100") / (Decimal("12") / Decimal(months))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    due_dates = []
+    due_date = _add_months(subscribed_on, months)
+    while due_date <= as_of and due_date <= maturity:
+        due_dates.append(due_date)
+        due_date = _add_months(due_date, months)
+    return amount, due_dates
+
+
+def _as_date(value: date | datetime) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+@dataclass
+class CouponTotals:
+    paid_amount: Decimal = Decimal("0.00")
+    paid_count: int = 0
+    pending_amount: Decimal = Decimal("0.00")
+    pending_count: int = 0
+
+
+def coupon_totals(db: Session, subscription_ids: list[int] | Select) -> dict[int, CouponTotals]:
+    """Totaux payes/en attente par souscription en une requete groupee.
+
+    Les souscriptions sans coupon n'apparaissent pas : utiliser
+    ``totals.get(id, CouponTotals())`` cote appelant.
+    """
+    if isinstance(subscription_ids, list) and not subscription_ids:
+        return {}
+    totals: dict[int, CouponTotals] = {}
+    rows = db.execute(
+        select(InterestPayment.subscription_id, InterestPayment.status, func.count(InterestPayment.id), func.sum(InterestPayment.amount))
+        .where(InterestPayment.subscription_id.in_(subscription_ids), InterestPayment.status.in_(["PAYE", "EN_ATTENTE"]))
+        .group_by(InterestPayment.subscription_id, InterestPayment.status)
+    )
+    for subscription_id, status, count, amount in rows:
+        item = totals.setdefault(subscription_id, CouponTotals())
+        if status == "PAYE":
+            item.paid_count, item.paid_amount = count, Decimal(amount)
+        else:
+            item.pending_count, item.pending_amount = count, Decimal(amount)
+    return totals
+
+
 class InterestService:
     @staticmethod
     def generate_due_payments(db: Session, as_of: date, client_id: int | None = None) -> list[InterestPayment]:
@@ -31,10 +82,8 @@ class InterestService:
         subscriptions = list(db.scalars(query).unique())
         created: list[InterestPayment] = []
         for subscription in subscriptions:
-            months = FREQUENCY_MONTHS.get(subscription.instrument.interest_frequency.upper(), 12)
-            due_date = _add_months(subscription.subscribed_at.date(), months)
-            coupon_amount = (Decimal(subscription.invested_amount) * Decimal(subscription.subscription_yield) / Decimal("100") / (Decimal("12") / Decimal(months))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-            while due_date <= as_of and due_date <= subscription.effective_maturity_date:
+            coupon_amount, due_dates = _coupon_schedule(subscription.subscribed_at.date(), subscription.effective_maturity_date, subscription.invested_amount, subscription.subscription_yield, subscription.instrument.interest_frequency, as_of)
+            for due_date in due_dates:
                 existing = db.scalar(select(InterestPayment.id).where(InterestPayment.subscription_id == subscription.id, InterestPayment.payment_date == due_date))
                 if not existing:
                     payment = InterestPayment(subscription_id=subscription.id, payment_date=due_date, amount=coupon_amount, status="EN_ATTENTE")
@@ -55,10 +104,109 @@ class InterestService:
                     payment.transaction_id = transaction.id
                     audit(db, client_id, "INTEREST_PAYMENT_CREATED", "interest_payment", payment.id, {"subscription_id": subscription.id, "amount": str(coupon_amount)})
                     created.append(payment)
-                due_date = _add_months(due_date, months)
         db.commit()
         return created
 
+    @staticmethod
+    def generate_due_payments_bulk(db: Session, as_of: date, client_id: int | None = None, chunk_size: int | None = None) -> dict:
+        """Variante ensembliste du batch de coupons pour le livre complet.
+
+        Les souscriptions sont parcourues par pages sur ``id``; chaque page
+        lit les paiements existants en une requete, insere paiements,
+        transactions et audit en INSERT multi-lignes puis est committee.
+        """
+        chunk_size = chunk_size or settings.COUPON_BATCH_SIZE
+        started = monotonic()
+        last_id = 0
+        subscriptions_seen = 0
+        payments_created = 0
+        chunks = 0
+        while True:
+            query = (
+                select(
+                    Subscription.id,
+                    Subscription.account_id,
+                    Subscription.subscribed_at,
+                    Subscription.effective_maturity_date,
+                    Subscription.invested_amount,
+                    Subscription.subscription_yield,
+                    Instrument.interest_frequency,
+                    Instrument.currency,
+                    Instrument.code,
+                )
+                .join(Instrument, Instrument.id == Subscription.instrument_id)
+                .where(Subscription.status == "ACTIVE", Subscription.id > last_id)
+                .order_by(Subscription.id)
+                .limit(chunk_size)
+            )
+            if client_id is not None:
+                query = query.join(AccountRole, AccountRole.account_id == Subscription.account_id).where(AccountRole.client_id == client_id, AccountRole.is_active.is_(True))
+            rows = db.execute(query).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            subscriptions_seen += len(rows)
+            chunks += 1
+
+            existing = {
+                (subscription_id, _as_date(payment_date))
+                for subscription_id, payment_date in db.execute(
+                    select(InterestPayment.subscription_id, InterestPayment.payment_date).where(InterestPayment.subscription_id.in_([row.id for row in rows]))
+                )
+            }
+            due = []
+            for row in rows:
+                amount, due_dates = _coupon_schedule(row.subscribed_at.date(), row.effective_maturity_date, row.invested_amount, row.subscription_yield, row.interest_frequency, as_of)
+                due.extend((row, due_date, amount) for due_date in due_dates if (row.id, due_date) not in existing)
+            if not due:
+                db.commit()
+                continue
+
+            transaction_ids = db.scalars(
+                insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "transaction_type": "PAIEMENT_INTERET",
+                        "destination_account_id": row.account_id,
+                        "amount": amount,
+                        "currency": row.currency,
+                        "description": f"Coupon {row.code} - {due_date.isoformat()}",
+                        "status": "PENDING_APPROVAL",
+                        "is_automatic": True,
+                        "subscription_id": row.id,
+                    }
+                    for row, due_date, amount in due
+                ],
+            ).all()
+            payment_ids = db.scalars(
+                insert(InterestPayment).returning(InterestPayment.id, sort_by_parameter_order=True),
+                [
+                    {"subscription_id": row.id, "payment_date": due_date, "amount": amount, "status": "EN_ATTENTE", "transaction_id": transaction_id}
+                    for (row, due_date, amount), transaction_id in zip(due, transaction_ids)
+                ],
+            ).all()
+            audit_many(
+                db,
+                client_id,
+                "INTEREST_PAYMENT_CREATED",
+                "interest_payment",
+                ((payment_id, {"subscription_id": row.id, "amount": str(amount)}) for (row, _, amount), payment_id in zip(due, payment_ids)),
+            )
+            db.commit()
+            payments_created += len(due)
+
+        duration = monotonic() - started
+        result = {
+            "as_of": as_of,
+            "subscriptions": subscriptions_seen,
+            "payments_created": payments_created,
+            "chunks": chunks,
+            "duration_ms": round(duration * 1000),
+            "payments_per_second": round(payments_created / duration, 1) if duration else None,
+        }
+        logger.info("coupon_batch_completed as_of=%s subscriptions=%s payments=%s chunks=%s duration_ms=%s", as_of, subscriptions_seen, payments_created, chunks, result["duration_ms"])
+        return result
+
     @staticmethod
     def list_for_client(db: Session, client_id: int, subscription_id: int | None = None) -> list[InterestPayment]:
         account_ids = select(AccountRole.account_id).where(AccountRole.client_id == client_id, AccountRole.is_active.is_(True))
@@ -1,24 +1,74 @@
 """Calculs financiers deterministes utilises par les rapports metier."""
 
+import math
 from datetime import date
 from decimal import Decimal, InvalidOperation, localcontext
 
+from app.core.config import settings
+from app.utils.cache import TTLCache
+
 
 ZERO = Decimal("0")
 ONE = Decimal("1")
 DAYS_PER_YEAR = Decimal("365")
+RATE_FLOOR = Decimal("-0.9999")
+# Borne haute effectivement atteinte par l'encadrement historique (10 double
+# jusqu'a depasser 1000) : au-dela, le TMA est considere comme non defini.
+RATE_CEILING = Decimal("1280")
+PERCENT_QUANTUM = Decimal("0.01")
 
+# Le TMA d'une position ne change qu'a une revalorisation ou un coupon paye :
+# la cle reprend exactement les entrees du calcul, date d'arrete comprise.
+tma_cache = TTLCache(settings.TMA_CACHE_SIZE, settings.TMA_CACHE_TTL_SECONDS)
 
-def xirr(cashflows: list[tuple[date, Decimal]]) -> Decimal:
-    """Calcule un rendement annualise date (type TMA/XIRR) par dichotomie.
 
-    Les montants sont signes du point de vue de l'investisseur : sortie
-    negative a la souscription, encaissements positifs ensuite.
-    """
-    flows = [(when, Decimal(amount)) for when, amount in cashflows if amount]
-    if len(flows) < 2 or not any(amount < ZERO for _, amount in flows) or not any(amount > ZERO for _, amount in flows):
-        return ZERO
-    start = min(when for when, _ in flows)
+def _to_percent(rate: Decimal) -> Decimal:
+    return (rate * Decimal("100")).quantize(PERCENT_QUANTUM)
+
+
+def _xirr_closed_form(flows: list[tuple[date, Decimal]]) -> Decimal | None:
+    """Resout exactement le cas a deux flux : (1 + r)^t = -tardif / initial."""
+    (first_date, first_amount), (last_date, last_amount) = sorted(flows, key=lambda item: item[0])
+    days = (last_date - first_date).days
+    if days <= 0:
+        return None
+    with localcontext() as context:
+        context.prec = 34
+        try:
+            rate = ((-last_amount / first_amount).ln() * DAYS_PER_YEAR / Decimal(days)).exp() - ONE
+        except InvalidOperation:
+            return None
+        if rate < RATE_FLOOR or rate > RATE_CEILING:
+            return ZERO
+        return _to_percent(rate)
+
+
+def _xirr_newton(flows: list[tuple[date, Decimal]], start: date) -> Decimal | None:
+    """Newton en virgule flottante; None si la methode ne converge pas."""
+    terms = [(float(amount), (when - start).days / 365.0) for when, amount in flows]
+    rate = 0.1
+    for _ in range(50):
+        base = 1.0 + rate
+        if base <= 0:
+            return None
+        try:
+            value = sum(amount * base ** -years for amount, years in terms)
+            slope = sum(-years * amount * base ** (-years - 1.0) for amount, years in terms)
+        except (OverflowError, ZeroDivisionError):
+            return None
+        if slope == 0 or not math.isfinite(value) or not math.isfinite(slope):
+            return None
+        step = value / slope
+        rate -= step
+        if abs(step) < 1e-12:
+            if rate < float(RATE_FLOOR) or rate > float(RATE_CEILING):
+                return None
+            return _to_percent(Decimal(repr(rate)))
+    return None
+
+
+def _xirr_bisection(flows: list[tuple[date, Decimal]], start: date) -> Decimal:
+    """Dichotomie Decimal historique, conservee en filet de securite."""
 
     def npv(rate: Decimal) -> Decimal:
         with localcontext() as context:
@@ -35,7 +85,7 @@ def xirr(cashflows: list[tuple[date, Decimal]]) -> Decimal:
 
     with localcontext() as context:
         context.prec = 34
-        low = Decimal("-0.9999")
+        low = RATE_FLOOR
         high = Decimal("10")
         low_value = npv(low)
         high_value = npv(high)
@@ -48,20 +98,52 @@ def xirr(cashflows: list[tuple[date, Decimal]]) -> Decimal:
             middle = (low + high) / Decimal("2")
             middle_value = npv(middle)
             if abs(middle_value) < Decimal("0.00000001"):
-                return (middle * Decimal("100")).quantize(Decimal("0.01"))
+                return _to_percent(middle)
             if low_value * middle_value <= ZERO:
                 high, high_value = middle, middle_value
             else:
                 low, low_value = middle, middle_value
-        return (((low + high) / Decimal("2")) * Decimal("100")).quantize(Decimal("0.01"))
+        return _to_percent((low + high) / Decimal("2"))
+
+
+def xirr(cashflows: list[tuple[date, Decimal]]) -> Decimal:
+    """Calcule un rendement annualise date (type TMA/XIRR).
+
+    Les montants sont signes du point de vue de l'investisseur : sortie
+    negative a la souscription, encaissements positifs ensuite. Le cas a deux
+    flux est resolu en forme fermee; sinon Newton est tente avant la
+    dichotomie.
+    """
+    flows = [(when, Decimal(amount)) for when, amount in cashflows if amount]
+    if len(flows) < 2 or not any(amount < ZERO for _, amount in flows) or not any(amount > ZERO for _, amount in flows):
+        return ZERO
+    if len(flows) == 2:
+        result = _xirr_closed_form(flows)
+        if result is not None:
+            return result
+    start = min(when for when, _ in flows)
+    result = _xirr_newton(flows, start)
+    if result is not None:
+        return result
+    return _xirr_bisection(flows, start)
 
 
 def annualized_return(invested: Decimal, current_value: Decimal, start: date, as_of: date, paid_interest: Decimal = ZERO, fee_amount: Decimal = ZERO) -> Decimal:
     """Retourne le TMA en pourcentage pour une position et ses flux connus."""
     if invested <= ZERO or as_of <= start:
         return ZERO
-    return xirr([
+    key = (Decimal(invested), Decimal(current_value), Decimal(fee_amount), Decimal(paid_interest), start, as_of)
+    cached = tma_cache.get(key)
+    if cached is not None:
+        return cached
+    result = xirr([
         (start, -(Decimal(invested) + Decimal(fee_amount))),
         (as_of, Decimal(current_value) + Decimal(paid_interest)),
     ])
+    tma_cache.set(key, result)
+    return result
+
 
+def invalidate_tma_cache() -> None:
+    """A appeler apres une ecriture qui revalorise une position ou paie un coupon."""
+    tma_cache.clear()
@@ -0,0 +1,205 @@
+"""Ecritures comptables et projection ``ledger_balances``.
+
+Chaque ecriture passe par ``post_entries`` : les lignes d'``accounting_entries``
+sont inserees et les cumuls debit/credit de ``(account_code, currency)`` sont
+incrementes dans la meme transaction SQL. Le solde d'un compte du grand livre
+se lit alors sur une ligne au lieu d'agreger toutes ses ecritures.
+"""
+
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from decimal import Decimal
+
+from sqlalchemy import insert, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.models.models import AccountingEntry, LedgerBalance
+
+ZERO = Decimal("0")
+CLIENT_PREFIX = "CLIENT_"
+
+# Convention des comptes ``CLIENT_<id>`` : un credit augmente le solde, un
+# debit le diminue. Les ecritures d'investissement suivent la convention
+# inverse sur la jambe client (la souscription credite le client et reduit
+# son solde; rachat et remboursement a l'echeance le debitent et l'augmentent).
+# Une contrepassation suit le type de la transaction d'origine.
+INVERTED_CLIENT_LEG_TYPES = ("SOUSCRIPTION", "RACHAT", "REMBOURSEMENT_MATURITE")
+
+# Cumuls des ecritures de ``{source}`` (la table ou une de ses partitions).
+ENTRY_TOTALS_SQL = f"""
+SELECT
+    ae.account_code,
+    ae.currency,
+    COALESCE(SUM(ae.amount) FILTER (WHERE ae.direction = 'DEBIT'), 0) AS debit_total,
+    COALESCE(SUM(ae.amount) FILTER (WHERE ae.direction = 'CREDIT'), 0) AS credit_total,
+    COUNT(*) AS entry_count,
+    COALESCE(SUM(
+        CASE WHEN ae.direction = 'CREDIT' THEN ae.amount ELSE -ae.amount END
+        * CASE WHEN COALESCE(o.transaction_type, t.transaction_type) IN ({", ".join(f"'{name}'" for name in INVERTED_CLIENT_LEG_TYPES)}) THEN -1 ELSE 1 END
+    ), 0) AS balance_effect
+FROM {{source}} ae
+LEFT JOIN transactions t ON t.id = ae.transaction_id
+LEFT JOIN transactions o ON o.id = t.reversal_of_transaction_id
+GROUP BY ae.account_code, ae.currency
+"""
+
+# Ecritures encore attachees et cumuls des partitions detachees.
+ALL_ENTRY_TOTALS_SQL = f"""
+SELECT account_code, currency, SUM(debit_total) AS debit_total, SUM(credit_total) AS credit_total,
+       SUM(entry_count) AS entry_count, SUM(balance_effect) AS balance_effect
+FROM (
+    {ENTRY_TOTALS_SQL.format(source="accounting_entries")}
+    UNION ALL
+    SELECT account_code, currency, debit_total, credit_total, entry_count, balance_effect FROM ledger_archived_totals
+) AS totals
+GROUP BY account_code, currency
+"""
+
+_REBUILD_SQL = """
+INSERT INTO ledger_balances (account_code, currency, debit_total, credit_total, entry_count, updated_at)
+SELECT account_code, currency, debit_total, credit_total, entry_count, now()
+FROM ({totals}) AS totals
+ON CONFLICT (account_code, currency) DO UPDATE SET
+    debit_total = EXCLUDED.debit_total,
+    credit_total = EXCLUDED.credit_total,
+    entry_count = EXCLUDED.entry_count,
+    updated_at = EXCLUDED.updated_at
+"""
+# Sans partition detachee (migration 0009, avant ``ledger_archived_totals``).
+REBUILD_LEDGER_BALANCES_SQL = _REBUILD_SQL.format(totals=ENTRY_TOTALS_SQL.format(source="accounting_entries"))
+REBUILD_WITH_ARCHIVED_TOTALS_SQL = _REBUILD_SQL.format(totals=ALL_ENTRY_TOTALS_SQL)
+
+ARCHIVE_ENTRY_TOTALS_SQL = """
+INSERT INTO ledger_archived_totals (partition_name, account_code, currency, debit_total, credit_total, entry_count, balance_effect)
+SELECT :partition, account_code, currency, debit_total, credit_total, entry_count, balance_effect
+FROM ({totals}) AS totals
+ON CONFLICT (partition_name, account_code, currency) DO NOTHING
+"""
+
+# Une seule passe triee : cumuls recalcules depuis les ecritures, projection
+# et soldes des comptes clients (``CLIENT_<id>``) alignes sur la meme cle.
+RECONCILIATION_SQL = f"""
+WITH entries AS ({ALL_ENTRY_TOTALS_SQL}),
+client_accounts AS (
+    SELECT 'CLIENT_' || id AS account_code, currency, balance FROM accounts
+)
+SELECT
+    COALESCE(e.account_code, l.account_code, a.account_code) AS account_code,
+    COALESCE(e.currency, l.currency, a.currency) AS currency,
+    e.debit_total AS entries_debit,
+    e.credit_total AS entries_credit,
+    e.entry_count AS entries_count,
+    e.balance_effect AS entries_balance_effect,
+    l.debit_total AS projection_debit,
+    l.credit_total AS projection_credit,
+    l.entry_count AS projection_count,
+    a.balance AS account_balance
+FROM entries e
+FULL JOIN ledger_balances l
+    ON l.account_code = e.account_code AND l.currency = e.currency
+FULL JOIN client_accounts a
+    ON a.account_code = COALESCE(e.account_code, l.account_code)
+   AND a.currency = COALESCE(e.currency, l.currency)
+ORDER BY 1, 2
+"""
+
+
+def entry(transaction_id: int, account_code: str, direction: str, amount: Decimal, currency: str, **extra) -> dict:
+    return {"transaction_id": transaction_id, "account_code": account_code, "direction": direction, "amount": Decimal(amount), "currency": currency, **extra}
+
+
+def post_entries(db: Session, entries: Iterable[dict]) -> None:
+    """Insere les ecritures et incremente leur projection dans la transaction courante.
+
+    Les lignes de projection sont upsertees dans l'ordre de leur cle : deux
+    postings concurrents verrouillent donc les memes lignes dans le meme ordre.
+    """
+    rows = list(entries)
+    if not rows:
+        return
+    db.execute(insert(AccountingEntry), rows)
+    totals: dict[tuple[str, str], list] = defaultdict(lambda: [ZERO, ZERO, 0])
+    for row in rows:
+        bucket = totals[(row["account_code"], row["currency"])]
+        bucket[0 if row["direction"] == "DEBIT" else 1] += Decimal(row["amount"])
+        bucket[2] += 1
+    statement = pg_insert(LedgerBalance).values([
+        {"account_code": code, "currency": currency, "debit_total": debit, "credit_total": credit, "entry_count": count}
+        for (code, currency), (debit, credit, count) in sorted(totals.items())
+    ])
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[LedgerBalance.account_code, LedgerBalance.currency],
+        set_={
+            "debit_total": LedgerBalance.debit_total + statement.excluded.debit_total,
+            "credit_total": LedgerBalance.credit_total + statement.excluded.credit_total,
+            "entry_count": LedgerBalance.entry_count + statement.excluded.entry_count,
+            "updated_at": func.now(),
+        },
+    ))
+
+
+def rebuild_ledger_balances(db: Session) -> None:
+    """Recalcule toute la projection depuis les ecritures et les cumuls archives (reprise apres ecart)."""
+    db.execute(text(REBUILD_WITH_ARCHIVED_TOTALS_SQL))
+
+
+def archive_entry_totals(db: Session, partition: str) -> None:
+    """Enregistre les cumuls d'une partition d'``accounting_entries`` avant son detachement.
+
+    La projection garde les cumuls des ecritures detachees : reconciliation et
+    reconstruction les ajoutent aux ecritures encore attachees.
+    """
+    db.execute(text(ARCHIVE_ENTRY_TOTALS_SQL.format(totals=ENTRY_TOTALS_SQL.format(source=partition))), {"partition": partition})
+
+
+@dataclass(slots=True)
+class LedgerDiscrepancy:
+    account_code: str
+    currency: str
+    kind: str
+    expected: Decimal | int | None
+    found: Decimal | int | None
+
+
+def iter_ledger_reconciliation(db: Session, batch_size: int = 1000) -> Iterator[tuple[str, str, list[LedgerDiscrepancy]]]:
+    """Parcourt la reconciliation en flux, une cle ``(account_code, currency)`` a la fois.
+
+    ``PROJECTION_*`` compare la projection aux ecritures (partitions detachees
+    comprises, par leurs cumuls archives); ``ACCOUNT_BALANCE``
+    compare l'effet des ecritures d'un compte ``CLIENT_<id>`` sur son solde
+    (voir ``INVERTED_CLIENT_LEG_TYPES``) a ``Account.balance``.
+    """
+    result = db.execute(text(RECONCILIATION_SQL).execution_options(yield_per=batch_size))
+    for row in result.mappings():
+        code, currency = row["account_code"], row["currency"]
+        issues = [
+            LedgerDiscrepancy(code, currency, f"PROJECTION_{field.upper()}", expected, found)
+            for field, expected, found in (
+                ("debit_total", row["entries_debit"], row["projection_debit"]),
+                ("credit_total", row["entries_credit"], row["projection_credit"]),
+                ("entry_count", row["entries_count"], row["projection_count"]),
+            )
+            if (expected or 0) != (found or 0)
+        ]
+        if code.startswith(CLIENT_PREFIX):
+            net = Decimal(row["entries_balance_effect"] or ZERO)
+            balance = row["account_balance"]
+            if balance is None or net != Decimal(balance):
+                issues.append(LedgerDiscrepancy(code, currency, "ACCOUNT_BALANCE", net, balance))
+        yield code, currency, issues
+
+
+def reconcile_ledger(db: Session, batch_size: int = 1000, max_reported: int = 100) -> dict:
+    """Synthese de la reconciliation; seuls les ``max_reported`` premiers ecarts sont detailles."""
+    checked, discrepancies, reported = 0, 0, []
+    for _, _, issues in iter_ledger_reconciliation(db, batch_size):
+        checked += 1
+        discrepancies += len(issues)
+        reported.extend(
+            {"account_code": item.account_code, "currency": item.currency, "kind": item.kind, "expected": item.expected, "found": item.found}
+            for item in issues[: max(0, max_reported - len(reported))]
+        )
+    return {"checked": checked, "discrepancies": discrepancies, "items": reported}
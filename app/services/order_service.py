@@ -7,13 +7,13 @@ from sqlalchemy.orm import Session, joinedload
 from app.models.models import (
     Account,
     AccountRole,
-    AccountingEntry,
     InvestmentOrder,
     Instrument,
     OrderWorkflowStep,
     Subscription,
     Transaction,
 )
+from app.services.ledger import entry, post_entries
 from app.services.portfolio_service import audit, require_account_access
 
 
@@ -176,9 +176,9 @@ class InvestmentOrderService:
         )
         db.add(transaction)
         db.flush()
-        db.add_all([
-            AccountingEntry(transaction_id=transaction.id, account_code=f"CLIENT_{account.id}", direction="CREDIT", amount=order.amount, currency=order.currency),
-            AccountingEntry(transaction_id=transaction.id, account_code=f"INVESTMENT_{instrument.code}", direction="DEBIT", amount=order.amount, currency=order.currency),
+        post_entries(db, [
+            entry(transaction.id, f"CLIENT_{account.id}", "CREDIT", order.amount, order.currency),
+            entry(transaction.id, f"INVESTMENT_{instrument.code}", "DEBIT", order.amount, order.currency),
         ])
         order.status = "EXECUTED"
         order.checked_by_client_id = checker_id
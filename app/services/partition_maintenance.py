@@ -0,0 +1,69 @@
+"""Maintenance des partitions mensuelles : creation a l'avance et detachement.
+
+Le traitement cree les partitions du mois courant et des
+``PARTITION_PRECREATE_MONTHS`` mois suivants, puis detache les partitions
+anterieures a la conservation ``PARTITION_RETENTION_MONTHS``. Une partition
+detachee reste une table autonome, a archiver puis supprimer hors ligne. La
+projection ``ledger_balances`` conserve les cumuls des ecritures detachees;
+ils sont enregistres dans ``ledger_archived_totals`` au detachement pour que
+la reconciliation et la reconstruction en tiennent compte.
+"""
+
+import logging
+from datetime import date, datetime, timezone
+
+from sqlalchemy import Select, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.partitions import PARTITIONED_TABLES, create_partition, is_partitioned, monthly_partitions, partition_name
+from app.services.history_snapshots import month_range, month_start, next_month
+from app.services.ledger import archive_entry_totals
+
+logger = logging.getLogger(__name__)
+
+
+def maintain_partitions(db: Session, today: date | None = None, months_ahead: int | None = None, retention_months: int | None = None) -> dict[str, dict[str, list[str]]]:
+    """Cree et detache les partitions de chaque table partitionnee; un commit par table."""
+    current = month_start(today or datetime.now(timezone.utc).date())
+    months_ahead = settings.PARTITION_PRECREATE_MONTHS if months_ahead is None else months_ahead
+    retention_months = settings.PARTITION_RETENTION_MONTHS if retention_months is None else retention_months
+    cutoff = month_range(current, retention_months + 1)[0] if retention_months > 0 else None
+    report = {}
+    # Les cumuls archives lisent le type des transactions : les ecritures
+    # passent avant le detachement de leurs transactions.
+    for table in sorted(PARTITIONED_TABLES, key=lambda name: name != "accounting_entries"):
+        if not is_partitioned(db, table):
+            continue
+        existing = monthly_partitions(db, table)
+        created, detached, moved = [], [], 0
+        month = current
+        for _ in range(months_ahead + 1):
+            if month not in existing:
+                moved += create_partition(db, table, month)
+                created.append(partition_name(table, month))
+            month = next_month(month)
+        if cutoff:
+            for month, name in sorted(existing.items()):
+                if month < cutoff:
+                    if table == "accounting_entries":
+                        archive_entry_totals(db, name)
+                    db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                    detached.append(name)
+        db.commit()
+        report[table] = {"created": created, "detached": detached}
+        logger.info("partitions_maintained table=%s created=%s detached=%s moved_from_default=%s", table, len(created), len(detached), moved)
+    return report
+
+
+def scanned_partitions(db: Session, query: Select) -> set[str]:
+    """Relations lues par le plan de ``query`` : verifie l'elagage des partitions."""
+    compiled = query.compile(dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True})
+    plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()[0]["Plan"]
+    relations, pending = set(), [plan]
+    while pending:
+        node = pending.pop()
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        pending.extend(node.get("Plans", ()))
+    return relations
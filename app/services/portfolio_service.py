@@ -1,10 +1,11 @@
-import json
+from collections.abc import Iterable
 from datetime import datetime, timezone
 
 from sqlalchemy import select
 from sqlalchemy.orm import Session, selectinload
 
-from app.models.models import Account, AccountRole, AuditLog, Client
+from app.models.models import Account, AccountRole, Client
+from app.services.audit_writer import AuditEvent, record_audit
 
 
 OPERATING_ROLES = {"TITULAIRE_PRINCIPAL", "TITULAIRE_SECONDAIRE", "MANDATAIRE", "ADMINISTRATEUR"}
@@ -38,7 +39,12 @@ def require_account_access(db: Session, account_id: int, client_id: int, operati
 
 
 def audit(db: Session, client_id: int | None, action: str, entity_type: str, entity_id: int | str | None, metadata: dict | None = None) -> None:
-    db.add(AuditLog(client_id=client_id, action=action, entity_type=entity_type, entity_id=str(entity_id) if entity_id is not None else None, metadata_json=json.dumps(metadata or {}, default=str)))
+    record_audit(db, [AuditEvent(client_id, action, entity_type, str(entity_id) if entity_id is not None else None, metadata)])
+
+
+def audit_many(db: Session, client_id: int | None, action: str, entity_type: str, items: Iterable[tuple[int | str, dict | None]]) -> None:
+    """Meme action sur plusieurs entites : une seule insertion (ou un seul lot differe)."""
+    record_audit(db, [AuditEvent(client_id, action, entity_type, str(entity_id), metadata) for entity_id, metadata in items])
 
 
 def account_out(account: Account, role: str | None = None) -> dict:
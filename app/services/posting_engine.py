@@ -0,0 +1,222 @@
+"""Moteur de comptabilisation optionnel : un ecrivain unique par compte.
+
+Les mouvements de solde sont mis en file par compte. Chaque shard (un thread)
+possede un sous-ensemble stable de comptes (``account_id % shards``), draine sa
+file par lots et applique le lot dans une seule transaction SQL (commit
+groupe). Un compte tres sollicite n'est donc plus dispute entre les threads du
+serveur : ses ecritures se suivent dans un seul thread, une transaction par lot.
+
+Le moteur ne couvre que l'execution des transactions (``TransactionService``).
+Les ordres d'investissement et les souscriptions gardent leurs verrous de
+ligne directs : leur debit partage l'unite de travail de l'ordre ou de la
+souscription qu'il accompagne.
+
+Ordre des verrous, commun a ``approve_batch`` : transactions puis comptes,
+chacun par id croissant.
+"""
+
+import logging
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from decimal import Decimal
+from queue import Empty, Queue
+from threading import Lock, Thread
+from time import monotonic
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.models import Account, Transaction
+
+logger = logging.getLogger(__name__)
+ZERO = Decimal("0")
+_STOP = object()
+
+
+@dataclass(slots=True)
+class PostingLeg:
+    """Variation signee d'un compte; ``require_funds`` refuse un disponible negatif."""
+
+    account_id: int
+    balance: Decimal = ZERO
+    available: Decimal = ZERO
+    require_funds: bool = False
+
+
+@dataclass(slots=True)
+class Posting:
+    legs: list[PostingLeg]
+    # Ecritures complementaires (statut, ecritures comptables, audit) faites
+    # dans la meme transaction que les soldes; leur retour resout le futur.
+    apply: Callable[[Session], Any] | None = None
+    # Transactions verrouillees par le lot avant les comptes.
+    transaction_ids: tuple[int, ...] = ()
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=monotonic)
+
+
+class PostingRefused(ValueError):
+    """Mouvement refuse par le moteur (solde insuffisant, compte absent)."""
+
+
+class PostingEngine:
+    def __init__(self, session_factory: Callable[[], Session], shards: int = 4, max_batch: int = 200, max_wait_seconds: float = 0.002, latency_window: int = 10000, post_timeout: float | None = 30.0):
+        self.session_factory = session_factory
+        self.shards = max(1, shards)
+        self.max_batch = max_batch
+        self.max_wait_seconds = max_wait_seconds
+        self.post_timeout = post_timeout
+        self._queues: list[Queue] = [Queue() for _ in range(self.shards)]
+        self._threads: list[Thread] = []
+        self._latencies: deque[float] = deque(maxlen=latency_window)
+        self._stats_lock = Lock()
+        self.postings = 0
+        self.refused = 0
+        self.batches = 0
+
+    def shard_for(self, account_id: int) -> int:
+        return account_id % self.shards
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._threads = [Thread(target=self._run, args=(index,), name=f"posting-shard-{index}", daemon=True) for index in range(self.shards)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float | None = 5.0) -> None:
+        for queue in self._queues:
+            queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, legs: list[PostingLeg], apply: Callable[[Session], Any] | None = None, transaction_ids: tuple[int, ...] = ()) -> Future:
+        """Met un mouvement en file sur le shard de son plus petit compte.
+
+        Un mouvement a plusieurs comptes (virement) reste verrouille en base :
+        si ses comptes relevent de shards differents, la coherence repose sur
+        le ``FOR UPDATE`` pris par lot dans l'ordre croissant des ids.
+        """
+        if not legs:
+            raise ValueError("Un mouvement doit toucher au moins un compte")
+        posting = Posting(legs=legs, apply=apply, transaction_ids=transaction_ids)
+        self._queues[self.shard_for(min(leg.account_id for leg in legs))].put(posting)
+        return posting.future
+
+    def post(self, legs: list[PostingLeg], apply: Callable[[Session], Any] | None = None, transaction_ids: tuple[int, ...] = (), timeout: float | None = None) -> Any:
+        """Attend le mouvement au plus ``timeout`` secondes (``post_timeout`` par defaut)."""
+        return self.submit(legs, apply, transaction_ids).result(self.post_timeout if timeout is None else timeout)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            postings, refused, batches = self.postings, self.refused, self.batches
+
+        def percentile(rank: float) -> float | None:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(rank * len(latencies)))] * 1000, 3)
+
+        return {
+            "shards": self.shards,
+            "postings": postings,
+            "refused": refused,
+            "batches": batches,
+            "average_batch_size": round(postings / batches, 2) if batches else 0,
+            "latency_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99), "max": percentile(1.0)},
+            "queued": sum(queue.qsize() for queue in self._queues),
+        }
+
+    def _drain(self, queue: Queue, first: Posting) -> tuple[list[Posting], bool]:
+        batch, stopping = [first], False
+        deadline = monotonic() + self.max_wait_seconds
+        while len(batch) < self.max_batch:
+            try:
+                item = queue.get(timeout=max(0.0, deadline - monotonic()))
+            except Empty:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            batch.append(item)
+        return batch, stopping
+
+    def _run(self, shard: int) -> None:
+        queue = self._queues[shard]
+        while True:
+            first = queue.get()
+            if first is _STOP:
+                return
+            batch, stopping = self._drain(queue, first)
+            self._commit_batch(batch)
+            if stopping:
+                return
+
+    def _commit_batch(self, batch: list[Posting]) -> None:
+        db = self.session_factory()
+        outcomes: list[tuple[Posting, Any, BaseException | None]] = []
+        try:
+            transaction_ids = sorted({transaction_id for posting in batch for transaction_id in posting.transaction_ids})
+            if transaction_ids:
+                db.execute(select(Transaction.id).where(Transaction.id.in_(transaction_ids)).order_by(Transaction.id).with_for_update())
+            account_ids = sorted({leg.account_id for posting in batch for leg in posting.legs})
+            accounts = {item.id: item for item in db.scalars(select(Account).where(Account.id.in_(account_ids)).order_by(Account.id).with_for_update())}
+            for posting in batch:
+                savepoint = db.begin_nested()
+                try:
+                    for leg in posting.legs:
+                        account = accounts.get(leg.account_id)
+                        if account is None:
+                            raise PostingRefused("Compte introuvable")
+                        if leg.require_funds and Decimal(account.available_balance) + leg.available < ZERO:
+                            raise PostingRefused("Solde disponible insuffisant")
+                    for leg in posting.legs:
+                        account = accounts[leg.account_id]
+                        account.balance += leg.balance
+                        account.available_balance += leg.available
+                    result = posting.apply(db) if posting.apply else None
+                    savepoint.commit()
+                    outcomes.append((posting, result, None))
+                except Exception as exc:
+                    savepoint.rollback()
+                    # Le rollback du savepoint expire les comptes : leur
+                    # prochaine lecture reprend l'etat du lot sans ce mouvement.
+                    outcomes.append((posting, None, exc))
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            logger.exception("posting_batch_failed size=%s", len(batch))
+            outcomes = [(posting, None, exc) for posting in batch]
+        finally:
+            db.close()
+
+        finished = monotonic()
+        with self._stats_lock:
+            self.batches += 1
+            for posting, _, error in outcomes:
+                self.postings += 1
+                self.refused += error is not None
+                self._latencies.append(finished - posting.enqueued_at)
+        for posting, result, error in outcomes:
+            if error is None:
+                posting.future.set_result(result)
+            else:
+                posting.future.set_exception(error)
+
+
+_engine: PostingEngine | None = None
+
+
+def current_posting_engine() -> PostingEngine | None:
+    return _engine
+
+
+def install_posting_engine(engine: PostingEngine | None) -> PostingEngine | None:
+    """Installe (ou retire avec None) le moteur utilise par les services; retourne le precedent."""
+    global _engine
+    previous, _engine = _engine, engine
+    return previous
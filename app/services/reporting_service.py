@@ -1,12 +1,15 @@
 """Rapports métier du portail client et du pilotage opérationnel."""
 
+import heapq
 from collections import defaultdict
 from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
+from itertools import islice
 
-from sqlalchemy import or_, select
+from sqlalchemy import Select, column, func, literal_column, or_, select, table
 from sqlalchemy.orm import Session, joinedload
 
+from app.core.config import settings
 from app.models.models import (
     Account,
     AccountRole,
@@ -14,16 +17,39 @@ from app.models.models import (
     Client,
     InvestmentOrder,
     Instrument,
+    InstrumentType,
     OrderWorkflowStep,
     Subscription,
     Transaction,
 )
+from app.services.history_snapshots import monthly_flows, snapshot_cashflow_window
+from app.services.interest_service import CouponTotals, coupon_totals
 from app.services.investment_metrics import annualized_return
+from app.services.reporting_snapshots import snapshots_are_fresh
+from app.services.transaction_queries import visible_join, visible_transaction_ids, visible_transactions
 
 
 OPEN_ORDER_STATUSES = {"SUBMITTED", "COMPLIANCE_REVIEW", "BACK_OFFICE_REVIEW", "READY_FOR_CHECKER"}
 STEP_ORDER = ("CONFORMITE", "BACK_OFFICE", "CHECKER")
 BACK_OFFICE_ROLES = {"MANDATAIRE", "CONFORMITE", "BACK_OFFICE", "SUPERVISEUR"}
+CLIENT_REPORT_SNAPSHOTS = ("mv_reporting_client_positions", "mv_reporting_order_pipeline")
+MV_CLIENT_POSITIONS = table(
+    "mv_reporting_client_positions",
+    *(column(name) for name in (
+        "client_id", "account_id", "subscription_id", "instrument_code", "instrument_name", "instrument_type_name", "instrument_currency",
+        "invested_amount", "current_value", "accrued_interest", "fee_amount", "subscribed_at", "effective_maturity_date",
+    )),
+)
+MV_ORDER_PIPELINE = table("mv_reporting_order_pipeline", *(column(name) for name in ("order_id", "account_id", "status", "currency", "amount")))
+CASHFLOW_COLUMNS = {
+    "DEPOT": "deposits",
+    "RETRAIT": "withdrawals",
+    "TRANSFERT": "withdrawals",
+    "SOUSCRIPTION": "investments",
+    "REMBOURSEMENT_MATURITE": "maturities",
+    "PAIEMENT_INTERET": "coupon_payments",
+    "FRAIS": "fees",
+}
 
 
 def _money(value: Decimal | int | float | None) -> Decimal:
@@ -49,6 +75,40 @@ def _next_step(order: InvestmentOrder) -> str | None:
     return next((code for code in STEP_ORDER if code in pending), None)
 
 
+def _order_queue_row(order: InvestmentOrder, step: str, client: Client | None, today: date) -> dict:
+    return {
+        "queue_type": "INVESTMENT_ORDER",
+        "id": order.id,
+        "client_name": _client_name(client),
+        "account_number": order.account.account_number,
+        "operation": order.instrument.name,
+        "instrument_code": order.instrument.code,
+        "amount": order.amount,
+        "currency": order.currency,
+        "status": order.status,
+        "next_step": step,
+        "age_days": max((today - order.created_at.date()).days, 0),
+        "created_at": order.created_at,
+    }
+
+
+def _transaction_queue_row(transaction: Transaction, account: Account | None, client: Client | None, today: date) -> dict:
+    return {
+        "queue_type": "TRANSACTION",
+        "id": transaction.id,
+        "client_name": _client_name(client),
+        "account_number": account.account_number if account else None,
+        "operation": transaction.transaction_type,
+        "instrument_code": None,
+        "amount": transaction.amount,
+        "currency": transaction.currency,
+        "status": transaction.status,
+        "next_step": "CHECKER",
+        "age_days": max((today - transaction.created_at.date()).days, 0),
+        "created_at": transaction.created_at,
+    }
+
+
 def _account_ids(db: Session, client_id: int, roles: set[str] | None = None) -> list[int]:
     query = select(AccountRole.account_id).where(AccountRole.client_id == client_id, AccountRole.is_active.is_(True))
     if roles:
@@ -74,9 +134,130 @@ def _base_currency_bucket(currency: str) -> dict:
     }
 
 
+def _cashflow_row(month: date, currency: str) -> dict:
+    return {"month": month, "currency": currency, "deposits": Decimal("0.00"), "withdrawals": Decimal("0.00"), "investments": Decimal("0.00"), "maturities": Decimal("0.00"), "coupon_payments": Decimal("0.00"), "fees": Decimal("0.00")}
+
+
+def _position_row(subscription_id: int, account_id: int, code: str, name: str, type_name: str, currency: str, invested: Decimal, current_value: Decimal, tma: Decimal, paid_coupons: Decimal, fees: Decimal, maturity_date: date, days: int) -> dict:
+    return {
+        "subscription_id": subscription_id,
+        "account_id": account_id,
+        "instrument_code": code,
+        "instrument_name": name,
+        "instrument_type": type_name,
+        "currency": currency,
+        "invested_amount": invested,
+        "current_value": current_value,
+        "return_amount": _money(Decimal(current_value) - Decimal(invested)),
+        "return_percentage": _money((Decimal(current_value) - Decimal(invested)) / Decimal(invested) * 100) if invested else Decimal("0.00"),
+        "tma_percentage": tma,
+        "paid_coupons": paid_coupons,
+        "fees": fees,
+        "maturity_date": maturity_date,
+        "days_to_maturity": days,
+    }
+
+
+def _maturity_row(subscription_id: int, code: str, name: str, currency: str, current_value: Decimal, maturity_date: date, days: int) -> dict:
+    return {
+        "subscription_id": subscription_id,
+        "instrument_code": code,
+        "instrument_name": name,
+        "currency": currency,
+        "current_value": current_value,
+        "maturity_date": maturity_date,
+        "days_to_maturity": max(days, 0),
+    }
+
+
+def _apply_tma(by_currency: dict[str, dict], tma_by_currency: dict[str, list[tuple[Decimal, Decimal]]]) -> None:
+    for currency, values in tma_by_currency.items():
+        invested_total = sum((amount for amount, _ in values), Decimal("0.00"))
+        by_currency[currency]["tma_percentage"] = (sum((amount * tma for amount, tma in values), Decimal("0.00")) / invested_total).quantize(Decimal("0.01")) if invested_total else Decimal("0.00")
+
+
+def _live_cashflow_criteria(since: datetime, window: tuple[date, date] | None) -> list:
+    """Criteres des transactions lues en direct : executees depuis ``since``, sauf les mois instantanes.
+
+    Une execution suit toujours la creation : la borne ``created_at >= since``
+    garde l'elagage des partitions mensuelles et la plage des index
+    ``(compte, created_at)``; les mois restent ceux d'execution.
+    """
+    criteria = [Transaction.status == "EXECUTED", Transaction.created_at >= since, Transaction.executed_at >= since]
+    if window:
+        criteria.append(or_(Transaction.executed_at < window[0], Transaction.executed_at >= window[1]))
+    return criteria
+
+
+def live_cashflow_query(account_ids: list[int], since: datetime, window: tuple[date, date] | None) -> Select:
+    """Flux ``(mois d'execution, devise, type, montant)`` lus en direct par le rapport client SQL."""
+    month = func.date_trunc(literal_column("'month'"), Transaction.executed_at)
+    criteria = _live_cashflow_criteria(since, window)
+    visible = visible_transaction_ids(account_ids, *criteria)
+    return (
+        select(month, Transaction.currency, Transaction.transaction_type, func.sum(Transaction.amount))
+        .join(visible, visible_join(visible))
+        .where(*criteria)
+        .group_by(month, Transaction.currency, Transaction.transaction_type)
+    )
+
+
+def _add_cashflow(cashflow: dict[tuple[date, str], dict], month: date, currency: str, transaction_type: str, amount: Decimal) -> None:
+    row = cashflow.setdefault((month, currency), _cashflow_row(month, currency))
+    column = CASHFLOW_COLUMNS.get(transaction_type)
+    if column:
+        row[column] += Decimal(amount)
+
+
+def _cashflow_rows(cashflow: dict[tuple[date, str], dict]) -> list[dict]:
+    rows = []
+    for row in sorted(cashflow.values(), key=lambda item: (item["month"], item["currency"])):
+        row["net"] = row["deposits"] + row["maturities"] + row["coupon_payments"] - row["withdrawals"] - row["investments"] - row["fees"]
+        rows.append(row)
+    return rows
+
+
+def _client_report_payload(today: date, horizon_days: int, accounts: int, positions: list[dict], open_orders: int, by_currency: dict[str, dict], allocation: dict[tuple[str, str], Decimal], pipeline_rows: list[dict], maturities: list[dict], cashflow_rows: list[dict]) -> dict:
+    alerts = []
+    if open_orders:
+        alerts.append({"code": "ORDERS_IN_REVIEW", "severity": "warning", "title": "Ordres en cours de validation", "detail": f"{open_orders} ordre(s) mobilisent un montant réservé."})
+    if maturities:
+        alerts.append({"code": "UPCOMING_MATURITIES", "severity": "info", "title": "Échéances à anticiper", "detail": f"{len(maturities)} position(s) arrivent à échéance sous {horizon_days} jours."})
+    return {
+        "as_of": today,
+        "generated_at": datetime.now(timezone.utc),
+        "kpis": {
+            "active_positions": len(positions),
+            "pending_orders": open_orders,
+            "accounts": accounts,
+            "maturities_next_horizon": len(maturities),
+        },
+        "summary_by_currency": list(by_currency.values()),
+        "allocation": [{"instrument_type": key[0], "currency": key[1], "current_value": value} for key, value in allocation.items()],
+        "positions": positions,
+        "order_pipeline": pipeline_rows,
+        "maturities": sorted(maturities, key=lambda item: item["maturity_date"]),
+        "cashflow": cashflow_rows,
+        "alerts": alerts,
+    }
+
+
 class ReportingService:
     @staticmethod
-    def client_report(db: Session, client_id: int, horizon_days: int = 90, months: int = 6) -> dict:
+    def client_report(db: Session, client_id: int, horizon_days: int = 90, months: int = 6, backend: str | None = None) -> dict:
+        """Rapport portefeuille; ``backend`` choisit l'agregation ORM ou SQL.
+
+        Sans backend explicite, les instantanes materialises sont preferes
+        tant que leur fraicheur respecte la borne configuree.
+        """
+        if backend is None and snapshots_are_fresh(db, CLIENT_REPORT_SNAPSHOTS):
+            return ReportingService._client_report_sql(db, client_id, horizon_days, months, from_snapshots=True)
+        if (backend or settings.REPORTING_CLIENT_BACKEND) == "sql":
+            return ReportingService._client_report_sql(db, client_id, horizon_days, months)
+        return ReportingService._client_report_orm(db, client_id, horizon_days, months)
+
+    @staticmethod
+    def _client_report_orm(db: Session, client_id: int, horizon_days: int, months: int) -> dict:
         account_ids = _account_ids(db, client_id)
         accounts = list(db.scalars(select(Account).where(Account.id.in_(account_ids), Account.status == "ACTIF"))) if account_ids else []
         subscriptions = list(
@@ -84,17 +265,11 @@ class ReportingService:
                 select(Subscription)
                 .where(Subscription.account_id.in_(account_ids), Subscription.status == "ACTIVE")
                 .options(joinedload(Subscription.instrument).joinedload(Instrument.instrument_type))
+                .order_by(Subscription.id)
             )
         ) if account_ids else []
-        payments = list(
-            db.scalars(
-                select(InterestPayment)
-                .where(InterestPayment.subscription_id.in_([item.id for item in subscriptions]), InterestPayment.status == "PAYE")
-            )
-        ) if subscriptions else []
-        paid_coupons_by_subscription: dict[int, Decimal] = defaultdict(lambda: Decimal("0.00"))
-        for payment in payments:
-            paid_coupons_by_subscription[payment.subscription_id] += Decimal(payment.amount)
+        coupons = coupon_totals(db, [item.id for item in subscriptions])
+        paid_coupons_by_subscription = {subscription_id: item.paid_amount for subscription_id, item in coupons.items()}
 
         orders = list(
             db.scalars(
@@ -116,7 +291,7 @@ class ReportingService:
             bucket["invested"] += Decimal(subscription.invested_amount)
             bucket["current_value"] += Decimal(subscription.current_value)
             bucket["accrued_interest"] += Decimal(subscription.accrued_interest)
-            bucket["paid_coupons"] += paid_coupons_by_subscription[subscription.id]
+            bucket["paid_coupons"] += paid_coupons_by_subscription.get(subscription.id, Decimal("0.00"))
             bucket["fees"] += Decimal(subscription.fee_amount)
             bucket["return_amount"] += Decimal(subscription.current_value) - Decimal(subscription.invested_amount)
             bucket["active_positions"] += 1
@@ -138,40 +313,13 @@ class ReportingService:
             currency = subscription.instrument.currency
             allocation[(type_name, currency)] += Decimal(subscription.current_value)
             days = (subscription.effective_maturity_date - today).days
-            paid_coupons = paid_coupons_by_subscription[subscription.id]
+            paid_coupons = paid_coupons_by_subscription.get(subscription.id, Decimal("0.00"))
             tma = annualized_return(Decimal(subscription.invested_amount), Decimal(subscription.current_value), subscription.subscribed_at.date(), today, paid_coupons, Decimal(subscription.fee_amount))
             tma_by_currency[currency].append((Decimal(subscription.invested_amount), tma))
-            position_rows.append({
-                "subscription_id": subscription.id,
-                "account_id": subscription.account_id,
-                "instrument_code": subscription.instrument.code,
-                "instrument_name": subscription.instrument.name,
-                "instrument_type": type_name,
-                "currency": currency,
-                "invested_amount": subscription.invested_amount,
-                "current_value": subscription.current_value,
-                "return_amount": _money(Decimal(subscription.current_value) - Decimal(subscription.invested_amount)),
-                "return_percentage": _money((Decimal(subscription.current_value) - Decimal(subscription.invested_amount)) / Decimal(subscription.invested_amount) * 100) if subscription.invested_amount else Decimal("0.00"),
-                "tma_percentage": tma,
-                "paid_coupons": paid_coupons,
-                "fees": subscription.fee_amount,
-                "maturity_date": subscription.effective_maturity_date,
-                "days_to_maturity": days,
-            })
+            position_rows.append(_position_row(subscription.id, subscription.account_id, subscription.instrument.code, subscription.instrument.name, type_name, currency, subscription.invested_amount, subscription.current_value, tma, paid_coupons, subscription.fee_amount, subscription.effective_maturity_date, days))
             if subscription.effective_maturity_date <= maturity_limit:
-                maturities.append({
-                    "subscription_id": subscription.id,
-                    "instrument_code": subscription.instrument.code,
-                    "instrument_name": subscription.instrument.name,
-                    "currency": currency,
-                    "current_value": subscription.current_value,
-                    "maturity_date": subscription.effective_maturity_date,
-                    "days_to_maturity": max(days, 0),
-                })
-
-        for currency, values in tma_by_currency.items():
-            invested_total = sum((amount for amount, _ in values), Decimal("0.00"))
-            by_currency[currency]["tma_percentage"] = (sum((amount * tma for amount, tma in values), Decimal("0.00")) / invested_total).quantize(Decimal("0.01")) if invested_total else Decimal("0.00")
+                maturities.append(_maturity_row(subscription.id, subscription.instrument.code, subscription.instrument.name, currency, subscription.current_value, subscription.effective_maturity_date, days))
+        _apply_tma(by_currency, tma_by_currency)
 
         pipeline: dict[str, dict] = defaultdict(lambda: {"status": "", "count": 0, "amount_by_currency": defaultdict(lambda: Decimal("0.00"))})
         for order in orders:
@@ -185,61 +333,169 @@ class ReportingService:
         ]
 
         since = datetime.now(timezone.utc) - timedelta(days=31 * months)
+        window = snapshot_cashflow_window(db, since)
         transactions = list(
-            db.scalars(
-                select(Transaction)
-                .where(
-                    Transaction.status == "EXECUTED",
-                    Transaction.created_at >= since,
-                    or_(Transaction.source_account_id.in_(account_ids), Transaction.destination_account_id.in_(account_ids)),
-                )
-                .order_by(Transaction.created_at.asc())
-            )
+            db.scalars(visible_transactions(account_ids, *_live_cashflow_criteria(since, window), descending=False))
         ) if account_ids else []
         cashflow: dict[tuple[date, str], dict] = {}
         for transaction in transactions:
-            key = (_month_start(transaction.created_at), transaction.currency)
-            row = cashflow.setdefault(key, {"month": key[0], "currency": key[1], "deposits": Decimal("0.00"), "withdrawals": Decimal("0.00"), "investments": Decimal("0.00"), "maturities": Decimal("0.00"), "coupon_payments": Decimal("0.00"), "fees": Decimal("0.00")})
-            amount = Decimal(transaction.amount)
-            if transaction.transaction_type == "DEPOT":
-                row["deposits"] += amount
-            elif transaction.transaction_type in {"RETRAIT", "TRANSFERT", "SOUSCRIPTION"}:
-                row["withdrawals" if transaction.transaction_type != "SOUSCRIPTION" else "investments"] += amount
-            elif transaction.transaction_type == "REMBOURSEMENT_MATURITE":
-                row["maturities"] += amount
-            elif transaction.transaction_type == "PAIEMENT_INTERET":
-                row["coupon_payments"] += amount
-            elif transaction.transaction_type == "FRAIS":
-                row["fees"] += amount
-        cashflow_rows = []
-        for row in sorted(cashflow.values(), key=lambda item: (item["month"], item["currency"])):
-            row["net"] = row["deposits"] + row["maturities"] + row["coupon_payments"] - row["withdrawals"] - row["investments"] - row["fees"]
-            cashflow_rows.append(row)
-
-        alerts = []
-        open_orders = [order for order in orders if order.status in OPEN_ORDER_STATUSES]
-        if open_orders:
-            alerts.append({"code": "ORDERS_IN_REVIEW", "severity": "warning", "title": "Ordres en cours de validation", "detail": f"{len(open_orders)} ordre(s) mobilisent un montant réservé."})
-        if maturities:
-            alerts.append({"code": "UPCOMING_MATURITIES", "severity": "info", "title": "Échéances à anticiper", "detail": f"{len(maturities)} position(s) arrivent à échéance sous {horizon_days} jours."})
+            _add_cashflow(cashflow, _month_start(transaction.executed_at), transaction.currency, transaction.transaction_type, transaction.amount)
+        if window:
+            for month, currency, transaction_type, amount in monthly_flows(db, account_ids, *window):
+                _add_cashflow(cashflow, month, currency, transaction_type, amount)
+        cashflow_rows = _cashflow_rows(cashflow)
 
-        return {
-            "as_of": today,
-            "generated_at": datetime.now(timezone.utc),
-            "kpis": {
-                "active_positions": len(subscriptions),
-                "pending_orders": len(open_orders),
-                "accounts": len(accounts),
-                "maturities_next_horizon": len(maturities),
-            },
-            "summary_by_currency": list(by_currency.values()),
-            "allocation": [{"instrument_type": key[0], "currency": key[1], "current_value": value} for key, value in allocation.items()],
-            "positions": position_rows,
-            "order_pipeline": pipeline_rows,
-            "maturities": sorted(maturities, key=lambda item: item["maturity_date"]),
-            "cashflow": cashflow_rows,
-            "alerts": alerts,
-        }
+        open_orders = len([order for order in orders if order.status in OPEN_ORDER_STATUSES])
+        return _client_report_payload(today, horizon_days, len(accounts), position_rows, open_orders, by_currency, allocation, pipeline_rows, maturities, cashflow_rows)
+
+    @staticmethod
+    def _client_report_sql(db: Session, client_id: int, horizon_days: int, months: int, from_snapshots: bool = False) -> dict:
+        """Meme rapport calcule par des agregations SQL renvoyant des lignes simples.
+
+        Avec ``from_snapshots``, positions, allocation et pipeline sont lus
+        dans les vues materialisees; soldes et flux restent lus en direct.
+        """
+        account_ids = _account_ids(db, client_id)
+        today = date.today()
+        by_currency: dict[str, dict] = {}
+        allocation: dict[tuple[str, str], Decimal] = {}
+        if not account_ids:
+            return _client_report_payload(today, horizon_days, 0, [], 0, by_currency, allocation, [], [], [])
+
+        account_totals = db.execute(
+            select(Account.currency, func.count(Account.id), func.sum(Account.available_balance), func.sum(Account.balance))
+            .where(Account.id.in_(account_ids), Account.status == "ACTIF")
+            .group_by(Account.currency)
+            .order_by(Account.currency)
+        ).all()
+        accounts_count = 0
+        for currency, count, available, balance in account_totals:
+            bucket = by_currency.setdefault(currency, _base_currency_bucket(currency))
+            bucket["available_cash"] += Decimal(available or 0)
+            bucket["balance"] += Decimal(balance or 0)
+            accounts_count += count
+
+        paid_by_subscription = (
+            select(InterestPayment.subscription_id, func.sum(InterestPayment.amount).label("paid"))
+            .where(InterestPayment.status == "PAYE", InterestPayment.subscription_id.in_(select(Subscription.id).where(Subscription.account_id.in_(account_ids))))
+            .group_by(InterestPayment.subscription_id)
+            .subquery()
+        )
+        type_name = func.coalesce(InstrumentType.name, literal_column("'Autre'"))
+        if from_snapshots:
+            positions_query = (
+                select(
+                    MV_CLIENT_POSITIONS.c.subscription_id.label("id"),
+                    MV_CLIENT_POSITIONS.c.account_id,
+                    MV_CLIENT_POSITIONS.c.invested_amount,
+                    MV_CLIENT_POSITIONS.c.current_value,
+                    MV_CLIENT_POSITIONS.c.accrued_interest,
+                    MV_CLIENT_POSITIONS.c.fee_amount,
+                    MV_CLIENT_POSITIONS.c.subscribed_at,
+                    MV_CLIENT_POSITIONS.c.effective_maturity_date,
+                    MV_CLIENT_POSITIONS.c.instrument_code.label("code"),
+                    MV_CLIENT_POSITIONS.c.instrument_name.label("name"),
+                    MV_CLIENT_POSITIONS.c.instrument_currency.label("currency"),
+                    MV_CLIENT_POSITIONS.c.instrument_type_name.label("type_name"),
+                    func.coalesce(paid_by_subscription.c.paid, 0).label("paid"),
+                )
+                .outerjoin(paid_by_subscription, paid_by_subscription.c.subscription_id == MV_CLIENT_POSITIONS.c.subscription_id)
+                .where(MV_CLIENT_POSITIONS.c.client_id == client_id)
+                .order_by(MV_CLIENT_POSITIONS.c.subscription_id)
+            )
+            allocation_query = (
+                select(MV_CLIENT_POSITIONS.c.instrument_type_name, MV_CLIENT_POSITIONS.c.instrument_currency, func.sum(MV_CLIENT_POSITIONS.c.current_value))
+                .where(MV_CLIENT_POSITIONS.c.client_id == client_id)
+                .group_by(MV_CLIENT_POSITIONS.c.instrument_type_name, MV_CLIENT_POSITIONS.c.instrument_currency)
+            )
+            pipeline_query = (
+                select(MV_ORDER_PIPELINE.c.status, MV_ORDER_PIPELINE.c.currency, func.count(MV_ORDER_PIPELINE.c.order_id), func.sum(MV_ORDER_PIPELINE.c.amount))
+                .where(MV_ORDER_PIPELINE.c.account_id.in_(account_ids))
+                .group_by(MV_ORDER_PIPELINE.c.status, MV_ORDER_PIPELINE.c.currency)
+            )
+        else:
+            positions_query = (
+                select(
+                    Subscription.id,
+                    Subscription.account_id,
+                    Subscription.invested_amount,
+                    Subscription.current_value,
+                    Subscription.accrued_interest,
+                    Subscription.fee_amount,
+                    Subscription.subscribed_at,
+                    Subscription.effective_maturity_date,
+                    Instrument.code,
+                    Instrument.name,
+                    Instrument.currency,
+                    type_name.label("type_name"),
+                    func.coalesce(paid_by_subscription.c.paid, 0).label("paid"),
+                )
+                .join(Instrument, Instrument.id == Subscription.instrument_id)
+                .outerjoin(InstrumentType, InstrumentType.id == Instrument.instrument_type_id)
+                .outerjoin(paid_by_subscription, paid_by_subscription.c.subscription_id == Subscription.id)
+                .where(Subscription.account_id.in_(account_ids), Subscription.status == "ACTIVE")
+                .order_by(Subscription.id)
+            )
+            allocation_query = (
+                select(type_name, Instrument.currency, func.sum(Subscription.current_value))
+                .join(Instrument, Instrument.id == Subscription.instrument_id)
+                .outerjoin(InstrumentType, InstrumentType.id == Instrument.instrument_type_id)
+                .where(Subscription.account_id.in_(account_ids), Subscription.status == "ACTIVE")
+                .group_by(type_name, Instrument.currency)
+            )
+            pipeline_query = (
+                select(InvestmentOrder.status, InvestmentOrder.currency, func.count(InvestmentOrder.id), func.sum(InvestmentOrder.amount))
+                .where(InvestmentOrder.account_id.in_(account_ids))
+                .group_by(InvestmentOrder.status, InvestmentOrder.currency)
+            )
+        positions = db.execute(positions_query).all()
+        position_rows = []
+        maturities = []
+        tma_by_currency: dict[str, list[tuple[Decimal, Decimal]]] = defaultdict(list)
+        maturity_limit = today + timedelta(days=horizon_days)
+        for row in positions:
+            bucket = by_currency.setdefault(row.currency, _base_currency_bucket(row.currency))
+            paid = Decimal(row.paid)
+            bucket["invested"] += Decimal(row.invested_amount)
+            bucket["current_value"] += Decimal(row.current_value)
+            bucket["accrued_interest"] += Decimal(row.accrued_interest)
+            bucket["paid_coupons"] += paid
+            bucket["fees"] += Decimal(row.fee_amount)
+            bucket["return_amount"] += Decimal(row.current_value) - Decimal(row.invested_amount)
+            bucket["active_positions"] += 1
+            days = (row.effective_maturity_date - today).days
+            tma = annualized_return(Decimal(row.invested_amount), Decimal(row.current_value), row.subscribed_at.date(), today, paid, Decimal(row.fee_amount))
+            tma_by_currency[row.currency].append((Decimal(row.invested_amount), tma))
+            position_rows.append(_position_row(row.id, row.account_id, row.code, row.name, row.type_name, row.currency, row.invested_amount, row.current_value, tma, paid, row.fee_amount, row.effective_maturity_date, days))
+            if row.effective_maturity_date <= maturity_limit:
+                maturities.append(_maturity_row(row.id, row.code, row.name, row.currency, row.current_value, row.effective_maturity_date, days))
+
+        allocation = {(name, currency): Decimal(value) for name, currency, value in db.execute(allocation_query)}
+
+        pipeline: dict[str, dict] = {}
+        open_orders = 0
+        for status, currency, count, amount in db.execute(pipeline_query):
+            row = pipeline.setdefault(status, {"status": status, "count": 0, "amount_by_currency": {}})
+            row["count"] += count
+            row["amount_by_currency"][currency] = Decimal(amount)
+            if status in OPEN_ORDER_STATUSES:
+                open_orders += count
+                bucket = by_currency.setdefault(currency, _base_currency_bucket(currency))
+                bucket["reserved_orders"] += Decimal(amount)
+        for bucket in by_currency.values():
+            bucket["return_percentage"] = (bucket["return_amount"] / bucket["invested"] * 100).quantize(Decimal("0.01")) if bucket["invested"] else Decimal("0.00")
+        _apply_tma(by_currency, tma_by_currency)
+
+        since = datetime.now(timezone.utc) - timedelta(days=31 * months)
+        window = snapshot_cashflow_window(db, since)
+        cashflow: dict[tuple[date, str], dict] = {}
+        for month_start, currency, transaction_type, amount in db.execute(live_cashflow_query(account_ids, since, window)):
+            _add_cashflow(cashflow, month_start.date(), currency, transaction_type, amount)
+        if window:
+            for month_start, currency, transaction_type, amount in monthly_flows(db, account_ids, *window):
+                _add_cashflow(cashflow, month_start, currency, transaction_type, amount)
+
+        return _client_report_payload(today, horizon_days, accounts_count, position_rows, open_orders, by_currency, allocation, list(pipeline.values()), maturities, _cashflow_rows(cashflow))
 
     @staticmethod
     def backoffice_report(db: Session, client_id: int, horizon_days: int = 90, limit: int = 30) -> dict:
@@ -255,65 +511,31 @@ class ReportingService:
                 .order_by(InvestmentOrder.created_at.asc())
             ).unique()
         )
-        transactions = list(
-            db.scalars(
-                select(Transaction)
-                .where(
-                    Transaction.status == "PENDING_APPROVAL",
-                    or_(Transaction.source_account_id.in_(account_ids), Transaction.destination_account_id.in_(account_ids)),
-                )
-                .order_by(Transaction.created_at.asc())
-            )
-        )
-        client_ids = {order.client_id for order in orders} | {item.created_by_client_id for item in transactions if item.created_by_client_id}
-        clients = {client.id: client for client in db.scalars(select(Client).where(Client.id.in_(client_ids))).all()} if client_ids else {}
+        transactions = list(db.scalars(visible_transactions(account_ids, Transaction.status == "PENDING_APPROVAL", descending=False)))
+        accounts_by_id = {account.id: account for account in accounts}
         today = date.today()
         workflow = {code: {"step": code, "count": 0, "amount_by_currency": defaultdict(lambda: Decimal("0.00")), "oldest_age_days": 0} for code in STEP_ORDER}
-        order_queue = []
+        steps_by_order: dict[int, str] = {}
         for order in orders:
-            step = _next_step(order) or "CONFORMITE"
-            age = max((today - order.created_at.date()).days, 0)
+            step = steps_by_order[order.id] = _next_step(order) or "CONFORMITE"
             row = workflow[step]
             row["count"] += 1
             row["amount_by_currency"][order.currency] += Decimal(order.amount)
-            row["oldest_age_days"] = max(row["oldest_age_days"], age)
-            order_queue.append({
-                "queue_type": "INVESTMENT_ORDER",
-                "id": order.id,
-                "client_name": _client_name(clients.get(order.client_id)),
-                "account_number": order.account.account_number,
-                "operation": order.instrument.name,
-                "instrument_code": order.instrument.code,
-                "amount": order.amount,
-                "currency": order.currency,
-                "status": order.status,
-                "next_step": step,
-                "age_days": age,
-                "created_at": order.created_at,
-            })
-        transaction_queue = []
-        for transaction in transactions:
-            age = max((today - transaction.created_at.date()).days, 0)
-            account = next((item for item in accounts if item.id in {transaction.source_account_id, transaction.destination_account_id}), None)
-            transaction_queue.append({
-                "queue_type": "TRANSACTION",
-                "id": transaction.id,
-                "client_name": _client_name(clients.get(transaction.created_by_client_id)),
-                "account_number": account.account_number if account else None,
-                "operation": transaction.transaction_type,
-                "instrument_code": None,
-                "amount": transaction.amount,
-                "currency": transaction.currency,
-                "status": transaction.status,
-                "next_step": "CHECKER",
-                "age_days": age,
-                "created_at": transaction.created_at,
-            })
-        queue = sorted(order_queue + transaction_queue, key=lambda item: item["created_at"])[:limit]
+            row["oldest_age_days"] = max(row["oldest_age_days"], max((today - order.created_at.date()).days, 0))
+        # Les deux files sont deja triees par created_at : une fusion k-way
+        # bornee a ``limit`` evite de trier puis de serialiser tout le perimetre.
+        pending = list(islice(heapq.merge(orders, transactions, key=lambda item: item.created_at), limit))
+        client_ids = {item.client_id if isinstance(item, InvestmentOrder) else item.created_by_client_id for item in pending} - {None}
+        clients = {client.id: client for client in db.scalars(select(Client).where(Client.id.in_(client_ids))).all()} if client_ids else {}
+        queue = [
+            _order_queue_row(item, steps_by_order[item.id], clients.get(item.client_id), today)
+            if isinstance(item, InvestmentOrder)
+            else _transaction_queue_row(item, accounts_by_id.get(item.source_account_id) or accounts_by_id.get(item.destination_account_id), clients.get(item.created_by_client_id), today)
+            for item in pending
+        ]
 
         subscriptions = list(db.scalars(select(Subscription).where(Subscription.account_id.in_(account_ids), Subscription.status == "ACTIVE").options(joinedload(Subscription.instrument))))
-        payments = list(db.scalars(select(InterestPayment).where(InterestPayment.subscription_id.in_([item.id for item in subscriptions]), InterestPayment.status == "PAYE"))) if subscriptions else []
-        paid_coupons = sum((Decimal(item.amount) for item in payments), Decimal("0.00"))
+        paid_coupons = sum((item.paid_amount for item in coupon_totals(db, [item.id for item in subscriptions]).values()), Decimal("0.00"))
         positions_by_currency: dict[str, Decimal] = defaultdict(lambda: Decimal("0.00"))
         fees_by_currency: dict[str, Decimal] = defaultdict(lambda: Decimal("0.00"))
         aum_by_currency: dict[str, Decimal] = defaultdict(lambda: Decimal("0.00"))
@@ -369,8 +591,8 @@ class ReportingService:
             raise PermissionError("Ce profil ne possede pas d'habilitation de reporting")
         accounts = list(db.scalars(select(Account).where(Account.id.in_(account_ids), Account.status == "ACTIF")))
         subscriptions = list(db.scalars(select(Subscription).where(Subscription.account_id.in_(account_ids), Subscription.status.in_(["ACTIVE", "MATURITE_EN_ATTENTE"])).options(joinedload(Subscription.instrument))))
-        payment_rows = list(db.scalars(select(InterestPayment).where(InterestPayment.subscription_id.in_([item.id for item in subscriptions])).options(joinedload(InterestPayment.subscription).joinedload(Subscription.instrument)))) if subscriptions else []
-        transactions = list(db.scalars(select(Transaction).where(Transaction.status == "EXECUTED", or_(Transaction.source_account_id.in_(account_ids), Transaction.destination_account_id.in_(account_ids))).order_by(Transaction.created_at.desc())))
+        coupons = coupon_totals(db, [item.id for item in subscriptions])
+        transactions = list(db.scalars(visible_transactions(account_ids, Transaction.status == "EXECUTED")))
         today = date.today()
         aum: dict[str, Decimal] = defaultdict(lambda: Decimal("0.00"))
         fees: dict[str, Decimal] = defaultdict(lambda: Decimal("0.00"))
@@ -379,7 +601,7 @@ class ReportingService:
             aum[account.currency] += Decimal(account.balance)
         for subscription in subscriptions:
             currency = subscription.instrument.currency
-            paid = sum((Decimal(item.amount) for item in payment_rows if item.subscription_id == subscription.id and item.status == "PAYE"), Decimal("0.00"))
+            paid = coupons.get(subscription.id, CouponTotals()).paid_amount
             aum[currency] += Decimal(subscription.current_value)
             fees[currency] += Decimal(subscription.fee_amount)
             positions.append({
@@ -401,7 +623,6 @@ class ReportingService:
         by_type: dict[str, dict[str, Decimal]] = defaultdict(lambda: defaultdict(lambda: Decimal("0.00")))
         for transaction in transactions:
             by_type[transaction.transaction_type][transaction.currency] += Decimal(transaction.amount)
-        pending_coupons = [item for item in payment_rows if item.status == "EN_ATTENTE"]
         upcoming = [item for item in subscriptions if item.effective_maturity_date <= today + timedelta(days=horizon_days)]
         return {
             "as_of": today,
@@ -411,9 +632,9 @@ class ReportingService:
             "fees_by_currency": [{"currency": currency, "value": value} for currency, value in sorted(fees.items())],
             "positions": positions,
             "coupon_control": {
-                "pending": len(pending_coupons),
-                "paid": len([item for item in payment_rows if item.status == "PAYE"]),
-                "paid_amount": sum((Decimal(item.amount) for item in payment_rows if item.status == "PAYE"), Decimal("0.00")),
+                "pending": sum(item.pending_count for item in coupons.values()),
+                "paid": sum(item.paid_count for item in coupons.values()),
+                "paid_amount": sum((item.paid_amount for item in coupons.values()), Decimal("0.00")),
             },
             "maturities_next_horizon": len(upcoming),
             "activity_by_type": [{"transaction_type": key, "amount_by_currency": dict(value)} for key, value in by_type.items()],
@@ -0,0 +1,90 @@
+"""Rafraichissement et fraicheur des instantanes materialises de reporting."""
+
+import logging
+from datetime import datetime, timezone
+from threading import Event, Thread
+from time import monotonic
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.reporting import SNAPSHOT_VIEWS
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_snapshots(db: Session, concurrently: bool = True, views: tuple[str, ...] = SNAPSHOT_VIEWS) -> dict[str, int]:
+    """Rafraichit les instantanes et journalise la date de chaque rafraichissement.
+
+    En mode ``concurrently``, PostgreSQL calcule la difference avec l'index
+    unique et n'applique que les lignes modifiees sans bloquer les lectures.
+    """
+    durations: dict[str, int] = {}
+    for view_name in views:
+        if view_name not in SNAPSHOT_VIEWS:
+            raise ValueError(f"Instantane inconnu : {view_name}")
+        started = monotonic()
+        db.execute(text(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if concurrently else ''}{view_name}"))
+        durations[view_name] = round((monotonic() - started) * 1000)
+        db.execute(
+            text(
+                "INSERT INTO reporting_snapshot_refreshes (view_name, refreshed_at, duration_ms) VALUES (:view_name, now(), :duration_ms) "
+                "ON CONFLICT (view_name) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at, duration_ms = EXCLUDED.duration_ms"
+            ),
+            {"view_name": view_name, "duration_ms": durations[view_name]},
+        )
+        db.commit()
+    logger.info("reporting_snapshots_refreshed %s", " ".join(f"{name}={duration}ms" for name, duration in durations.items()))
+    return durations
+
+
+def snapshot_staleness_seconds(db: Session, views: tuple[str, ...] = SNAPSHOT_VIEWS) -> float | None:
+    """Age du plus ancien des instantanes demandes; None si jamais rafraichi."""
+    oldest = db.scalar(text("SELECT MIN(refreshed_at) FROM reporting_snapshot_refreshes WHERE view_name = ANY(:views)"), {"views": list(views)})
+    if oldest is None:
+        return None
+    return (datetime.now(timezone.utc) - oldest).total_seconds()
+
+
+def snapshots_are_fresh(db: Session, views: tuple[str, ...] = SNAPSHOT_VIEWS) -> bool:
+    """Vrai si la lecture sur instantane est activee et dans la borne de fraicheur."""
+    bound = settings.REPORTING_SNAPSHOT_MAX_STALENESS_SECONDS
+    if bound <= 0:
+        return False
+    staleness = snapshot_staleness_seconds(db, views)
+    return staleness is not None and staleness <= bound
+
+
+class SnapshotRefreshScheduler:
+    """Thread de fond qui rafraichit les instantanes a intervalle fixe."""
+
+    def __init__(self, session_factory, interval_seconds: float, concurrently: bool = True):
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.concurrently = concurrently
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name="reporting-snapshot-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = 5.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            db = self.session_factory()
+            try:
+                refresh_snapshots(db, concurrently=self.concurrently)
+            except Exception:
+                db.rollback()
+                logger.exception("reporting_snapshots_refresh_failed")
+            finally:
+                db.close()
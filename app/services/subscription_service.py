@@ -1,12 +1,20 @@
+import logging
 from datetime import date, datetime, timezone
 from decimal import Decimal
+from time import monotonic
 
-from sqlalchemy import select
+from sqlalchemy import exists, insert, select, update
 from sqlalchemy.orm import Session, joinedload
 
 from app.core.config import settings
-from app.models.models import AccountRole, AccountingEntry, Instrument, Subscription, Transaction
-from app.services.portfolio_service import audit, require_account_access
+from app.models.models import AccountRole, BatchCheckpoint, Instrument, Subscription, Transaction
+from app.services.investment_metrics import invalidate_tma_cache
+from app.services.ledger import entry, post_entries
+from app.services.portfolio_service import audit, audit_many, require_account_access
+
+logger = logging.getLogger(__name__)
+MATURITY_JOB = "maturity_transactions"
+LIVE_MATURITY_STATUSES = ["PENDING_APPROVAL", "APPROVED", "EXECUTED"]
 
 
 class SubscriptionService:
@@ -18,7 +26,7 @@ class SubscriptionService:
         subscriptions = list(db.scalars(query).unique())
         created: list[Transaction] = []
         for subscription in subscriptions:
-            existing = db.scalar(select(Transaction.id).where(Transaction.subscription_id == subscription.id, Transaction.transaction_type == "REMBOURSEMENT_MATURITE", Transaction.status.in_(["PENDING_APPROVAL", "APPROVED", "EXECUTED"])))
+            existing = db.scalar(select(Transaction.id).where(Transaction.subscription_id == subscription.id, Transaction.transaction_type == "REMBOURSEMENT_MATURITE", Transaction.status.in_(LIVE_MATURITY_STATUSES)))
             if existing:
                 continue
             transaction = Transaction(
@@ -35,6 +43,93 @@ class SubscriptionService:
         db.commit()
         return created
 
+    @staticmethod
+    def run_maturity_batch(db: Session, as_of: date, client_id: int | None = None, page_size: int | None = None) -> dict:
+        """Batch de maturite par pages, committe et reprenable.
+
+        Chaque page est lue par keyset sur ``id`` avec un anti-join sur les
+        remboursements deja crees, inseree en masse puis committee avec son
+        point de reprise : une execution interrompue repart de la derniere
+        page validee.
+        """
+        page_size = page_size or settings.MATURITY_BATCH_SIZE
+        run_key = f"{as_of.isoformat()}:{client_id if client_id is not None else 'ALL'}"
+        checkpoint = db.scalar(select(BatchCheckpoint).where(BatchCheckpoint.job_name == MATURITY_JOB, BatchCheckpoint.run_key == run_key))
+        if not checkpoint:
+            checkpoint = BatchCheckpoint(job_name=MATURITY_JOB, run_key=run_key, last_id=0, processed=0, status="RUNNING")
+            db.add(checkpoint)
+        elif checkpoint.status != "RUNNING":
+            checkpoint.last_id, checkpoint.processed, checkpoint.status = 0, 0, "RUNNING"
+        db.commit()
+        resumed_from = checkpoint.last_id
+        started = monotonic()
+        pages = 0
+        created = 0
+        already_matured = exists().where(
+            Transaction.subscription_id == Subscription.id,
+            Transaction.transaction_type == "REMBOURSEMENT_MATURITE",
+            Transaction.status.in_(LIVE_MATURITY_STATUSES),
+        )
+        while True:
+            query = (
+                select(Subscription.id, Subscription.account_id, Subscription.current_value, Instrument.currency, Instrument.code)
+                .join(Instrument, Instrument.id == Subscription.instrument_id)
+                .where(Subscription.status == "ACTIVE", Subscription.effective_maturity_date <= as_of, Subscription.id > checkpoint.last_id, ~already_matured)
+                .order_by(Subscription.id)
+                .limit(page_size)
+            )
+            if client_id is not None:
+                query = query.join(AccountRole, AccountRole.account_id == Subscription.account_id).where(AccountRole.client_id == client_id, AccountRole.is_active.is_(True))
+            rows = db.execute(query).all()
+            if not rows:
+                break
+            transaction_ids = db.scalars(
+                insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "transaction_type": "REMBOURSEMENT_MATURITE",
+                        "destination_account_id": row.account_id,
+                        "amount": row.current_value,
+                        "currency": row.currency,
+                        "description": f"Remboursement automatique à maturité - {row.code}",
+                        "status": "PENDING_APPROVAL",
+                        "is_automatic": True,
+                        "subscription_id": row.id,
+                    }
+                    for row in rows
+                ],
+            ).all()
+            db.execute(
+                update(Subscription).where(Subscription.id.in_([row.id for row in rows])).values(status="MATURITE_EN_ATTENTE"),
+                execution_options={"synchronize_session": False},
+            )
+            audit_many(
+                db,
+                client_id,
+                "MATURITY_TRANSACTION_CREATED",
+                "transaction",
+                ((transaction_id, {"subscription_id": row.id, "amount": str(row.current_value)}) for row, transaction_id in zip(rows, transaction_ids)),
+            )
+            checkpoint.last_id = rows[-1].id
+            checkpoint.processed += len(rows)
+            db.commit()
+            pages += 1
+            created += len(rows)
+        checkpoint.status = "COMPLETED"
+        db.commit()
+        duration = monotonic() - started
+        result = {
+            "as_of": as_of,
+            "run_key": run_key,
+            "resumed_from_id": resumed_from,
+            "pages": pages,
+            "transactions_created": created,
+            "total_processed": checkpoint.processed,
+            "duration_ms": round(duration * 1000),
+        }
+        logger.info("maturity_batch_completed run_key=%s resumed_from_id=%s pages=%s transactions=%s duration_ms=%s", run_key, resumed_from, pages, created, result["duration_ms"])
+        return result
+
     @staticmethod
     def create(db: Session, client_id: int, account_id: int, instrument_id: int, invested_amount: Decimal, units: Decimal | None = None) -> Subscription:
         account = require_account_access(db, account_id, client_id, operation=True)
@@ -83,16 +178,19 @@ class SubscriptionService:
         db.add(transaction)
         db.flush()
         if settings.PROTOTYPE_AUTO_APPROVE_SUBSCRIPTIONS:
-            db.add(AccountingEntry(transaction_id=transaction.id, account_code=f"CLIENT_{account.id}", direction="CREDIT", amount=invested_amount, currency=account.currency))
-            db.add(AccountingEntry(transaction_id=transaction.id, account_code=f"INVESTMENT_{instrument.code}", direction="DEBIT", amount=invested_amount, currency=account.currency))
+            entries = [
+                entry(transaction.id, f"CLIENT_{account.id}", "CREDIT", invested_amount, account.currency),
+                entry(transaction.id, f"INVESTMENT_{instrument.code}", "DEBIT", invested_amount, account.currency),
+            ]
             if fee_amount:
                 fee_transaction = Transaction(transaction_type="FRAIS", source_account_id=account.id, amount=fee_amount, currency=account.currency, description=f"Frais d'entrée {instrument.code}", status="EXECUTED", executed_at=datetime.now(timezone.utc), subscription_id=subscription.id, created_by_client_id=client_id)
                 db.add(fee_transaction)
                 db.flush()
-                db.add_all([
-                    AccountingEntry(transaction_id=fee_transaction.id, account_code=f"CLIENT_{account.id}", direction="DEBIT", amount=fee_amount, currency=account.currency),
-                    AccountingEntry(transaction_id=fee_transaction.id, account_code="FEE_REVENUE", direction="CREDIT", amount=fee_amount, currency=account.currency),
-                ])
+                entries += [
+                    entry(fee_transaction.id, f"CLIENT_{account.id}", "DEBIT", fee_amount, account.currency),
+                    entry(fee_transaction.id, "FEE_REVENUE", "CREDIT", fee_amount, account.currency),
+                ]
+            post_entries(db, entries)
         audit(db, client_id, "SUBSCRIPTION_CREATED", "subscription", subscription.id, {"instrument": instrument.code, "amount": str(invested_amount)})
         db.commit()
         db.refresh(subscription)
@@ -131,9 +229,12 @@ class SubscriptionService:
         transaction = Transaction(transaction_type="RACHAT", destination_account_id=account.id, amount=amount, currency=account.currency, description=f"Rachat de la souscription {subscription.id}", status="EXECUTED", executed_at=datetime.now(timezone.utc), subscription_id=subscription.id, created_by_client_id=client_id)
         db.add(transaction)
         db.flush()
-        db.add(AccountingEntry(transaction_id=transaction.id, account_code=f"INVESTMENT_{subscription.instrument.code}", direction="CREDIT", amount=amount, currency=account.currency))
-        db.add(AccountingEntry(transaction_id=transaction.id, account_code=f"CLIENT_{account.id}", direction="DEBIT", amount=amount, currency=account.currency))
+        post_entries(db, [
+            entry(transaction.id, f"INVESTMENT_{subscription.instrument.code}", "CREDIT", amount, account.currency),
+            entry(transaction.id, f"CLIENT_{account.id}", "DEBIT", amount, account.currency),
+        ])
         audit(db, client_id, "SUBSCRIPTION_REDEEMED", "subscription", subscription.id, {"amount": str(amount)})
         db.commit()
+        invalidate_tma_cache()
         db.refresh(subscription)
         return subscription
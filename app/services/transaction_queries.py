@@ -0,0 +1,69 @@
+"""Requetes de visibilite des transactions d'un ensemble de comptes.
+
+Un filtre ``source IN (...) OR destination IN (...)`` empeche souvent
+PostgreSQL d'utiliser les index ``(compte, created_at)`` et degenere en
+parcours sequentiel. Les transactions visibles sont donc exprimees comme un
+UNION ALL de deux parcours d'index, chacun trie et borne avant la fusion.
+
+La jointure de retour porte sur ``(id, created_at)`` et reprend les criteres :
+sur les tables partitionnees par mois, un filtre ``created_at >= since``
+elimine les partitions hors periode des deux cotes de la jointure. Les flux
+du rapport client sont rattaches au mois d'``executed_at`` mais gardent cette
+borne sur ``created_at`` pour l'elagage.
+"""
+
+from collections.abc import Sequence
+from datetime import datetime
+
+from sqlalchemy import ColumnElement, Select, Subquery, and_, or_, select, tuple_, union_all
+
+from app.models.models import Transaction
+
+
+def visible_transaction_ids(
+    account_ids: Sequence[int] | Select,
+    *criteria: ColumnElement[bool],
+    after: tuple[datetime, int] | None = None,
+    limit: int | None = None,
+    descending: bool = True,
+) -> Subquery:
+    """Sous-requete ``(id, created_at)`` des transactions touchant ``account_ids``.
+
+    La branche destination exclut les mouvements deja retenus cote source
+    (virement interne) : l'UNION ALL reste sans doublon. ``criteria``,
+    ``after`` et ``limit`` sont appliques dans chaque branche pour que le tri
+    et la borne descendent jusqu'a l'index.
+    """
+    order = (Transaction.created_at.desc(), Transaction.id.desc()) if descending else (Transaction.created_at.asc(), Transaction.id.asc())
+    branches = []
+    for condition in (
+        Transaction.source_account_id.in_(account_ids),
+        and_(Transaction.destination_account_id.in_(account_ids), or_(Transaction.source_account_id.is_(None), Transaction.source_account_id.not_in(account_ids))),
+    ):
+        branch = select(Transaction.id, Transaction.created_at).where(condition, *criteria)
+        if after:
+            key = tuple_(Transaction.created_at, Transaction.id)
+            branch = branch.where(key < after if descending else key > after)
+        if limit:
+            branch = branch.order_by(*order).limit(limit)
+        branches.append(branch)
+    return union_all(*branches).subquery("visible_transactions")
+
+
+def visible_join(ids: Subquery) -> ColumnElement[bool]:
+    """Condition de jointure des ``Transaction`` sur une sous-requete ``visible_transaction_ids``."""
+    return and_(ids.c.id == Transaction.id, ids.c.created_at == Transaction.created_at)
+
+
+def visible_transactions(
+    account_ids: Sequence[int] | Select,
+    *criteria: ColumnElement[bool],
+    after: tuple[datetime, int] | None = None,
+    limit: int | None = None,
+    descending: bool = True,
+) -> Select[tuple[Transaction]]:
+    """Transactions visibles triees par ``(created_at, id)``, bornees a ``limit``."""
+    ids = visible_transaction_ids(account_ids, *criteria, after=after, limit=limit, descending=descending)
+    order = (Transaction.created_at.desc(), Transaction.id.desc()) if descending else (Transaction.created_at.asc(), Transaction.id.asc())
+    query = select(Transaction).join(ids, visible_join(ids)).where(*criteria).order_by(*order)
+    return query.limit(limit) if limit else query
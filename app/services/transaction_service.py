@@ -1,11 +1,69 @@
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future
 from datetime import datetime, timezone
 from decimal import Decimal
 
-from sqlalchemy import or_, select
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session, aliased
 
+from app.core.config import settings
 from app.models.models import Account, AccountRole, AccountingEntry, InterestPayment, Subscription, Transaction
-from app.services.portfolio_service import audit, get_account_for_client, require_account_access
+from app.services.investment_metrics import invalidate_tma_cache
+from app.services.ledger import entry, post_entries
+from app.services.portfolio_service import OPERATING_ROLES, audit, get_account_for_client, require_account_access
+from app.services.posting_engine import PostingEngine, PostingLeg, current_posting_engine
+from app.services.transaction_queries import visible_join, visible_transaction_ids, visible_transactions
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+EXPORT_COLUMNS = (
+    "id", "created_at", "executed_at", "transaction_type", "status", "amount", "currency",
+    "source_account_number", "destination_account_number", "description",
+)
+
+
+def _ledger_entries(transaction_type: str, source: Account | None, destination: Account | None) -> list[tuple[str, str]]:
+    if transaction_type == "DEPOT":
+        return [("BANK_SETTLEMENT", "DEBIT"), (f"CLIENT_{destination.id}", "CREDIT")]
+    if transaction_type == "RETRAIT":
+        return [(f"CLIENT_{source.id}", "DEBIT"), ("BANK_SETTLEMENT", "CREDIT")]
+    if transaction_type == "REMBOURSEMENT_MATURITE":
+        return [("INVESTMENT_POSITION", "CREDIT"), (f"CLIENT_{destination.id}", "DEBIT")]
+    if transaction_type == "PAIEMENT_INTERET":
+        return [("INTEREST_EXPENSE", "DEBIT"), (f"CLIENT_{destination.id}", "CREDIT")]
+    return [(f"CLIENT_{source.id}", "DEBIT"), (f"CLIENT_{destination.id}", "CREDIT")]
+
+
+def _batch_refusal(transaction: Transaction | None, checker_id: int, roles: dict[int, str], accounts: dict[int, Account], available: dict[int, Decimal]) -> str | None:
+    """Reprend en memoire les controles de ``approve`` puis ``execute``; None si la transaction est executable."""
+    if transaction is None:
+        return "Transaction introuvable"
+    if transaction.status != "PENDING_APPROVAL":
+        return "La transaction n'est pas en attente de validation"
+    if transaction.created_by_client_id == checker_id:
+        return "Le maker ne peut pas être son propre checker"
+    if transaction.transaction_type == "CONTREPASSATION":
+        return "Une contrepassation se valide individuellement"
+    relevant_account = transaction.source_account_id or transaction.destination_account_id
+    if not relevant_account:
+        return "Transaction sans compte"
+    if relevant_account not in roles:
+        return "Accès refusé à ce compte"
+    if accounts[relevant_account].status != "ACTIF":
+        return "Le compte est fermé ou suspendu"
+    if roles[relevant_account] not in OPERATING_ROLES:
+        return "Le rôle ne permet pas cette opération"
+    source = accounts.get(transaction.source_account_id) if transaction.source_account_id in roles else None
+    destination = accounts.get(transaction.destination_account_id) if transaction.destination_account_id in roles else None
+    if source and source.currency != transaction.currency:
+        return "La devise du compte source ne correspond pas à la transaction"
+    if destination and destination.currency != transaction.currency:
+        return "La devise du compte destination ne correspond pas à la transaction"
+    if transaction.transaction_type in {"RETRAIT", "TRANSFERT"} and (not source or available[source.id] < Decimal(transaction.amount)):
+        return "Solde disponible insuffisant"
+    if transaction.transaction_type in {"DEPOT", "TRANSFERT", "REMBOURSEMENT_MATURITE", "PAIEMENT_INTERET"} and not destination:
+        return "Compte destination introuvable"
+    return None
 
 
 class TransactionService:
@@ -70,6 +128,103 @@ class TransactionService:
             db.rollback()
             raise
 
+    @staticmethod
+    def approve_batch(db: Session, transaction_ids: list[int], checker_id: int) -> list[dict]:
+        """Valide et execute un lot de transactions en une seule transaction SQL.
+
+        Transactions puis comptes sont verrouilles par id croissant, ordre
+        commun a tous les lots pour eviter les interblocages. Les regles
+        maker/checker et de solde sont evaluees en memoire; une transaction
+        refusee n'empeche pas l'execution des autres. Avec le moteur de
+        comptabilisation, le lot commite les validations puis confie soldes
+        et ecritures aux shards, comme ``approve``.
+        """
+        ids = sorted(set(transaction_ids))
+        transactions = {item.id: item for item in db.scalars(select(Transaction).where(Transaction.id.in_(ids)).order_by(Transaction.id).with_for_update())}
+        account_ids = sorted({account_id for item in transactions.values() for account_id in (item.source_account_id, item.destination_account_id) if account_id})
+        roles = dict(db.execute(select(AccountRole.account_id, AccountRole.role).where(AccountRole.client_id == checker_id, AccountRole.is_active.is_(True), AccountRole.account_id.in_(account_ids))).all())
+        accounts = {item.id: item for item in db.scalars(select(Account).where(Account.id.in_(account_ids)).order_by(Account.id).with_for_update())}
+        available = {account_id: Decimal(account.available_balance) for account_id, account in accounts.items()}
+
+        engine = current_posting_engine()
+        now = datetime.now(timezone.utc)
+        results, entries, executed, approved = [], [], [], []
+        for transaction_id in ids:
+            transaction = transactions.get(transaction_id)
+            refusal = _batch_refusal(transaction, checker_id, roles, accounts, available)
+            if refusal:
+                results.append({"transaction_id": transaction_id, "success": False, "status": transaction.status if transaction else None, "error": refusal})
+                continue
+            amount = Decimal(transaction.amount)
+            source = accounts.get(transaction.source_account_id) if transaction.source_account_id in roles else None
+            destination = accounts.get(transaction.destination_account_id) if transaction.destination_account_id in roles else None
+            if engine is not None:
+                if transaction.transaction_type in {"RETRAIT", "TRANSFERT"}:
+                    available[source.id] -= amount
+                if transaction.transaction_type in {"DEPOT", "TRANSFERT", "REMBOURSEMENT_MATURITE", "PAIEMENT_INTERET"}:
+                    available[destination.id] += amount
+                transaction.approved_by_client_id = checker_id
+                transaction.status = "APPROVED"
+                approved.append(transaction)
+                continue
+            if transaction.transaction_type in {"RETRAIT", "TRANSFERT"}:
+                source.balance -= amount
+                source.available_balance -= amount
+                available[source.id] -= amount
+            if transaction.transaction_type in {"DEPOT", "TRANSFERT", "REMBOURSEMENT_MATURITE", "PAIEMENT_INTERET"}:
+                destination.balance += amount
+                destination.available_balance += amount
+                available[destination.id] += amount
+            transaction.approved_by_client_id = checker_id
+            transaction.status = "EXECUTED"
+            transaction.executed_at = now
+            entries.extend(
+                entry(transaction.id, account_code, direction, amount, transaction.currency)
+                for account_code, direction in _ledger_entries(transaction.transaction_type, source, destination)
+            )
+            audit(db, checker_id, "TRANSACTION_EXECUTED", "transaction", transaction.id, {"status": transaction.status, "batch": True})
+            executed.append(transaction)
+            results.append({"transaction_id": transaction_id, "success": True, "status": transaction.status, "error": None})
+
+        if engine is not None:
+            return TransactionService._approve_batch_posted(db, engine, approved, results)
+        try:
+            post_entries(db, entries)
+            maturity_subscriptions = [item.subscription_id for item in executed if item.transaction_type == "REMBOURSEMENT_MATURITE" and item.subscription_id]
+            if maturity_subscriptions:
+                db.execute(update(Subscription).where(Subscription.id.in_(maturity_subscriptions)).values(status="MATURE"))
+            coupon_transactions = [item.id for item in executed if item.transaction_type == "PAIEMENT_INTERET"]
+            if coupon_transactions:
+                db.execute(update(InterestPayment).where(InterestPayment.transaction_id.in_(coupon_transactions)).values(status="PAYE"))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        if executed:
+            invalidate_tma_cache()
+        return results
+
+    @staticmethod
+    def _approve_batch_posted(db: Session, engine: PostingEngine, approved: list[Transaction], results: list[dict]) -> list[dict]:
+        """Fin de ``approve_batch`` avec le moteur : validations commitees, puis
+        une mise en file par transaction, toutes soumises avant la premiere attente."""
+        try:
+            postings = [(transaction, *TransactionService._posting_for(db, transaction, None, batch=True)) for transaction in approved]
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        futures = [(transaction, engine.submit(legs, apply, (transaction.id,))) for transaction, legs, apply in postings]
+        for transaction, future in futures:
+            transaction_id = transaction.id
+            try:
+                TransactionService._await_posting(db, engine, future, transaction)
+                results.append({"transaction_id": transaction_id, "success": True, "status": transaction.status, "error": None})
+            except Exception as exc:
+                db.rollback()
+                results.append({"transaction_id": transaction_id, "success": False, "status": db.scalar(select(Transaction.status).where(Transaction.id == transaction_id)), "error": str(exc) or type(exc).__name__})
+        return sorted(results, key=lambda item: item["transaction_id"])
+
     @staticmethod
     def reject(db: Session, transaction_id: int, checker_id: int, reason: str) -> Transaction:
         transaction = db.scalar(select(Transaction).where(Transaction.id == transaction_id).with_for_update())
@@ -97,6 +252,9 @@ class TransactionService:
             return TransactionService._execute_reversal(db, transaction, actor_id)
         if transaction.status not in {"APPROVED", "PENDING_APPROVAL"}:
             raise ValueError("La transaction ne peut pas être exécutée")
+        engine = current_posting_engine()
+        if engine is not None:
+            return TransactionService._execute_posted(db, engine, transaction, actor_id)
 
         source = get_account_for_client(db, transaction.source_account_id, actor_id, for_update=True) if transaction.source_account_id and actor_id else db.scalar(select(Account).where(Account.id == transaction.source_account_id).with_for_update()) if transaction.source_account_id else None
         destination = get_account_for_client(db, transaction.destination_account_id, actor_id, for_update=True) if transaction.destination_account_id and actor_id else db.scalar(select(Account).where(Account.id == transaction.destination_account_id).with_for_update()) if transaction.destination_account_id else None
@@ -119,18 +277,7 @@ class TransactionService:
 
         transaction.status = "EXECUTED"
         transaction.executed_at = datetime.now(timezone.utc)
-        if transaction.transaction_type == "DEPOT":
-            entries = [("BANK_SETTLEMENT", "DEBIT"), (f"CLIENT_{destination.id}", "CREDIT")]
-        elif transaction.transaction_type == "RETRAIT":
-            entries = [(f"CLIENT_{source.id}", "DEBIT"), ("BANK_SETTLEMENT", "CREDIT")]
-        elif transaction.transaction_type == "REMBOURSEMENT_MATURITE":
-            entries = [("INVESTMENT_POSITION", "CREDIT"), (f"CLIENT_{destination.id}", "DEBIT")]
-        elif transaction.transaction_type == "PAIEMENT_INTERET":
-            entries = [("INTEREST_EXPENSE", "DEBIT"), (f"CLIENT_{destination.id}", "CREDIT")]
-        else:
-            entries = [(f"CLIENT_{source.id}", "DEBIT"), (f"CLIENT_{destination.id}", "CREDIT")]
-        for account_code, direction in entries:
-            db.add(AccountingEntry(transaction_id=transaction.id, account_code=account_code, direction=direction, amount=amount, currency=transaction.currency))
+        post_entries(db, (entry(transaction.id, account_code, direction, amount, transaction.currency) for account_code, direction in _ledger_entries(transaction.transaction_type, source, destination)))
         audit(db, actor_id or transaction.created_by_client_id, "TRANSACTION_EXECUTED", "transaction", transaction.id, {"status": transaction.status})
         if transaction.transaction_type == "REMBOURSEMENT_MATURITE" and transaction.subscription_id:
             subscription = db.get(Subscription, transaction.subscription_id)
@@ -141,9 +288,132 @@ class TransactionService:
             if payment:
                 payment.status = "PAYE"
         db.commit()
+        invalidate_tma_cache()
         db.refresh(transaction)
         return transaction
 
+    @staticmethod
+    def _execute_posted(db: Session, engine: PostingEngine, transaction: Transaction, actor_id: int | None) -> Transaction:
+        """Execution via le moteur de comptabilisation : soldes et ecritures sont
+        appliques par l'ecrivain du compte, dans son commit groupe."""
+        legs, apply = TransactionService._posting_for(db, transaction, actor_id)
+        # Le verrou pris par approve() est libere avant la mise en file : le
+        # shard doit pouvoir verrouiller la transaction a son tour. Une
+        # transaction restee APPROVED (arret entre ce commit et le shard) est
+        # reprise par ``resume_approved``.
+        if transaction.status != "APPROVED":
+            raise ValueError("La transaction ne peut pas être exécutée")
+        db.commit()
+        return TransactionService._await_posting(db, engine, engine.submit(legs, apply, (transaction.id,)), transaction)
+
+    @staticmethod
+    def _posting_for(db: Session, transaction: Transaction, actor_id: int | None, batch: bool = False) -> tuple[list[PostingLeg], Callable[[Session], None]]:
+        """Mouvements de solde et ecritures d'une transaction APPROVED, pour le shard."""
+        source = (get_account_for_client(db, transaction.source_account_id, actor_id) if actor_id else db.get(Account, transaction.source_account_id)) if transaction.source_account_id else None
+        destination = (get_account_for_client(db, transaction.destination_account_id, actor_id) if actor_id else db.get(Account, transaction.destination_account_id)) if transaction.destination_account_id else None
+        if source and source.currency != transaction.currency:
+            raise ValueError("La devise du compte source ne correspond pas à la transaction")
+        if destination and destination.currency != transaction.currency:
+            raise ValueError("La devise du compte destination ne correspond pas à la transaction")
+        amount = Decimal(transaction.amount)
+        legs = []
+        if transaction.transaction_type in {"RETRAIT", "TRANSFERT"}:
+            if not source:
+                raise ValueError("Solde disponible insuffisant")
+            legs.append(PostingLeg(source.id, -amount, -amount, require_funds=True))
+        if transaction.transaction_type in {"DEPOT", "TRANSFERT", "REMBOURSEMENT_MATURITE", "PAIEMENT_INTERET"}:
+            if not destination:
+                raise ValueError("Compte destination introuvable")
+            legs.append(PostingLeg(destination.id, amount, amount))
+        entries = _ledger_entries(transaction.transaction_type, source, destination)
+        transaction_id = transaction.id
+        checker_id = transaction.approved_by_client_id
+
+        def apply(session: Session) -> None:
+            # Seule la validation mise en file s'execute : une transaction deja
+            # executee, rejetee ou revalidee entre-temps est refusee par le shard
+            # (la ligne est verrouillee par le lot, avant les comptes).
+            row = session.get(Transaction, transaction_id)
+            if row.status != "APPROVED" or row.approved_by_client_id != checker_id:
+                raise ValueError("La transaction ne peut pas être exécutée")
+            row.status = "EXECUTED"
+            row.executed_at = datetime.now(timezone.utc)
+            post_entries(session, (entry(row.id, code, direction, amount, row.currency) for code, direction in entries))
+            audit(session, actor_id or row.approved_by_client_id, "TRANSACTION_EXECUTED", "transaction", row.id, {"status": row.status, "batch": True} if batch else {"status": row.status})
+            if row.transaction_type == "REMBOURSEMENT_MATURITE" and row.subscription_id:
+                session.execute(update(Subscription).where(Subscription.id == row.subscription_id).values(status="MATURE"))
+            if row.transaction_type == "PAIEMENT_INTERET":
+                session.execute(update(InterestPayment).where(InterestPayment.transaction_id == row.id).values(status="PAYE"))
+
+        return legs, apply
+
+    @staticmethod
+    def _await_posting(db: Session, engine: PostingEngine, future: Future, transaction: Transaction) -> Transaction:
+        transaction_id, checker_id = transaction.id, transaction.approved_by_client_id
+        try:
+            future.result(engine.post_timeout)
+        except TimeoutError:
+            # Le mouvement reste en file et peut encore s'appliquer : la
+            # transaction reste APPROVED et son issue est traitee a l'arrivee.
+            future.add_done_callback(lambda done: TransactionService._settle_late_posting(engine, done, transaction_id, checker_id))
+            raise
+        except Exception:
+            TransactionService._revert_approval(db, transaction_id, checker_id)
+            db.commit()
+            raise
+        invalidate_tma_cache()
+        db.refresh(transaction)
+        return transaction
+
+    @staticmethod
+    def _revert_approval(db: Session, transaction_id: int, checker_id: int) -> None:
+        """Refus certain du shard : retour en attente, sauf si une autre mise en
+        file l'a executee entre-temps."""
+        db.execute(
+            update(Transaction)
+            .where(Transaction.id == transaction_id, Transaction.status == "APPROVED", Transaction.approved_by_client_id == checker_id)
+            .values(status="PENDING_APPROVAL", approved_by_client_id=None)
+        )
+
+    @staticmethod
+    def _settle_late_posting(engine: PostingEngine, future: Future, transaction_id: int, checker_id: int) -> None:
+        """Issue d'un mouvement arrive apres l'expiration de l'attente de l'appelant."""
+        if future.exception() is None:
+            invalidate_tma_cache()
+            return
+        db = engine.session_factory()
+        try:
+            TransactionService._revert_approval(db, transaction_id, checker_id)
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def resume_approved(db: Session) -> list[dict]:
+        """Remet au moteur les transactions validees mais jamais executees.
+
+        Sans moteur, validation et execution partagent un commit : aucune
+        transaction ne reste APPROVED. Avec le moteur, un arret entre le commit
+        de validation et le shard la laisse APPROVED. Relancer une transaction
+        encore en file est sans risque : le shard refuse la seconde execution.
+        """
+        engine = current_posting_engine()
+        if engine is None:
+            return []
+        results = []
+        transaction_ids = db.scalars(
+            select(Transaction.id).where(Transaction.status == "APPROVED", Transaction.transaction_type != "CONTREPASSATION").order_by(Transaction.id)
+        ).all()
+        for transaction_id in transaction_ids:
+            transaction = db.get(Transaction, transaction_id)
+            try:
+                TransactionService._execute_posted(db, engine, transaction, None)
+                results.append({"transaction_id": transaction_id, "success": True, "status": transaction.status, "error": None})
+            except Exception as exc:
+                db.rollback()
+                results.append({"transaction_id": transaction_id, "success": False, "status": db.scalar(select(Transaction.status).where(Transaction.id == transaction_id)), "error": str(exc) or type(exc).__name__})
+        return results
+
     @staticmethod
     def reverse(db: Session, transaction_id: int, actor_id: int, reason: str) -> Transaction:
         original = db.scalar(select(Transaction).where(Transaction.id == transaction_id).with_for_update())
@@ -200,16 +470,10 @@ class TransactionService:
         reversal.approved_by_client_id = actor_id
         reversal.executed_at = datetime.now(timezone.utc)
         reversal.version = 2
-        for entry in db.scalars(select(AccountingEntry).where(AccountingEntry.transaction_id == original.id)).all():
-            db.add(AccountingEntry(
-                transaction_id=reversal.id,
-                account_code=entry.account_code,
-                direction="CREDIT" if entry.direction == "DEBIT" else "DEBIT",
-                amount=entry.amount,
-                currency=entry.currency,
-                posting_version=2,
-                is_reversal=True,
-            ))
+        post_entries(db, [
+            entry(reversal.id, item.account_code, "CREDIT" if item.direction == "DEBIT" else "DEBIT", item.amount, item.currency, posting_version=2, is_reversal=True)
+            for item in db.scalars(select(AccountingEntry).where(AccountingEntry.transaction_id == original.id)).all()
+        ])
         original.version += 1
         original.reversed_at = datetime.now(timezone.utc)
         if original.subscription_id and original.transaction_type == "SOUSCRIPTION":
@@ -221,7 +485,40 @@ class TransactionService:
         db.refresh(reversal)
         return reversal
 
+    @staticmethod
+    def history_page(db: Session, account_ids: list[int], limit: int, cursor: str | None = None) -> tuple[list[Transaction], str | None]:
+        """Page d'historique triee par ``(created_at, id)`` decroissant et curseur de la page suivante."""
+        if not account_ids:
+            return [], None
+        after = decode_cursor(cursor) if cursor else None
+        rows = list(db.scalars(visible_transactions(account_ids, after=after, limit=limit + 1)))
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    @staticmethod
+    def export_rows(db: Session, account_ids: list[int], batch_size: int | None = None) -> Iterator[tuple]:
+        """Parcourt tout l'historique par curseur serveur, ``batch_size`` lignes en memoire au plus."""
+        if not account_ids:
+            return
+        ids = visible_transaction_ids(account_ids)
+        source = aliased(Account)
+        destination = aliased(Account)
+        query = (
+            select(
+                Transaction.id, Transaction.created_at, Transaction.executed_at, Transaction.transaction_type, Transaction.status,
+                Transaction.amount, Transaction.currency, source.account_number, destination.account_number, Transaction.description,
+            )
+            .join(ids, visible_join(ids))
+            .outerjoin(source, source.id == Transaction.source_account_id)
+            .outerjoin(destination, destination.id == Transaction.destination_account_id)
+            .order_by(Transaction.created_at.desc(), Transaction.id.desc())
+            .execution_options(yield_per=batch_size or settings.TRANSACTION_EXPORT_BATCH_SIZE)
+        )
+        yield from db.execute(query)
+
     @staticmethod
     def list_for_client(db: Session, client_id: int, limit: int = 100) -> list[Transaction]:
-        account_ids = select(Account.id).join(Account.roles).where(AccountRole.client_id == client_id, AccountRole.is_active.is_(True))
-        return list(db.scalars(select(Transaction).where(or_(Transaction.source_account_id.in_(account_ids), Transaction.destination_account_id.in_(account_ids))).order_by(Transaction.created_at.desc()).limit(limit)))
+        account_ids = list(db.scalars(select(AccountRole.account_id).where(AccountRole.client_id == client_id, AccountRole.is_active.is_(True))))
+        return list(db.scalars(visible_transactions(account_ids, limit=limit))) if account_ids else []
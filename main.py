@@ -1,12 +1,56 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.ai.client import close_http_client
 from app.api.v1.api import api_router
 from app.core.config import settings
-from app.db.database import engine
+from app.db.database import SessionLocal, engine
+from app.services.assistant_service import assistant_stats
+from app.services.audit_writer import AuditWriter, current_audit_writer, install_audit_writer
+from app.services.posting_engine import PostingEngine, current_posting_engine, install_posting_engine
+from app.services.reporting_snapshots import SnapshotRefreshScheduler
+from app.services.transaction_service import TransactionService
 from sqlalchemy import text
 
 
+def resume_approved_transactions() -> None:
+    with SessionLocal() as db:
+        TransactionService.resume_approved(db)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    scheduler = None
+    if settings.REPORTING_SNAPSHOT_REFRESH_SECONDS > 0:
+        scheduler = SnapshotRefreshScheduler(SessionLocal, settings.REPORTING_SNAPSHOT_REFRESH_SECONDS)
+        scheduler.start()
+    posting_engine = None
+    if settings.POSTING_ENGINE_ENABLED:
+        posting_engine = PostingEngine(SessionLocal, settings.POSTING_ENGINE_SHARDS, settings.POSTING_ENGINE_MAX_BATCH, settings.POSTING_ENGINE_MAX_WAIT_MS / 1000, post_timeout=settings.POSTING_ENGINE_TIMEOUT_SECONDS)
+        posting_engine.start()
+        install_posting_engine(posting_engine)
+        await asyncio.to_thread(resume_approved_transactions)
+    audit_writer = None
+    if settings.AUDIT_MODE == "buffered":
+        audit_writer = AuditWriter(engine, settings.AUDIT_QUEUE_SIZE, settings.AUDIT_BATCH_SIZE, settings.AUDIT_FLUSH_INTERVAL_MS / 1000, settings.AUDIT_ENQUEUE_TIMEOUT_MS / 1000)
+        audit_writer.start()
+        install_audit_writer(audit_writer)
+    yield
+    if posting_engine:
+        install_posting_engine(None)
+        posting_engine.stop()
+    if audit_writer:
+        # Arret avant retrait : les commits restants ecrivent alors eux-memes leur lot.
+        audit_writer.stop()
+        install_audit_writer(None)
+    if scheduler:
+        scheduler.stop()
+    await close_http_client()
+
+
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
@@ -15,6 +59,7 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_PREFIX}/openapi.json",
     docs_url=f"{settings.API_V1_PREFIX}/docs",
     redoc_url=f"{settings.API_V1_PREFIX}/redoc",
+    lifespan=lifespan,
 )
 app.add_middleware(CORSMiddleware, allow_origins=settings.allowed_origins, allow_credentials=settings.ALLOW_CREDENTIALS, allow_methods=["*"], allow_headers=["*"])
 app.include_router(api_router, prefix=settings.API_V1_PREFIX)
@@ -30,6 +75,14 @@ def health():
     try:
         with engine.connect() as connection:
             connection.execute(text("SELECT 1"))
-        return {"status": "ok", "database": "ok"}
+        status = {"status": "ok", "database": "ok"}
     except Exception:
-        return {"status": "degraded", "database": "unavailable"}
+        status = {"status": "degraded", "database": "unavailable"}
+    posting_engine = current_posting_engine()
+    if posting_engine:
+        status["posting"] = posting_engine.stats()
+    audit_writer = current_audit_writer()
+    if audit_writer:
+        status["audit"] = audit_writer.stats()
+    status["assistant"] = assistant_stats()
+    return status
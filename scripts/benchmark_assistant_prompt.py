@@ -0,0 +1,136 @@
+"""Compare la taille et le temps de construction du prompt assistant, complet puis compacte.
+
+Usage : python -m scripts.benchmark_assistant_prompt [--synthetic taille] [--provider]
+
+Sans option, les contextes sont ceux des clients de la base (``python -m
+scripts.seed``). ``--synthetic`` construit un portefeuille de ``taille``
+positions, ordres et transactions. ``--provider`` mesure aussi la latence du
+fournisseur configure (``OPENROUTER_API_KEY``) pour chaque variante.
+"""
+
+import asyncio
+import json
+import sys
+from statistics import median
+from time import perf_counter
+
+from sqlalchemy import select
+
+from app.ai.client import OpenRouterClient, close_http_client
+from app.ai.compaction import estimate_tokens
+from app.ai.context import ClientContext, build_client_context
+from app.ai.prompt import build_messages
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import AccountRole
+
+QUESTIONS = (
+    "Quel est mon solde disponible en HTG ?",
+    "Quand arrive l'échéance de mon obligation ?",
+    "Pourquoi mon ordre 12 est-il en attente ?",
+    "Quelles sont mes dernières transactions ?",
+    "Explique-moi le TMA de mon portefeuille.",
+    "Que me conseilles-tu pour la suite ?",
+)
+
+
+def synthetic_context(size: int) -> dict:
+    positions = [
+        {
+            "instrument": f"Obligation {index}", "instrument_code": f"OBL-{index:03d}", "instrument_type": "Obligation" if index % 2 else "Fonds",
+            "currency": "USD" if index % 3 else "HTG", "invested_amount": "10000.00", "current_value": "10450.00", "return_amount": "450.00",
+            "tma_percentage": "6.25", "accrued_interest": "120.00", "paid_coupons": "300.00", "fees": "25.00",
+            "maturity_date": f"2027-{index % 12 + 1:02d}-15", "status": "ACTIVE",
+        }
+        for index in range(size)
+    ]
+    return {
+        "accounts": [
+            {"account_number": f"INV-{index:05d}", "type": "INVESTISSEMENT", "currency": "USD" if index % 2 else "HTG", "balance": "25000.00", "available_balance": "24000.00", "status": "ACTIF"}
+            for index in range(max(2, size // 5))
+        ],
+        "positions": positions,
+        "obligations": [item for item in positions if item["instrument_type"] == "Obligation"],
+        "orders": [
+            {
+                "id": index, "instrument": f"Obligation {index}", "amount": "5000.00", "currency": "USD", "status": "COMPLIANCE_REVIEW",
+                "status_explanation": "La demande est en cours de vérification du dossier.",
+                "steps": [{"code": code, "status": "PENDING"} for code in ("COMPLIANCE", "BACK_OFFICE", "CHECKER")],
+                "created_at": "2026-05-02T10:00:00+00:00", "account_number": "INV-00001",
+            }
+            for index in range(1, size + 1)
+        ],
+        "transactions": [
+            {"id": 1000 + index, "type": "DEPOT", "amount": "1500.00", "currency": "USD", "status": "EXECUTED", "created_at": "2026-05-01T09:00:00+00:00", "description": f"Dépôt {index}"}
+            for index in range(size)
+        ],
+        "portfolio_totals_by_currency": {"USD": {"invested_amount": "100000.00", "current_value": "104500.00", "accrued_interest": "1200.00", "fees": "250.00", "tma_percentage": "6.25"}},
+        "available_liquidity_by_currency": {"USD": "48000.00", "HTG": "48000.00"},
+    }
+
+
+def as_client_context(data: dict) -> ClientContext:
+    text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return ClientContext(data=data, text=text, digest="")
+
+
+def seeded_contexts() -> list[tuple[str, ClientContext]]:
+    with SessionLocal() as db:
+        client_ids = db.scalars(select(AccountRole.client_id).where(AccountRole.is_active.is_(True)).distinct().order_by(AccountRole.client_id)).all()
+        return [(f"client {client_id}", as_client_context(build_client_context(db, client_id))) for client_id in client_ids]
+
+
+def prompt_tokens(messages: list[dict[str, str]]) -> int:
+    return sum(estimate_tokens(item["content"]) for item in messages)
+
+
+def measure(context: ClientContext, question: str, budget: int) -> tuple[list[dict[str, str]], float]:
+    settings.ASSISTANT_CONTEXT_TOKEN_BUDGET = budget
+    started = perf_counter()
+    messages = build_messages(question, [], context)
+    return messages, (perf_counter() - started) * 1000
+
+
+async def provider_latency(messages: list[dict[str, str]]) -> float:
+    started = perf_counter()
+    await OpenRouterClient(settings).complete(messages)
+    return (perf_counter() - started) * 1000
+
+
+async def main() -> None:
+    arguments = sys.argv[1:]
+    with_provider = "--provider" in arguments
+    if "--synthetic" in arguments:
+        size = int(arguments[arguments.index("--synthetic") + 1])
+        contexts = [(f"synthetique {size}", as_client_context(synthetic_context(size)))]
+    else:
+        contexts = seeded_contexts()
+
+    budget = settings.ASSISTANT_CONTEXT_TOKEN_BUDGET
+    print(f"budget contexte={budget} jetons estimes, {len(QUESTIONS)} questions")
+    for label, context in contexts:
+        full_tokens, compact_tokens, full_ms, compact_ms = [], [], [], []
+        full_latency, compact_latency = [], []
+        for question in QUESTIONS:
+            full, elapsed = measure(context, question, 10**9)
+            full_tokens.append(prompt_tokens(full))
+            full_ms.append(elapsed)
+            compact, elapsed = measure(context, question, budget)
+            compact_tokens.append(prompt_tokens(compact))
+            compact_ms.append(elapsed)
+            if with_provider:
+                full_latency.append(await provider_latency(full))
+                compact_latency.append(await provider_latency(compact))
+        settings.ASSISTANT_CONTEXT_TOKEN_BUDGET = budget
+        line = (
+            f"{label:<16} jetons complet={median(full_tokens):>7.0f} compacte={median(compact_tokens):>6.0f}"
+            f"  construction complet={median(full_ms):.2f} ms compacte={median(compact_ms):.2f} ms"
+        )
+        if with_provider:
+            line += f"  fournisseur complet={median(full_latency):.0f} ms compacte={median(compact_latency):.0f} ms"
+        print(line)
+    await close_http_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""Mesure la latence du client assistant face a un fournisseur local simule.
+
+Usage : python -m scripts.benchmark_assistant_stream [appels] [fragments] [delai_ms_par_fragment]
+
+Le serveur local imite ``/chat/completions`` : reponse complete apres tous les
+fragments, ou evenements SSE espaces de ``delai_ms_par_fragment``. Le script
+compare un client HTTP ouvert par appel, le pool partage, et le delai du
+premier fragment en mode flux.
+"""
+
+import asyncio
+import json
+import sys
+from statistics import median
+from time import perf_counter
+
+from app.ai.client import OpenRouterClient, close_http_client
+from app.core.config import settings
+
+MESSAGES = [{"role": "user", "content": "Quel est mon solde ?"}]
+
+
+async def stub_provider(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, fragments: int, delay: float) -> None:
+    """Serveur HTTP/1.1 minimal avec keep-alive, une requete apres l'autre."""
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = next((int(line.split(b":")[1]) for line in head.split(b"\r\n") if line.lower().startswith(b"content-length:")), 0)
+            payload = json.loads(await reader.readexactly(length))
+            if payload.get("stream"):
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+                for index in range(fragments):
+                    await asyncio.sleep(delay)
+                    event = f"data: {json.dumps({'choices': [{'delta': {'content': f'mot{index} '}}]})}\n\n".encode()
+                    writer.write(b"%x\r\n%s\r\n" % (len(event), event))
+                    await writer.drain()
+                done = b"data: [DONE]\n\n"
+                writer.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(done), done))
+            else:
+                await asyncio.sleep(delay * fragments)
+                body = json.dumps({"model": "stub", "choices": [{"message": {"content": " ".join(f"mot{index}" for index in range(fragments))}}]}).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main() -> None:
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    fragments = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    delay = (float(sys.argv[3]) if len(sys.argv) > 3 else 10.0) / 1000
+
+    server = await asyncio.start_server(lambda reader, writer: stub_provider(reader, writer, fragments, delay), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    settings.OPENROUTER_BASE_URL = f"http://127.0.0.1:{port}"
+    settings.OPENROUTER_API_KEY = settings.OPENROUTER_API_KEY or "stub-key"
+    client = OpenRouterClient(settings)
+
+    per_call = []
+    for _ in range(calls):
+        await close_http_client()
+        started = perf_counter()
+        await client.complete(MESSAGES)
+        per_call.append(perf_counter() - started)
+
+    pooled = []
+    for _ in range(calls):
+        started = perf_counter()
+        await client.complete(MESSAGES)
+        pooled.append(perf_counter() - started)
+
+    first_token, streamed = [], []
+    for _ in range(calls):
+        started = perf_counter()
+        first = None
+        async for _ in client.stream(MESSAGES):
+            first = first or perf_counter() - started
+        first_token.append(first)
+        streamed.append(perf_counter() - started)
+
+    await close_http_client()
+    server.close()
+    await server.wait_closed()
+    print(f"appels={calls} fragments={fragments} delai={delay * 1000:.0f} ms/fragment")
+    print(f"client par appel     : {median(per_call) * 1000:7.1f} ms (mediane, reponse complete)")
+    print(f"pool partage         : {median(pooled) * 1000:7.1f} ms (mediane, reponse complete)")
+    print(f"flux, premier jeton  : {median(first_token) * 1000:7.1f} ms (mediane)")
+    print(f"flux, reponse entiere: {median(streamed) * 1000:7.1f} ms (mediane)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
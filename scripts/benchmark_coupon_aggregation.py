@@ -0,0 +1,75 @@
+"""Benchmark de regression des rapports sur un mandat de 10 000 positions.
+
+Le jeu de donnees est cree dans une transaction annulee a la fin : la base
+cible (TEST_DATABASE_URL, sinon DATABASE_URL) doit deja porter le schema.
+
+Usage : python -m scripts.benchmark_coupon_aggregation [positions] [coupons_par_position]
+"""
+
+import os
+import sys
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from time import perf_counter
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.models.models import Account, AccountRole, Client, ClientAuthentication, InterestPayment, Instrument, InstrumentType, Subscription
+from app.services.reporting_service import ReportingService
+
+
+def seed(db, positions: int, coupons_per_position: int) -> int:
+    checker = Client(client_type="INSTITUTIONNEL", risk_profile="MODERE", status="ACTIF")
+    checker.auth = ClientAuthentication(email="bench-mandat@profin.ht", password_hash="-", is_active=True)
+    account = Account(account_number="BENCH-MANDAT-001", account_type="INVESTISSEMENT", currency="USD", balance=0, available_balance=0, status="ACTIF")
+    account.roles.append(AccountRole(client=checker, role="MANDATAIRE", is_active=True))
+    instrument_type = InstrumentType(code="BENCH-OBL", name="Obligation", description="Benchmark")
+    db.add_all([checker, account, instrument_type])
+    db.flush()
+    instrument = Instrument(code="BENCH-OBL-2030", name="Obligation benchmark", issuer="Benchmark", annual_yield=5, issue_date=date(2024, 1, 1), maturity_date=date(2030, 1, 1), nominal_value=1000, minimum_amount=100, currency="USD", interest_frequency="TRIMESTRIEL", status="DISPONIBLE", instrument_type_id=instrument_type.id)
+    db.add(instrument)
+    db.flush()
+    subscription_ids = db.scalars(
+        insert(Subscription).returning(Subscription.id, sort_by_parameter_order=True),
+        [
+            {"account_id": account.id, "instrument_id": instrument.id, "invested_amount": Decimal("1000"), "units": Decimal("1"), "subscribed_at": datetime(2024, 1, 1, tzinfo=timezone.utc), "effective_maturity_date": date(2030, 1, 1), "subscription_yield": Decimal("5"), "current_value": Decimal("1040"), "accrued_interest": Decimal("0"), "fee_amount": Decimal("0"), "status": "ACTIVE"}
+            for _ in range(positions)
+        ],
+    ).all()
+    db.execute(
+        insert(InterestPayment),
+        [
+            {"subscription_id": subscription_id, "payment_date": date(2024, 1 + 3 * index, 1), "amount": Decimal("12.50"), "status": "PAYE" if index else "EN_ATTENTE"}
+            for subscription_id in subscription_ids
+            for index in range(coupons_per_position)
+        ],
+    )
+    db.flush()
+    return checker.id
+
+
+def main() -> None:
+    positions = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    coupons_per_position = min(int(sys.argv[2]) if len(sys.argv) > 2 else 3, 4)
+    engine = create_engine(os.getenv("TEST_DATABASE_URL", settings.DATABASE_URL))
+    connection = engine.connect()
+    transaction = connection.begin()
+    db = sessionmaker(bind=connection, autoflush=False, expire_on_commit=False, join_transaction_mode="create_savepoint")()
+    try:
+        client_id = seed(db, positions, coupons_per_position)
+        for name, report in (("regulatory_report", ReportingService.regulatory_report), ("backoffice_report", ReportingService.backoffice_report)):
+            db.expire_all()
+            started = perf_counter()
+            report(db, client_id)
+            print(f"{name}: {(perf_counter() - started) * 1000:.0f} ms pour {positions} positions et {positions * coupons_per_position} coupons")
+    finally:
+        db.close()
+        transaction.rollback()
+        connection.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
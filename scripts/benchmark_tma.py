@@ -0,0 +1,63 @@
+"""Compare le moteur TMA a la dichotomie Decimal historique.
+
+Usage : python -m scripts.benchmark_tma [nombre_de_positions]
+   ou : python scripts/benchmark_tma.py [nombre_de_positions]
+"""
+
+import random
+import sys
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from time import perf_counter
+
+if not __package__:
+    # Lance comme fichier : la racine du depot n'est pas sur sys.path.
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.investment_metrics import _xirr_bisection, annualized_return, invalidate_tma_cache
+
+
+def sample_positions(count: int, seed: int = 7) -> list[tuple[Decimal, Decimal, date, date, Decimal, Decimal]]:
+    generator = random.Random(seed)
+    as_of = date(2026, 6, 30)
+    positions = []
+    for _ in range(count):
+        invested = Decimal(generator.randint(500, 250000))
+        current_value = (invested * Decimal(str(round(generator.uniform(0.8, 1.6), 4)))).quantize(Decimal("0.01"))
+        start = as_of - timedelta(days=generator.randint(30, 2500))
+        positions.append((invested, current_value, start, as_of, Decimal(generator.randint(0, 5000)), Decimal(generator.randint(0, 250))))
+    return positions
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    positions = sample_positions(count)
+
+    started = perf_counter()
+    legacy = [
+        _xirr_bisection([(start, -(invested + fees)), (as_of, current_value + paid)], start)
+        for invested, current_value, start, as_of, paid, fees in positions
+    ]
+    legacy_seconds = perf_counter() - started
+
+    invalidate_tma_cache()
+    started = perf_counter()
+    current = [annualized_return(*position) for position in positions]
+    current_seconds = perf_counter() - started
+
+    started = perf_counter()
+    for position in positions:
+        annualized_return(*position)
+    cached_seconds = perf_counter() - started
+
+    mismatches = sum(1 for left, right in zip(legacy, current) if left != right)
+    print(f"positions={count} mismatches={mismatches}")
+    print(f"dichotomie : {legacy_seconds * 1000:.1f} ms ({legacy_seconds / count * 1e6:.0f} us/position)")
+    print(f"moteur TMA : {current_seconds * 1000:.1f} ms ({current_seconds / count * 1e6:.0f} us/position)")
+    print(f"cache TMA  : {cached_seconds * 1000:.1f} ms ({cached_seconds / count * 1e6:.1f} us/position)")
+    print(f"acceleration x{legacy_seconds / current_seconds:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Compare les plans du filtre OR historique et de l'UNION ALL par index.
+
+Usage : python -m scripts.benchmark_transaction_visibility [nombre_de_lignes] [comptes_par_client]
+
+Le script insere ``nombre_de_lignes`` transactions synthetiques (5 millions
+par defaut) reparties sur les comptes existants, execute EXPLAIN ANALYZE sur
+les deux formes de requete pour un echantillon de comptes, puis annule la
+transaction : la base n'est pas modifiee.
+"""
+
+import sys
+
+from sqlalchemy import or_, select, text
+from sqlalchemy.dialects import postgresql
+
+from app.db.database import engine
+from app.models.models import Account, Transaction
+from app.services.transaction_queries import visible_transactions
+
+
+SEED_SQL = """
+INSERT INTO transactions (transaction_type, source_account_id, destination_account_id, amount, currency, status, created_at, is_automatic, version)
+SELECT
+    'TRANSFERT',
+    accounts[1 + (serie * 7919) % cardinality(accounts)],
+    accounts[1 + (serie * 104729) % cardinality(accounts)],
+    (serie % 5000) + 1,
+    'USD',
+    'EXECUTED',
+    now() - make_interval(secs => serie),
+    FALSE,
+    1
+FROM generate_series(1, :rows) AS serie,
+     (SELECT array_agg(id ORDER BY id) AS accounts FROM accounts) AS pool
+"""
+
+
+def explain(connection, query) -> tuple[str, float]:
+    compiled = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    plan = connection.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {compiled}")).scalar()[0]
+    nodes = []
+
+    def walk(node: dict, depth: int) -> None:
+        relation = f" sur {node['Relation Name']}" if "Relation Name" in node else ""
+        index = f" via {node['Index Name']}" if "Index Name" in node else ""
+        nodes.append(f"{'  ' * depth}{node['Node Type']}{relation}{index}")
+        for child in node.get("Plans", ()):
+            walk(child, depth + 1)
+
+    walk(plan["Plan"], 1)
+    return "\n".join(nodes), plan["Execution Time"]
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    accounts_per_client = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            connection.execute(text(SEED_SQL), {"rows": rows})
+            connection.execute(text("ANALYZE transactions"))
+            account_ids = list(connection.scalars(select(Account.id).order_by(Account.id).limit(accounts_per_client)))
+            legacy = (
+                select(Transaction)
+                .where(or_(Transaction.source_account_id.in_(account_ids), Transaction.destination_account_id.in_(account_ids)))
+                .order_by(Transaction.created_at.desc())
+                .limit(100)
+            )
+            for label, query in (("OR de IN", legacy), ("UNION ALL", visible_transactions(account_ids, limit=100))):
+                plan, milliseconds = explain(connection, query)
+                print(f"{label} : {milliseconds:.1f} ms\n{plan}\n")
+        finally:
+            transaction.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Compare les backends ORM et SQL du rapport client (resultat et latence).
+
+Usage : python -m scripts.compare_client_report <client_id> [iterations]
+"""
+
+import sys
+from time import perf_counter
+
+from app.db.database import SessionLocal
+from app.services.reporting_service import ReportingService
+
+
+SECTIONS = ("kpis", "summary_by_currency", "allocation", "positions", "order_pipeline", "maturities", "cashflow", "alerts")
+
+
+def normalized(report: dict) -> dict:
+    return {key: sorted(report[key], key=repr) if isinstance(report[key], list) else report[key] for key in SECTIONS}
+
+
+def main() -> None:
+    client_id = int(sys.argv[1])
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    db = SessionLocal()
+    try:
+        reports = {}
+        for backend in ("orm", "sql"):
+            timings = []
+            for _ in range(iterations):
+                db.expire_all()
+                started = perf_counter()
+                reports[backend] = ReportingService.client_report(db, client_id, backend=backend)
+                timings.append(perf_counter() - started)
+            timings.sort()
+            print(f"{backend}: p50={timings[len(timings) // 2] * 1000:.1f} ms max={timings[-1] * 1000:.1f} ms")
+        left, right = normalized(reports["orm"]), normalized(reports["sql"])
+        differences = [key for key in SECTIONS if left[key] != right[key]]
+        print("sections identiques" if not differences else f"sections divergentes : {', '.join(differences)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Mesure le debit des endpoints de lecture sous forte concurrence.
+
+Usage : python -m scripts.load_test_reads [base_url] [concurrence] [requetes_par_endpoint]
+
+Le script se connecte avec un compte de demonstration puis envoie les
+requetes depuis ``concurrence`` clients simultanes. ``/comptes/`` reste un
+endpoint synchrone (threadpool) et sert de reference face aux lectures async.
+"""
+
+import asyncio
+import os
+import sys
+from time import perf_counter
+
+import httpx
+
+
+READ_PATHS = (
+    "/api/v1/comptes/",
+    "/api/v1/dashboard/overview",
+    "/api/v1/dashboard/complet",
+    "/api/v1/dashboard/rapports/client",
+    "/api/v1/transactions/mes-transactions",
+    "/api/v1/souscriptions/mes-souscriptions",
+)
+
+
+async def measure(client: httpx.AsyncClient, path: str, concurrency: int, total: int) -> tuple[float, int]:
+    remaining = iter(range(total))
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        for _ in remaining:
+            response = await client.get(path)
+            if response.status_code != 200:
+                errors += 1
+
+    started = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (perf_counter() - started), errors
+
+
+async def main() -> None:
+    base_url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8000"
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    total = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    email = os.getenv("LOAD_TEST_EMAIL", "marie.jean@demo.profin.ht")
+    password = os.getenv("LOAD_TEST_PASSWORD", "ProfinDemo!2026")
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        login = await client.post("/api/v1/auth/login", json={"email": email, "password": password})
+        login.raise_for_status()
+        client.headers["Authorization"] = f"Bearer {login.json()['tokens']['access_token']}"
+        print(f"{concurrency} clients simultanes, {total} requetes par endpoint")
+        for path in READ_PATHS:
+            rate, errors = await measure(client, path, concurrency, total)
+            print(f"{path:<45} {rate:>9.1f} req/s  erreurs={errors}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,37 @@
+"""Cree les partitions mensuelles a venir et detache celles hors conservation.
+
+Usage : python -m scripts.maintain_partitions [--explain client_id]
+
+Prevu pour une execution quotidienne. ``--explain`` affiche en plus les
+partitions de ``transactions`` lues par la requete de flux du rapport client
+sur six mois, pour verifier l'elagage.
+"""
+
+import sys
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from app.db.database import SessionLocal
+from app.models.models import AccountRole
+from app.services.history_snapshots import snapshot_cashflow_window
+from app.services.partition_maintenance import maintain_partitions, scanned_partitions
+from app.services.reporting_service import live_cashflow_query
+
+
+def main() -> None:
+    db = SessionLocal()
+    try:
+        for table, changes in maintain_partitions(db).items():
+            print(f"{table} : creees={', '.join(changes['created']) or '-'} detachees={', '.join(changes['detached']) or '-'}")
+        if len(sys.argv) > 2 and sys.argv[1] == "--explain":
+            account_ids = list(db.scalars(select(AccountRole.account_id).where(AccountRole.client_id == int(sys.argv[2]), AccountRole.is_active.is_(True))))
+            since = datetime.now(timezone.utc) - timedelta(days=31 * 6)
+            query = live_cashflow_query(account_ids, since, snapshot_cashflow_window(db, since))
+            print("partitions lues :", ", ".join(sorted(scanned_partitions(db, query))))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Reconcilie la projection ``ledger_balances`` avec les ecritures et les soldes.
+
+Usage : python -m scripts.reconcile_ledger [--rebuild] [taille_de_lot]
+
+La reconciliation lit ecritures agregees, projection et soldes des comptes
+clients en une seule requete parcourue en flux. ``--rebuild`` recalcule la
+projection depuis les ecritures avant le controle. Le code retour vaut 1 si
+un ecart subsiste.
+"""
+
+import sys
+
+from app.db.database import SessionLocal
+from app.services.ledger import rebuild_ledger_balances, reconcile_ledger
+
+
+def main() -> int:
+    arguments = [item for item in sys.argv[1:] if item != "--rebuild"]
+    batch_size = int(arguments[0]) if arguments else 1000
+    db = SessionLocal()
+    try:
+        if "--rebuild" in sys.argv[1:]:
+            rebuild_ledger_balances(db)
+            db.commit()
+        summary = reconcile_ledger(db, batch_size=batch_size)
+        for item in summary["items"]:
+            print(f"{item['account_code']:<30} {item['currency']} {item['kind']:<28} attendu={item['expected']} trouve={item['found']}")
+        print(f"{summary['checked']} comptes controles, {summary['discrepancies']} ecarts")
+        return 1 if summary["discrepancies"] else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
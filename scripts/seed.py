@@ -25,6 +25,7 @@ from app.models.models import (
     Subscription,
     Transaction,
 )
+from app.services.ledger import rebuild_ledger_balances
 from app.services.transaction_service import TransactionService
 
 
@@ -329,6 +330,10 @@ def main() -> None:
                 OrderWorkflowStep(order_id=rejected_order.id, step_code="CHECKER", actor_profile="SUPERVISEUR"),
             ])
 
+        # Les ecritures du jeu de demonstration sont inserees directement :
+        # la projection du grand livre est recalculee en une passe.
+        db.flush()
+        rebuild_ledger_balances(db)
         db.commit()
         print("Seed ProFin terminé : 8 clients, 8 comptes, 5 instruments, positions, coupons, rôles multi-utilisateurs, frais, contrepassation, rejets et parcours maker/checker.")
     finally:
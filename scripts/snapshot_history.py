@@ -0,0 +1,31 @@
+"""Ecrit les instantanes mensuels de soldes, de positions et de flux.
+
+Usage : python -m scripts.snapshot_history [--backfill nombre_de_mois]
+
+Sans option, le script cloture le mois precedent s'il ne l'est pas encore et
+met a jour le mois courant : il est prevu pour une execution quotidienne.
+``--backfill`` reconstitue les mois demandes depuis l'historique des
+transactions (valeur des positions passees = montant investi).
+"""
+
+import sys
+
+from app.db.database import SessionLocal
+from app.services.history_snapshots import backfill_history_snapshots, run_history_snapshots
+
+
+def main() -> None:
+    db = SessionLocal()
+    try:
+        if len(sys.argv) > 2 and sys.argv[1] == "--backfill":
+            written = backfill_history_snapshots(db, int(sys.argv[2]))
+        else:
+            written = run_history_snapshots(db)
+        for month, rows in written.items():
+            print(f"{month} : {rows} lignes")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
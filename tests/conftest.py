@@ -4,11 +4,16 @@ from datetime import date
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
+from app.ai.context import context_cache
 from app.core.security import hash_password
-from app.db.database import Base, get_db
+from app.db.database import Base, async_database_url, get_async_db, get_db
 from app.models.models import Account, AccountRole, Client, ClientAuthentication, Instrument, InstrumentType
+from app.services.assistant_service import response_cache
+from app.services.auth_service import principal_cache
 from main import app
 
 
@@ -26,6 +31,9 @@ def db_session():
     connection.commit()
     factory = sessionmaker(bind=connection, autoflush=False, expire_on_commit=False)
     session = factory()
+    principal_cache.clear()
+    context_cache.clear()
+    response_cache.clear()
     try:
         yield session
     finally:
@@ -42,7 +50,16 @@ def client_app(db_session):
     def override_get_db():
         yield db_session
 
+    # Les endpoints async lisent la meme base de test par asyncpg; NullPool
+    # evite de partager une connexion entre les boucles d'evenements.
+    async_engine = create_async_engine(async_database_url(TEST_DATABASE_URL), poolclass=NullPool)
+
+    async def override_get_async_db():
+        async with AsyncSession(async_engine, autoflush=False, expire_on_commit=False) as db:
+            yield db
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
@@ -1,6 +1,20 @@
+import asyncio
+import json
+from decimal import Decimal
+
+import httpx
+
+from app.ai import client as ai_client
+from app.ai import context as ai_context
 from app.ai.client import AICompletion, AIProviderError, OpenRouterClient
+from app.ai.compaction import compact_context, compact_history, dumps, estimate_tokens
+from app.ai.context import ClientContext
+from app.ai.prompt import build_messages
 from app.core.config import settings
 from app.models.models import Transaction
+from app.ai.local_answers import answer_locally
+from app.services.assistant_service import ResponseCache, assistant_stats
+from app.services.transaction_service import TransactionService
 
 
 def login(client, email):
@@ -21,7 +35,7 @@ def test_assistant_requires_authentication(client_app):
 def test_assistant_uses_only_authenticated_client_context(client_app, demo_data, monkeypatch):
     captured = {}
 
-    def fake_complete(self, messages):
+    async def fake_complete(self, messages):
         captured["messages"] = messages
         return AICompletion(content="Votre contexte est disponible.", model="test-model", usage={})
 
@@ -46,7 +60,7 @@ def test_assistant_uses_only_authenticated_client_context(client_app, demo_data,
 
 
 def test_assistant_does_not_mutate_financial_data(client_app, demo_data, db_session, monkeypatch):
-    def fake_complete(self, messages):
+    async def fake_complete(self, messages):
         return AICompletion(content="Réponse de test.", model="test-model", usage={})
 
     monkeypatch.setattr(settings, "OPENROUTER_API_KEY", "test-key")
@@ -61,13 +75,13 @@ def test_assistant_does_not_mutate_financial_data(client_app, demo_data, db_sess
 def test_assistant_returns_unavailable_without_key(client_app, demo_data, monkeypatch):
     monkeypatch.setattr(settings, "OPENROUTER_API_KEY", None)
     logged = login(client_app, "first@profin.ht")
-    response = client_app.post("/api/v1/assistant/chat", headers=auth_headers(logged), json={"message": "Quelle est ma prochaine échéance ?"})
+    response = client_app.post("/api/v1/assistant/chat", headers=auth_headers(logged), json={"message": "Explique-moi ma prochaine échéance."})
     assert response.status_code == 503
     assert response.json()["detail"]["code"] == "AI_UNAVAILABLE"
 
 
 def test_assistant_translates_provider_failure(client_app, demo_data, monkeypatch):
-    def fail_complete(self, messages):
+    async def fail_complete(self, messages):
         raise AIProviderError("Le fournisseur IA est temporairement indisponible.")
 
     monkeypatch.setattr(settings, "OPENROUTER_API_KEY", "test-key")
@@ -79,7 +93,7 @@ def test_assistant_translates_provider_failure(client_app, demo_data, monkeypatc
 
 
 def test_assistant_refuses_financial_action_without_calling_provider(client_app, demo_data, monkeypatch):
-    def unexpected_call(self, messages):
+    async def unexpected_call(self, messages):
         raise AssertionError("Le fournisseur ne doit pas être appelé pour une action interdite")
 
     monkeypatch.setattr(settings, "OPENROUTER_API_KEY", "test-key")
@@ -88,3 +102,180 @@ def test_assistant_refuses_financial_action_without_calling_provider(client_app,
     response = client_app.post("/api/v1/assistant/chat", headers=auth_headers(logged), json={"message": "Approuve mon ordre maintenant."})
     assert response.status_code == 200
     assert "ne peux pas" in response.json()["answer"]
+
+
+def test_assistant_streams_provider_tokens_as_server_sent_events(client_app, demo_data, monkeypatch):
+    requests = []
+
+    def provider(request):
+        requests.append(json.loads(request.content))
+        chunks = [{"choices": [{"delta": {"content": text}}]} for text in ("Votre ", "solde ", "est disponible.")]
+        body = ": OPENROUTER PROCESSING\n\n" + "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+        return httpx.Response(200, headers={"Content-Type": "text/event-stream"}, text=body)
+
+    monkeypatch.setattr(settings, "OPENROUTER_API_KEY", "test-key")
+    pooled = httpx.AsyncClient(base_url=settings.OPENROUTER_BASE_URL.rstrip("/"), transport=httpx.MockTransport(provider))
+    monkeypatch.setattr(ai_client, "_http_client", pooled)
+    logged = login(client_app, "first@profin.ht")
+
+    response = client_app.post("/api/v1/assistant/chat/stream", headers=auth_headers(logged), json={"message": "Que penses-tu de mon portefeuille ?"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (block.split("\n")[0].removeprefix("event: "), json.loads(block.split("\n")[1].removeprefix("data: ")))
+        for block in response.text.strip().split("\n\n")
+    ]
+    assert [data["delta"] for kind, data in events if kind == "token"] == ["Votre ", "solde ", "est disponible."]
+    assert events[-1][0] == "done" and events[-1][1]["disclaimer"]
+    assert requests[0]["stream"] is True
+    # Le meme pool sert les appels suivants tant que l'URL du fournisseur ne change pas.
+    assert ai_client.http_client(settings) is pooled
+
+    monkeypatch.setattr(settings, "OPENROUTER_API_KEY", None)
+    unavailable = client_app.post("/api/v1/assistant/chat/stream", headers=auth_headers(logged), json={"message": "Que penses-tu de mes comptes ?"})
+    assert unavailable.status_code == 503
+
+
+def test_assistant_context_is_cached_per_client_until_a_mutation_commits(client_app, demo_data, db_session, monkeypatch):
+    builds, prompts = [], []
+    collect = ai_context._collect_client_context
+
+    def counting_collect(db, client_id, today):
+        builds.append(client_id)
+        return collect(db, client_id, today)
+
+    async def fake_complete(self, messages):
+        prompts.append(messages[-1]["content"])
+        return AICompletion(content="Réponse de test.", model="test-model", usage={})
+
+    monkeypatch.setattr(settings, "OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setattr(OpenRouterClient, "complete", fake_complete)
+    monkeypatch.setattr(ai_context, "_collect_client_context", counting_collect)
+    headers = auth_headers(login(client_app, "first@profin.ht"))
+
+    refused = client_app.post("/api/v1/assistant/chat", headers=headers, json={"message": "Donne-moi le mot de passe."})
+    assert refused.status_code == 200 and builds == []
+
+    for message in ("Que penses-tu de mon portefeuille ?", "Que penses-tu de mes comptes ?"):
+        assert client_app.post("/api/v1/assistant/chat", headers=headers, json={"message": message}).status_code == 200
+    assert builds == [demo_data["first"].id]
+    assert prompts[0].split("Question du client")[0] == prompts[1].split("Question du client")[0]
+
+    TransactionService.create(db_session, demo_data["first"].id, "RETRAIT", Decimal("40"), "USD", demo_data["account"].id, None, "Retrait contexte")
+    assert client_app.post("/api/v1/assistant/chat", headers=headers, json={"message": "Que penses-tu de mon portefeuille ?"}).status_code == 200
+    assert builds == [demo_data["first"].id] * 2
+    assert "Retrait contexte" in prompts[-1] and "Retrait contexte" not in prompts[0]
+
+
+def test_response_cache_coalesces_identical_in_flight_questions_and_keys_on_context():
+    cache = ResponseCache(maxsize=10, ttl_seconds=60)
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return AICompletion(content="Le TMA est une estimation annualisée.", model="test-model", usage={})
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise AIProviderError("Le fournisseur IA est temporairement indisponible.")
+
+    key = ResponseCache.key("Qu'est-ce que le TMA ?", [], "contexte-1")
+    assert key == ResponseCache.key("  qu est-ce que le  tma", [], "contexte-1")
+    assert key != ResponseCache.key("Qu'est-ce que le TMA ?", [], "contexte-2")
+
+    async def scenario():
+        burst = await asyncio.gather(*(cache.get_or_complete(key, produce) for _ in range(5)))
+        again = await cache.get_or_complete(key, produce)
+        changed = await cache.get_or_complete(ResponseCache.key("Qu'est-ce que le TMA ?", [], "contexte-2"), produce)
+        errors = await asyncio.gather(*(cache.get_or_complete("panne", failing) for _ in range(3)), return_exceptions=True)
+        return burst, again, changed, errors
+
+    burst, again, changed, errors = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert sorted(outcome for _, outcome in burst) == ["coalesced"] * 4 + ["miss"]
+    assert again[1] == "hit" and changed[1] == "miss"
+    assert all(isinstance(item, AIProviderError) for item in errors)
+    stats = cache.stats()
+    assert (stats["hits"], stats["coalesced"], stats["misses"]) == (1, 4, 3)
+    assert stats["hit_ratio"] == round(5 / 8, 3) and stats["saved_ms"] >= 40
+
+    # La demande qui a lance l'appel est annulee : celles qui l'attendent recoivent la reponse.
+    async def cancelled_leader():
+        leader = asyncio.ensure_future(cache.get_or_complete("annule", produce))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(cache.get_or_complete("annule", produce))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower, leader.cancelled()
+
+    (completion, origin), leader_cancelled = asyncio.run(cancelled_leader())
+    assert leader_cancelled and origin == "coalesced"
+    assert completion.content == "Le TMA est une estimation annualisée." and len(calls) == 3
+    assert cache.entries.get("annule") is not None
+
+
+def test_context_compaction_keeps_relevant_sections_within_token_budget(monkeypatch):
+    data = {
+        "accounts": [{"account_number": f"INV-{index}", "currency": "HTG", "available_balance": "2500.00"} for index in range(8)],
+        "positions": [{"instrument": f"Obligation {index}", "tma_percentage": "6.10", "maturity_date": "2027-06-30"} for index in range(20)],
+        "obligations": [],
+        "orders": [{"id": index, "status": "COMPLIANCE_REVIEW", "status_explanation": "La demande est en cours de vérification du dossier."} for index in range(1, 21)],
+        "transactions": [{"id": 100 + index, "type": "DEPOT", "amount": "150.00", "description": f"Dépôt {index}"} for index in range(20)],
+        "portfolio_totals_by_currency": {"USD": {"invested_amount": "20000.00"}},
+        "available_liquidity_by_currency": {"HTG": "20000.00"},
+    }
+
+    compact = compact_context(data, "Pourquoi mon ordre 12 est-il en attente ?", budget_tokens=400, preview_items=2)
+    assert estimate_tokens(dumps(compact)) <= 400
+    assert compact["orders"][0]["id"] == 12
+    assert list(compact)[2] == "orders"
+    assert compact["portfolio_totals_by_currency"] == data["portfolio_totals_by_currency"]
+    assert "positions" not in compact and compact["elements_omis"]["positions"] == 20
+
+    balance = compact_context(data, "Quel est mon solde disponible en HTG ?", budget_tokens=2000, preview_items=2)
+    assert len(balance["accounts"]) == 8
+    assert len(balance["positions"]) == len(balance["transactions"]) == 2
+
+    history = [{"role": "user", "content": "x" * 1500}, {"role": "assistant", "content": "y" * 600}, {"role": "user", "content": "z" * 600}]
+    assert [len(item["content"]) for item in compact_history(history, budget_tokens=500)] == [300, 600, 600]
+    assert [item["content"][0] for item in compact_history(history, budget_tokens=420)] == ["y", "z"]
+
+    monkeypatch.setattr(settings, "ASSISTANT_CONTEXT_TOKEN_BUDGET", 400)
+    text = dumps(data)
+    prompt = build_messages("Quel est mon solde ?", [], ClientContext(data=data, text=text, digest=""))[-1]["content"]
+    assert text not in prompt and "elements_omis" in prompt
+    monkeypatch.setattr(settings, "ASSISTANT_CONTEXT_TOKEN_BUDGET", 10**6)
+    assert text in build_messages("Quel est mon solde ?", [], ClientContext(data=data, text=text, digest=""))[-1]["content"]
+
+
+def test_common_intents_are_answered_locally_without_calling_provider(client_app, demo_data, monkeypatch):
+    async def unexpected_call(self, messages):
+        raise AssertionError("Une intention reconnue ne doit pas appeler le fournisseur")
+
+    monkeypatch.setattr(settings, "OPENROUTER_API_KEY", None)
+    monkeypatch.setattr(OpenRouterClient, "complete", unexpected_call)
+    headers = auth_headers(login(client_app, "first@profin.ht"))
+    before = assistant_stats()["by_origin"]["local"]
+
+    balance = client_app.post("/api/v1/assistant/chat", headers=headers, json={"message": "Quel est mon solde disponible en HTG ?"})
+    assert balance.status_code == 200, balance.text
+    assert "10 000.00 HTG" in balance.json()["answer"] and "INV-TEST-003" in balance.json()["answer"]
+    assert "INV-TEST-001" not in balance.json()["answer"]
+    missing = client_app.post("/api/v1/assistant/chat", headers=headers, json={"message": "Pourquoi mon ordre 12 est-il en attente ?"})
+    assert "ordre n°12" in missing.json()["answer"]
+    assert assistant_stats()["by_origin"]["local"] == before + 2
+
+    # Une question ouverte reste confiee au fournisseur (ici indisponible).
+    open_ended = client_app.post("/api/v1/assistant/chat", headers=headers, json={"message": "Que me conseilles-tu pour mon solde ?"})
+    assert open_ended.status_code == 503
+
+    context = {
+        "orders": [{"id": 12, "instrument": "BRH 2027", "amount": "10000.00", "currency": "USD", "status": "BACK_OFFICE_REVIEW", "status_explanation": "La demande est en cours de traitement opérationnel.", "steps": [{"code": "CONFORMITE", "status": "APPROVED"}, {"code": "BACK_OFFICE", "status": "PENDING"}, {"code": "CHECKER", "status": "PENDING"}]}],
+        "obligations": [{"instrument": "BRH 2027", "instrument_code": "BRH27", "maturity_date": "2027-06-30", "current_value": "10250.00", "currency": "USD"}],
+    }
+    order = answer_locally("Pourquoi mon ordre 12 est-il en attente ?", context)
+    assert order.intent == "order_status" and "traitement back-office, validation finale" in order.content
+    assert answer_locally("Quand mon obligation arrive-t-elle à échéance ?", context).content.endswith("arrive à échéance le 30/06/2027, valeur actuelle 10 250.00 USD.")
+    assert answer_locally("Quel était mon solde au 31 mars ?", context) is None
+    assert answer_locally("Quel est mon solde et ma prochaine échéance ?", context) is None
@@ -1,9 +1,21 @@
+import json
 from decimal import Decimal
 
 from datetime import date
 
-from app.models.models import AccountingEntry, Instrument, Subscription, Transaction
+import pytest
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import sessionmaker
+
+from app.api.v1.endpoints.serializers import transaction_dicts
+from app.models.models import Account, AccountingEntry, AuditLog, BatchCheckpoint, Client, ClientAuthentication, Instrument, LedgerBalance, Subscription, Transaction
+from app.services.audit_writer import AuditEvent, AuditWriter, install_audit_writer
+from app.services.auth_service import AuthService, principal_cache
+from app.services.ledger import reconcile_ledger
+from app.services.portfolio_service import audit, audit_many
+from app.services.posting_engine import PostingEngine, PostingLeg, PostingRefused, install_posting_engine
 from app.services.subscription_service import SubscriptionService
+from app.services.transaction_queries import visible_transactions
 from app.services.transaction_service import TransactionService
 
 
@@ -88,6 +100,29 @@ def test_deposit_updates_balances_and_creates_balanced_ledger(client_app, demo_d
     assert sum(item.amount for item in entries if item.direction == "DEBIT") == sum(item.amount for item in entries if item.direction == "CREDIT")
 
 
+def test_ledger_projection_follows_execution_and_reversal_and_reconciles(demo_data, db_session):
+    first, second = demo_data["first"].id, demo_data["second"].id
+    account_id = demo_data["account"].id
+    deposit = TransactionService.create(db_session, first, "DEPOT", Decimal("300"), "USD", None, account_id, "Depot")
+    TransactionService.approve(db_session, deposit.id, second)
+    client_line = db_session.get(LedgerBalance, (f"CLIENT_{account_id}", "USD"))
+    assert (client_line.debit_total, client_line.credit_total, client_line.entry_count) == (Decimal("0.00"), Decimal("300.00"), 1)
+
+    reversal = TransactionService.reverse(db_session, deposit.id, second, "Erreur de saisie")
+    TransactionService.approve(db_session, reversal.id, first)
+    db_session.refresh(client_line)
+    assert (client_line.debit_total, client_line.credit_total, client_line.entry_count) == (Decimal("300.00"), Decimal("300.00"), 2)
+
+    # La souscription credite le client mais reduit son solde.
+    SubscriptionService.create(db_session, first, account_id, demo_data["instrument"].id, Decimal("500"))
+
+    summary = reconcile_ledger(db_session, batch_size=2)
+    assert not [item for item in summary["items"] if item["kind"].startswith("PROJECTION_")]
+    # Les soldes d'ouverture du jeu de test n'ont pas d'ecritures : l'ecart est signale, pas corrige.
+    opening = next(item for item in summary["items"] if item["account_code"] == f"CLIENT_{account_id}")
+    assert (opening["kind"], opening["expected"], opening["found"]) == ("ACCOUNT_BALANCE", Decimal("-500.00"), Decimal("500.00"))
+
+
 def test_transfer_rejects_currency_mismatch_without_mutating_accounts(client_app, demo_data, db_session):
     first = login(client_app, "first@profin.ht")
     second = login(client_app, "second@profin.ht")
@@ -123,6 +158,143 @@ def test_transfer_conserves_money_and_credits_destination(client_app, demo_data,
     assert source.available_balance + destination.available_balance == Decimal("1500.00")
 
 
+def test_checker_approves_batch_with_per_item_outcomes(client_app, demo_data, db_session):
+    withdrawals = [
+        TransactionService.create(db_session, demo_data["first"].id, "RETRAIT", Decimal("400"), "USD", demo_data["account"].id, None, f"Retrait {index}")
+        for index in range(3)
+    ]
+    private = TransactionService.create(db_session, demo_data["first"].id, "RETRAIT", Decimal("10"), "USD", demo_data["private_account"].id, None, "Prive")
+    second = login(client_app, "second@profin.ht")
+    response = client_app.post("/api/v1/transactions/approve-batch", headers=auth_headers(second), json={"transaction_ids": [private.id, *[item.id for item in reversed(withdrawals)], 999999]})
+    assert response.status_code == 200, response.text
+    payload = response.json()
+    assert (payload["approved"], payload["failed"]) == (2, 3)
+    outcomes = {item["transaction_id"]: item for item in payload["results"]}
+    assert outcomes[withdrawals[0].id]["success"] and outcomes[withdrawals[1].id]["success"]
+    assert outcomes[withdrawals[2].id]["error"] == "Solde disponible insuffisant"
+    assert outcomes[private.id]["error"] == "Accès refusé à ce compte"
+    assert outcomes[999999]["error"] == "Transaction introuvable"
+    db_session.refresh(demo_data["account"])
+    assert demo_data["account"].available_balance == Decimal("200.00")
+    assert db_session.query(AccountingEntry).filter(AccountingEntry.transaction_id.in_([withdrawals[0].id, withdrawals[1].id])).count() == 4
+    assert db_session.get(Transaction, withdrawals[2].id).status == "PENDING_APPROVAL"
+
+    first = login(client_app, "first@profin.ht")
+    own = client_app.post("/api/v1/transactions/approve-batch", headers=auth_headers(first), json={"transaction_ids": [withdrawals[2].id]})
+    assert own.json()["results"][0]["error"] == "Le maker ne peut pas être son propre checker"
+
+
+def test_posting_engine_group_commits_hot_account_and_executes_transactions(client_app, demo_data, db_session):
+    factory = sessionmaker(bind=db_session.bind.engine, autoflush=False, expire_on_commit=False)
+    engine = PostingEngine(factory, shards=2, max_batch=50, max_wait_seconds=0.01)
+    engine.start()
+    try:
+        account_id = demo_data["account"].id
+        futures = [engine.submit([PostingLeg(account_id, Decimal("1"), Decimal("1"))]) for _ in range(40)]
+        assert [future.result(10) for future in futures] == [None] * 40
+        with pytest.raises(PostingRefused):
+            engine.post([PostingLeg(account_id, Decimal("-5000"), Decimal("-5000"), require_funds=True)])
+        stats = engine.stats()
+        assert (stats["postings"], stats["refused"]) == (41, 1)
+        assert stats["batches"] < 41 and stats["latency_ms"]["p99"] is not None
+        db_session.refresh(demo_data["account"])
+        assert demo_data["account"].available_balance == Decimal("1040.00")
+
+        install_posting_engine(engine)
+        pending = TransactionService.create(db_session, demo_data["first"].id, "RETRAIT", Decimal("40"), "USD", account_id, None, "Retrait moteur")
+        approved = client_app.post(f"/api/v1/transactions/{pending.id}/approve", headers=auth_headers(login(client_app, "second@profin.ht")))
+        assert approved.status_code == 200, approved.text
+        assert approved.json()["transaction"]["status"] == "EXECUTED"
+        db_session.refresh(demo_data["account"])
+        assert demo_data["account"].available_balance == Decimal("1000.00")
+        assert db_session.query(AccountingEntry).filter(AccountingEntry.transaction_id == pending.id).count() == 2
+
+        # Arret entre le commit de validation et le shard : la reprise execute une seule fois.
+        stranded = TransactionService.create(db_session, demo_data["first"].id, "RETRAIT", Decimal("25"), "USD", account_id, None, "Retrait interrompu")
+        stranded.status, stranded.approved_by_client_id = "APPROVED", demo_data["second"].id
+        db_session.commit()
+        assert TransactionService.resume_approved(db_session) == [{"transaction_id": stranded.id, "success": True, "status": "EXECUTED", "error": None}]
+        assert TransactionService.resume_approved(db_session) == []
+        db_session.refresh(demo_data["account"])
+        assert demo_data["account"].available_balance == Decimal("975.00")
+
+        # Avec le moteur installe, le lot passe aussi par les shards.
+        batch = [TransactionService.create(db_session, demo_data["first"].id, "RETRAIT", Decimal("25"), "USD", account_id, None, "Retrait lot") for _ in range(2)]
+        postings = engine.stats()["postings"]
+        results = TransactionService.approve_batch(db_session, [item.id for item in batch], demo_data["second"].id)
+        assert [(item["success"], item["status"]) for item in results] == [(True, "EXECUTED")] * 2
+        assert engine.stats()["postings"] == postings + 2
+        db_session.refresh(demo_data["account"])
+        assert demo_data["account"].available_balance == Decimal("925.00")
+    finally:
+        install_posting_engine(None)
+        engine.stop()
+
+
+def test_posting_engine_settles_postings_after_caller_timeout(demo_data, db_session):
+    factory = sessionmaker(bind=db_session.bind.engine, autoflush=False, expire_on_commit=False)
+    # Moteur installe mais pas demarre : les mouvements attendent en file au-dela du delai de l'appelant.
+    engine = PostingEngine(factory, shards=1, max_wait_seconds=0.01, post_timeout=0.05)
+    install_posting_engine(engine)
+    try:
+        account_id, checker_id = demo_data["account"].id, demo_data["second"].id
+        late = TransactionService.create(db_session, demo_data["first"].id, "RETRAIT", Decimal("40"), "USD", account_id, None, "Retrait tardif")
+        refused = TransactionService.create(db_session, demo_data["first"].id, "RETRAIT", Decimal("5000"), "USD", account_id, None, "Retrait refuse")
+        for transaction in (late, refused):
+            with pytest.raises(TimeoutError):
+                TransactionService.approve(db_session, transaction.id, checker_id)
+            assert db_session.scalar(select(Transaction.status).where(Transaction.id == transaction.id)) == "APPROVED"
+
+        engine.start()
+        engine.stop()
+        db_session.expire_all()
+        assert db_session.get(Transaction, late.id).status == "EXECUTED"
+        assert (db_session.get(Transaction, refused.id).status, db_session.get(Transaction, refused.id).approved_by_client_id) == ("PENDING_APPROVAL", None)
+        assert db_session.get(Account, account_id).available_balance == Decimal("960.00")
+        assert TransactionService.resume_approved(db_session) == []
+    finally:
+        install_posting_engine(None)
+        engine.stop()
+
+
+def test_buffered_audit_writes_committed_events_only_and_applies_backpressure(demo_data, db_session):
+    client_id = demo_data["first"].id
+    writer = AuditWriter(db_session.bind.engine, max_queue=100, batch_size=10, flush_interval_seconds=0.01)
+    writer.start()
+    install_audit_writer(writer)
+    try:
+        audit(db_session, client_id, "AUDIT_COMMIT", "TEST", 1)
+        audit_many(db_session, client_id, "AUDIT_COMMIT", "TEST", [(2, {"lot": True}), (3, None)])
+        assert db_session.query(AuditLog).filter(AuditLog.action == "AUDIT_COMMIT").count() == 0
+        savepoint = db_session.begin_nested()
+        audit(db_session, client_id, "AUDIT_ROLLBACK", "TEST", 5)
+        savepoint.rollback()
+        db_session.commit()
+        audit(db_session, client_id, "AUDIT_ROLLBACK", "TEST", 4)
+        db_session.rollback()
+        # Un savepoint libere reste suspendu au commit racine.
+        savepoint = db_session.begin_nested()
+        audit(db_session, client_id, "AUDIT_ROLLBACK", "TEST", 6)
+        savepoint.commit()
+        writer.flush()
+        assert writer.stats()["written"] == 3
+        db_session.rollback()
+        writer.flush()
+    finally:
+        install_audit_writer(None)
+        writer.stop()
+    assert writer.stats()["written"] == 3 and writer.stats()["lost"] == 0
+    rows = db_session.query(AuditLog).filter(AuditLog.entity_type == "TEST").order_by(AuditLog.entity_id).all()
+    assert [(row.action, row.entity_id) for row in rows] == [("AUDIT_COMMIT", "1"), ("AUDIT_COMMIT", "2"), ("AUDIT_COMMIT", "3")]
+    assert json.loads(rows[1].metadata_json) == {"lot": True}
+
+    # File pleine (ou ecrivain arrete) : l'appelant ecrit son lot lui-meme.
+    blocked = AuditWriter(db_session.bind.engine, max_queue=1, enqueue_timeout_seconds=0.001)
+    blocked.submit([AuditEvent(client_id, "AUDIT_SYNC", "TEST", str(index)) for index in range(3)])
+    assert blocked.stats()["synchronous"] == 3
+    assert db_session.query(AuditLog).filter(AuditLog.action == "AUDIT_SYNC").count() == 3
+
+
 def test_checker_can_reject_pending_transaction_without_mutating_balance(client_app, demo_data, db_session):
     first = login(client_app, "first@profin.ht")
     second = login(client_app, "second@profin.ht")
@@ -163,6 +335,110 @@ def test_open_account_is_scoped_to_authenticated_client(client_app, demo_data, d
     assert response.json()["account"]["currency"] == "EUR"
 
 
+def test_async_read_endpoints_list_committed_positions_and_transactions(client_app, demo_data, db_session):
+    SubscriptionService.create(db_session, demo_data["first"].id, demo_data["account"].id, demo_data["instrument"].id, Decimal("500"))
+    first = login(client_app, "first@profin.ht")
+    subscriptions = client_app.get("/api/v1/souscriptions/mes-souscriptions", headers=auth_headers(first))
+    assert subscriptions.status_code == 200, subscriptions.text
+    assert subscriptions.json()["total"] == 1
+    transactions = client_app.get("/api/v1/transactions/mes-transactions", headers=auth_headers(first))
+    assert transactions.status_code == 200, transactions.text
+    assert transactions.json()["total"] >= 1
+    forbidden = client_app.get(f"/api/v1/transactions/compte/{demo_data['private_account'].id}", headers=auth_headers(login(client_app, "second@profin.ht")))
+    assert forbidden.status_code == 403
+
+
+def test_transaction_dicts_resolves_account_numbers_in_one_query(db_session, demo_data):
+    transactions = [
+        TransactionService.create(db_session, demo_data["first"].id, "TRANSFERT", Decimal("10"), "USD", demo_data["account"].id, demo_data["transfer_destination"].id, f"Virement {index}")
+        for index in range(5)
+    ]
+    statements = []
+
+    def record(connection, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db_session.bind, "before_cursor_execute", record)
+    try:
+        rows = transaction_dicts(transactions, db_session)
+    finally:
+        event.remove(db_session.bind, "before_cursor_execute", record)
+    assert len(statements) == 1
+    assert {row["source_account_number"] for row in rows} == {"INV-TEST-001"}
+    assert {row["destination_account_number"] for row in rows} == {"INV-TEST-004"}
+
+
+def test_transaction_history_pages_by_cursor_and_streams_exports(client_app, demo_data, db_session):
+    for index in range(5):
+        TransactionService.create(db_session, demo_data["first"].id, "TRANSFERT", Decimal("10"), "USD", demo_data["account"].id, demo_data["transfer_destination"].id, f"Virement {index}")
+    first = login(client_app, "first@profin.ht")
+    seen, cursor = [], None
+    while True:
+        page = client_app.get("/api/v1/transactions/mes-transactions", headers=auth_headers(first), params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert page.status_code == 200, page.text
+        seen.extend(item["id"] for item in page.json()["transactions"])
+        cursor = page.json()["next_cursor"]
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 5
+    assert seen == sorted(seen, reverse=True)
+    assert client_app.get("/api/v1/transactions/mes-transactions", headers=auth_headers(first), params={"cursor": "invalide"}).status_code == 400
+
+    exported = client_app.get("/api/v1/transactions/export", headers=auth_headers(first))
+    assert exported.status_code == 200
+    assert [json.loads(line)["id"] for line in exported.text.splitlines()] == seen
+    csv_export = client_app.get("/api/v1/transactions/export", headers=auth_headers(first), params={"format": "csv", "account_id": demo_data["account"].id})
+    assert csv_export.text.splitlines()[0].startswith("id,created_at")
+    assert len(csv_export.text.splitlines()) == 6
+
+
+def test_visible_transactions_lists_internal_transfer_once_and_respects_criteria(db_session, demo_data):
+    internal = TransactionService.create(db_session, demo_data["first"].id, "TRANSFERT", Decimal("10"), "USD", demo_data["account"].id, demo_data["transfer_destination"].id, "Interne")
+    deposit = TransactionService.create(db_session, demo_data["first"].id, "DEPOT", Decimal("20"), "USD", None, demo_data["private_account"].id, "Depot")
+    account_ids = [demo_data["account"].id, demo_data["transfer_destination"].id, demo_data["private_account"].id]
+    assert [item.id for item in db_session.scalars(visible_transactions(account_ids))] == [deposit.id, internal.id]
+    assert [item.id for item in db_session.scalars(visible_transactions(account_ids, Transaction.transaction_type == "DEPOT"))] == [deposit.id]
+    assert [item.id for item in db_session.scalars(visible_transactions([demo_data["transfer_destination"].id], limit=1))] == [internal.id]
+
+
+def test_suspension_invalidates_cached_principal(client_app, demo_data, db_session):
+    first = login(client_app, "first@profin.ht")
+    assert client_app.get("/api/v1/comptes/", headers=auth_headers(first)).status_code == 200
+    assert principal_cache.get(demo_data["first"].id).status == "ACTIF"
+    AuthService.set_client_status(db_session, demo_data["first"].id, "SUSPENDU")
+    assert principal_cache.get(demo_data["first"].id) is None
+    assert client_app.get("/api/v1/comptes/", headers=auth_headers(first)).status_code == 403
+    refreshed = client_app.post("/api/v1/auth/refresh", json={"refresh_token": first["tokens"]["refresh_token"]})
+    assert refreshed.status_code == 401
+
+
+def test_principal_cache_follows_committed_status_changes(client_app, demo_data, db_session):
+    second = login(client_app, "second@profin.ht")
+    client_id = demo_data["second"].id
+    assert client_app.get("/api/v1/comptes/", headers=auth_headers(second)).status_code == 200
+
+    # Ecriture ORM directe, hors AuthService : purge au commit, pas au flush ni au rollback.
+    client = db_session.get(Client, client_id)
+    client.status = "SUSPENDU"
+    db_session.flush()
+    assert principal_cache.get(client_id) is not None
+    db_session.rollback()
+    assert principal_cache.get(client_id) is not None
+    client.status = "SUSPENDU"
+    db_session.commit()
+    assert principal_cache.get(client_id) is None
+    assert client_app.get("/api/v1/comptes/", headers=auth_headers(second)).status_code == 403
+
+    # Mise a jour en masse de l'acces : tout le cache est purge.
+    client.status = "ACTIF"
+    db_session.commit()
+    assert client_app.get("/api/v1/comptes/", headers=auth_headers(second)).status_code == 200
+    db_session.execute(update(ClientAuthentication).where(ClientAuthentication.client_id == client_id).values(is_active=False))
+    db_session.commit()
+    assert principal_cache.get(client_id) is None
+    assert client_app.get("/api/v1/comptes/", headers=auth_headers(second)).status_code == 403
+
+
 def test_maturity_generates_pending_repayment_then_checker_executes_it(db_session, demo_data):
     demo_data["instrument"].maturity_date = date(2020, 1, 1)
     db_session.flush()
@@ -179,6 +455,26 @@ def test_maturity_generates_pending_repayment_then_checker_executes_it(db_sessio
     assert demo_data["account"].available_balance == Decimal("1000.00")
 
 
+def test_maturity_batch_commits_per_page_and_resumes_from_checkpoint(db_session, demo_data):
+    demo_data["instrument"].maturity_date = date(2020, 1, 1)
+    db_session.flush()
+    subscriptions = [SubscriptionService.create(db_session, demo_data["first"].id, demo_data["account"].id, demo_data["instrument"].id, Decimal("500")) for _ in range(3)]
+    # Simule une execution interrompue apres la premiere page validee.
+    db_session.add(BatchCheckpoint(job_name="maturity_transactions", run_key="2026-08-15:ALL", last_id=subscriptions[0].id, processed=1, status="RUNNING"))
+    db_session.commit()
+
+    result = SubscriptionService.run_maturity_batch(db_session, date(2026, 8, 15), page_size=1)
+
+    assert result["resumed_from_id"] == subscriptions[0].id
+    assert result["pages"] == 2
+    assert result["transactions_created"] == 2
+    assert result["total_processed"] == 3
+    db_session.expire_all()
+    assert [db_session.get(Subscription, item.id).status for item in subscriptions] == ["ACTIVE", "MATURITE_EN_ATTENTE", "MATURITE_EN_ATTENTE"]
+    assert db_session.query(Transaction).filter(Transaction.transaction_type == "REMBOURSEMENT_MATURITE").count() == 2
+    assert SubscriptionService.run_maturity_batch(db_session, date(2026, 8, 15))["transactions_created"] == 1
+
+
 def test_investment_order_is_reserved_then_executed_after_three_workflow_steps(client_app, demo_data, db_session):
     first = login(client_app, "first@profin.ht")
     second = login(client_app, "second@profin.ht")
@@ -1,9 +1,9 @@
 from datetime import date, datetime, timezone
 from decimal import Decimal
 
-from app.models.models import AccountingEntry, Subscription, Transaction
-from app.services.interest_service import InterestService
-from app.services.investment_metrics import annualized_return
+from app.models.models import AccountingEntry, AuditLog, InterestPayment, Subscription, Transaction
+from app.services.interest_service import InterestService, coupon_totals
+from app.services.investment_metrics import _xirr_bisection, annualized_return, invalidate_tma_cache, tma_cache, xirr
 from app.services.transaction_service import TransactionService
 
 
@@ -12,6 +12,37 @@ def test_tma_is_annualized_from_dated_cashflows():
     assert Decimal("9.99") <= result <= Decimal("10.01")
 
 
+def test_tma_engine_matches_historical_bisection():
+    positions = [
+        (Decimal("1000"), Decimal("1100"), date(2025, 1, 1), date(2026, 1, 1), Decimal("0"), Decimal("0")),
+        (Decimal("25000"), Decimal("24100.55"), date(2024, 3, 15), date(2026, 8, 16), Decimal("1375"), Decimal("125")),
+        (Decimal("500"), Decimal("500"), date(2026, 8, 1), date(2026, 8, 16), Decimal("0"), Decimal("5")),
+    ]
+    expected = [
+        _xirr_bisection([(start, -(invested + fees)), (as_of, value + paid)], start)
+        for invested, value, start, as_of, paid, fees in positions
+    ]
+    assert [annualized_return(*position) for position in positions] == expected
+
+    coupons = [(date(2024, 1, 1), Decimal("-1000")), (date(2024, 7, 1), Decimal("27.50")), (date(2025, 1, 1), Decimal("27.50")), (date(2025, 6, 1), Decimal("1000"))]
+    assert xirr(coupons) == _xirr_bisection(coupons, date(2024, 1, 1))
+
+
+def test_tma_cache_is_keyed_on_position_inputs_and_invalidated():
+    invalidate_tma_cache()
+    before = tma_cache.stats()
+    first = annualized_return(Decimal("1000"), Decimal("1050"), date(2025, 1, 1), date(2026, 1, 1), Decimal("20"))
+    again = annualized_return(Decimal("1000.00"), Decimal("1050.00"), date(2025, 1, 1), date(2026, 1, 1), Decimal("20.00"))
+    revalued = annualized_return(Decimal("1000"), Decimal("1060"), date(2025, 1, 1), date(2026, 1, 1), Decimal("20"))
+    stats = tma_cache.stats()
+    assert first == again
+    assert revalued > first
+    assert stats["hits"] - before["hits"] == 1
+    assert stats["misses"] - before["misses"] == 2
+    invalidate_tma_cache()
+    assert tma_cache.stats()["size"] == 0
+
+
 def test_coupon_generation_is_idempotent_and_checker_execution_updates_payment(client_app, demo_data, db_session):
     subscription = Subscription(
         account_id=demo_data["account"].id,
@@ -43,6 +74,66 @@ def test_coupon_generation_is_idempotent_and_checker_execution_updates_payment(c
     assert demo_data["account"].balance == Decimal("1055.00")
 
 
+def test_bulk_coupon_generation_matches_standard_run_and_is_idempotent(client_app, demo_data, db_session):
+    for start in (datetime(2025, 1, 1, tzinfo=timezone.utc), datetime(2025, 3, 1, tzinfo=timezone.utc)):
+        db_session.add(Subscription(
+            account_id=demo_data["account"].id,
+            instrument_id=demo_data["instrument"].id,
+            invested_amount=Decimal("1000"),
+            units=Decimal("1"),
+            subscribed_at=start,
+            effective_maturity_date=date(2028, 1, 1),
+            subscription_yield=Decimal("5.5000"),
+            current_value=Decimal("1000"),
+            accrued_interest=Decimal("0"),
+            status="ACTIVE",
+        ))
+    db_session.commit()
+    InterestService.generate_due_payments(db_session, date(2026, 1, 15), demo_data["first"].id)
+
+    first = InterestService.generate_due_payments_bulk(db_session, date(2026, 8, 16), demo_data["first"].id, chunk_size=1)
+    second = InterestService.generate_due_payments_bulk(db_session, date(2026, 8, 16), demo_data["first"].id, chunk_size=1)
+
+    assert first["chunks"] == 2
+    assert first["payments_created"] == 1
+    assert second["payments_created"] == 0
+    payments = db_session.query(InterestPayment).order_by(InterestPayment.id).all()
+    assert len(payments) == 2
+    transaction = db_session.get(Transaction, payments[-1].transaction_id)
+    assert transaction.transaction_type == "PAIEMENT_INTERET"
+    assert transaction.amount == Decimal("55.00")
+    assert db_session.query(AuditLog).filter(AuditLog.action == "INTEREST_PAYMENT_CREATED").count() == 2
+
+
+def test_coupon_totals_group_paid_and_pending_per_subscription(client_app, demo_data, db_session):
+    subscription = Subscription(
+        account_id=demo_data["account"].id,
+        instrument_id=demo_data["instrument"].id,
+        invested_amount=Decimal("1000"),
+        units=Decimal("1"),
+        subscribed_at=datetime(2023, 1, 1, tzinfo=timezone.utc),
+        effective_maturity_date=date(2028, 1, 1),
+        subscription_yield=Decimal("5.5000"),
+        current_value=Decimal("1000"),
+        accrued_interest=Decimal("0"),
+        status="ACTIVE",
+    )
+    db_session.add(subscription)
+    db_session.flush()
+    db_session.add_all([
+        InterestPayment(subscription_id=subscription.id, payment_date=date(2024, 1, 1), amount=Decimal("55.00"), status="PAYE"),
+        InterestPayment(subscription_id=subscription.id, payment_date=date(2025, 1, 1), amount=Decimal("55.00"), status="PAYE"),
+        InterestPayment(subscription_id=subscription.id, payment_date=date(2026, 1, 1), amount=Decimal("55.00"), status="EN_ATTENTE"),
+    ])
+    db_session.commit()
+
+    totals = coupon_totals(db_session, [subscription.id])[subscription.id]
+
+    assert (totals.paid_count, totals.paid_amount) == (2, Decimal("110.00"))
+    assert (totals.pending_count, totals.pending_amount) == (1, Decimal("55.00"))
+    assert coupon_totals(db_session, []) == {}
+
+
 def test_reversal_creates_compensating_transaction_and_new_posting_version(client_app, demo_data, db_session):
     def login(email):
         response = client_app.post("/api/v1/auth/login", json={"email": email, "password": "Password!123"})
@@ -1,8 +1,17 @@
+from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
 
 from sqlalchemy import text
 
-from app.db.reporting import REPORTING_OBJECTS, reporting_objects_down_sql
+from app.core.config import settings
+from app.db.partitions import partition_name, partition_table
+from app.db.reporting import REPORTING_OBJECTS, REPORTING_SNAPSHOT_OBJECTS, reporting_objects_down_sql, reporting_snapshots_down_sql
+from app.models.models import AccountingEntry, Transaction
+from app.services.history_snapshots import backfill_history_snapshots, month_range, month_start, months_are_closed, next_month, snapshot_cashflow_window
+from app.services.ledger import entry, post_entries, reconcile_ledger
+from app.services.partition_maintenance import maintain_partitions, scanned_partitions
+from app.services.reporting_service import ReportingService, live_cashflow_query
+from app.services.reporting_snapshots import refresh_snapshots, snapshots_are_fresh
 from app.services.subscription_service import SubscriptionService
 
 
@@ -32,6 +41,36 @@ def test_client_report_is_currency_aware_and_exposes_real_business_sections(clie
     assert "fees" in usd
 
 
+def test_sql_client_report_backend_matches_orm_backend(client_app, demo_data, db_session):
+    # Deux positions : les deux backends doivent aussi les rendre dans le meme ordre.
+    for amount in ("500", "500"):
+        SubscriptionService.create(db_session, demo_data["first"].id, demo_data["account"].id, demo_data["instrument"].id, Decimal(amount))
+    session = login(client_app, "first@profin.ht")
+    submitted = client_app.post(
+        "/api/v1/ordres/",
+        headers=headers(session),
+        json={"account_id": demo_data["private_account"].id, "instrument_id": demo_data["instrument"].id, "amount": "500"},
+    )
+    assert submitted.status_code == 201, submitted.text
+
+    orm = ReportingService.client_report(db_session, demo_data["first"].id, backend="orm")
+    sql = ReportingService.client_report(db_session, demo_data["first"].id, backend="sql")
+
+    def by(key, rows):
+        return sorted(rows, key=lambda item: str(item[key]))
+
+    assert orm["kpis"] == sql["kpis"]
+    assert by("currency", orm["summary_by_currency"]) == by("currency", sql["summary_by_currency"])
+    assert by("instrument_type", orm["allocation"]) == by("instrument_type", sql["allocation"])
+    assert orm["positions"] == sql["positions"]
+    assert by("status", orm["order_pipeline"]) == by("status", sql["order_pipeline"])
+    assert orm["cashflow"] == sql["cashflow"]
+    assert orm["alerts"] == sql["alerts"]
+
+    response = client_app.get("/api/v1/dashboard/rapports/client?backend=sql", headers=headers(session))
+    assert response.status_code == 200, response.text
+
+
 def test_backoffice_report_is_scoped_to_mandataire_and_shows_order_queue(client_app, demo_data):
     first = login(client_app, "first@profin.ht")
     submitted = client_app.post(
@@ -70,3 +109,130 @@ def test_postgresql_reporting_views_and_function_are_installable(db_session):
         for statement in reporting_objects_down_sql():
             db_session.execute(text(statement))
         db_session.commit()
+
+
+def test_client_report_reads_fresh_snapshots_like_live_report(client_app, demo_data, db_session, monkeypatch):
+    SubscriptionService.create(db_session, demo_data["first"].id, demo_data["account"].id, demo_data["instrument"].id, Decimal("500"))
+    client_id = demo_data["first"].id
+    live = ReportingService.client_report(db_session, client_id, backend="sql")
+    try:
+        for statement in (*REPORTING_OBJECTS, *REPORTING_SNAPSHOT_OBJECTS):
+            db_session.execute(text(statement))
+        db_session.commit()
+        refresh_snapshots(db_session)
+        assert snapshots_are_fresh(db_session) is False
+        monkeypatch.setattr(settings, "REPORTING_SNAPSHOT_MAX_STALENESS_SECONDS", 300)
+        assert snapshots_are_fresh(db_session) is True
+        snapshot = ReportingService.client_report(db_session, client_id)
+        assert snapshot["positions"] == live["positions"]
+        assert sorted(snapshot["allocation"], key=str) == sorted(live["allocation"], key=str)
+        assert sorted(snapshot["order_pipeline"], key=str) == sorted(live["order_pipeline"], key=str)
+    finally:
+        for statement in (*reporting_snapshots_down_sql(), *reporting_objects_down_sql()):
+            db_session.execute(text(statement))
+        db_session.commit()
+
+
+def test_monthly_history_snapshots_replace_rescans_with_identical_results(client_app, demo_data, db_session):
+    months = month_range(date.today(), 4)
+    when = datetime.combine(months[1].replace(day=10), datetime.min.time(), tzinfo=timezone.utc)
+    db_session.add(Transaction(transaction_type="DEPOT", amount=Decimal("200"), currency="USD", destination_account_id=demo_data["account"].id, status="EXECUTED", created_at=when, executed_at=when, created_by_client_id=demo_data["first"].id))
+    db_session.commit()
+    client_id = demo_data["first"].id
+    live = {backend: ReportingService.client_report(db_session, client_id, backend=backend)["cashflow"] for backend in ("orm", "sql")}
+
+    # Le rapport couvre 31 x 6 jours : sept mois rendent tous ses mois complets instantanes.
+    backfill_history_snapshots(db_session, 7)
+
+    assert months_are_closed(db_session, month_range(date.today(), 7)[0], months[-1])
+    for backend in ("orm", "sql"):
+        assert ReportingService.client_report(db_session, client_id, backend=backend)["cashflow"] == live[backend]
+    assert any(row["month"] == months[1] and row["deposits"] == Decimal("200.00") for row in live["sql"])
+    response = client_app.get("/api/v1/dashboard/statistiques/mensuelles?mois=4", headers=headers(login(client_app, "first@profin.ht")))
+    assert response.status_code == 200, response.text
+    periods = response.json()["periodes"]
+    assert [item["periode"] for item in periods] == [month.isoformat() for month in months]
+    assert float(periods[1]["solde_comptes"]) - float(periods[0]["solde_comptes"]) == 200.0
+
+    # Validee apres la cloture de son mois de creation : comptee au mois d'execution.
+    db_session.add(Transaction(transaction_type="DEPOT", amount=Decimal("70"), currency="USD", destination_account_id=demo_data["account"].id, status="EXECUTED", created_at=when, executed_at=datetime.now(timezone.utc), created_by_client_id=demo_data["first"].id))
+    db_session.commit()
+    for backend in ("orm", "sql"):
+        cashflow = ReportingService.client_report(db_session, client_id, backend=backend)["cashflow"]
+        assert [row["deposits"] for row in cashflow if row["month"] == months[-1]] == [Decimal("70.00")]
+
+
+def test_partitioned_transactions_prune_report_range_and_rotate_partitions(client_app, demo_data, db_session):
+    months = month_range(date.today(), 15)
+    old = datetime.combine(months[0].replace(day=5), datetime.min.time(), tzinfo=timezone.utc)
+    old_deposit = Transaction(transaction_type="DEPOT", amount=Decimal("50"), currency="USD", destination_account_id=demo_data["account"].id, status="EXECUTED", created_at=old, executed_at=old, created_by_client_id=demo_data["first"].id)
+    db_session.add(old_deposit)
+    db_session.flush()
+    post_entries(db_session, [
+        entry(old_deposit.id, "BANK_SETTLEMENT", "DEBIT", Decimal("50"), "USD", created_at=old),
+        entry(old_deposit.id, f"CLIENT_{demo_data['account'].id}", "CREDIT", Decimal("50"), "USD", created_at=old),
+    ])
+    db_session.commit()
+    client_id = demo_data["first"].id
+    before = ReportingService.client_report(db_session, client_id, backend="sql")["cashflow"]
+    try:
+        partition_table(db_session, "transactions", 1)
+        db_session.commit()
+        # Requete de flux envoyee par le rapport : seules les partitions depuis ``since`` sont lues.
+        since = datetime.now(timezone.utc) - timedelta(days=31 * 6)
+        query = live_cashflow_query([demo_data["account"].id], since, snapshot_cashflow_window(db_session, since))
+        scanned = scanned_partitions(db_session, query) - {"transactions_default"}
+        recent = {partition_name("transactions", month) for month in months if month >= month_start(since)}
+        assert partition_name("transactions", months[-1]) in scanned
+        assert scanned <= recent | {partition_name("transactions", next_month(months[-1]))}
+        assert ReportingService.client_report(db_session, client_id, backend="sql")["cashflow"] == before
+
+        # Une ligne arrivee dans DEFAULT avant la creation de son mois y est deplacee.
+        ahead = next_month(next_month(months[-1]))
+        early = datetime.combine(ahead.replace(day=2), datetime.min.time(), tzinfo=timezone.utc)
+        db_session.add(Transaction(transaction_type="DEPOT", amount=Decimal("5"), currency="USD", destination_account_id=demo_data["account"].id, status="PENDING_APPROVAL", created_at=early, created_by_client_id=demo_data["first"].id))
+        partition_table(db_session, "accounting_entries", 1)
+        db_session.commit()
+        assert db_session.scalar(text("SELECT count(*) FROM transactions_default")) == 1
+
+        maintained = maintain_partitions(db_session, months_ahead=2, retention_months=12)
+        report = maintained["transactions"]
+        assert report["created"] == [partition_name("transactions", ahead)]
+        assert report["detached"] == [partition_name("transactions", month) for month in months[:2]]
+        assert db_session.scalar(text("SELECT count(*) FROM transactions_default")) == 0
+        assert db_session.scalar(text(f"SELECT count(*) FROM {partition_name('transactions', ahead)}")) == 1
+        # Les ecritures detachees restent dans la reconciliation par leurs cumuls archives.
+        assert maintained["accounting_entries"]["detached"] == [partition_name("accounting_entries", month) for month in months[:2]]
+        assert not db_session.query(AccountingEntry).filter(AccountingEntry.transaction_id == old_deposit.id).count()
+        items = reconcile_ledger(db_session)["items"]
+        assert not [item for item in items if item["kind"].startswith("PROJECTION_")]
+    finally:
+        db_session.rollback()
+        for table in ("transactions", "accounting_entries"):
+            for month in months[:2]:
+                db_session.execute(text(f"DROP TABLE IF EXISTS {partition_name(table, month)}"))
+        db_session.commit()
+
+
+def test_order_pipeline_view_resolves_next_step_without_per_row_function(client_app, demo_data, db_session):
+    session = login(client_app, "first@profin.ht")
+    submitted = client_app.post(
+        "/api/v1/ordres/",
+        headers=headers(session),
+        json={"account_id": demo_data["private_account"].id, "instrument_id": demo_data["instrument"].id, "amount": "500"},
+    )
+    assert submitted.status_code == 201, submitted.text
+    try:
+        for statement in REPORTING_OBJECTS:
+            db_session.execute(text(statement))
+        db_session.commit()
+        plan = "\n".join(db_session.scalars(text("EXPLAIN (VERBOSE, COSTS OFF) SELECT * FROM vw_reporting_order_pipeline")))
+        assert "profin_order_next_step" not in plan
+        assert "SubPlan" not in plan
+        order_id = submitted.json()["order"]["id"]
+        next_step = db_session.scalar(text("SELECT next_step FROM vw_reporting_order_pipeline WHERE order_id = :order_id"), {"order_id": order_id})
+        assert next_step == db_session.scalar(text("SELECT profin_order_next_step(:order_id)"), {"order_id": order_id}) == "CONFORMITE"
+    finally:
+        for statement in reporting_objects_down_sql():
+            db_session.execute(text(statement))
+        db_session.commit()